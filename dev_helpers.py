@@ -1,5 +1,4 @@
 import random
-import simplejson
 from django.utils.timezone import utc
 from datetime import timedelta, datetime
 from rfid_lock_management.models import RFIDkeycard, AccessTime
@@ -35,7 +34,6 @@ def make_access_times(min_num_times=10, max_num_times=10):
                             the_rfid=keycard.the_rfid,
                             access_time=the_date_time,
                             lockuser=lockuser, door=door)
-                        assign_data_point_dict(at)
                         at.save()
                         counter += 1
                         j += 1
@@ -50,7 +48,6 @@ def make_access_times(min_num_times=10, max_num_times=10):
                             the_rfid=keycard.the_rfid,
                             access_time=the_date_time,
                             lockuser=lockuser, door=door)
-                        assign_data_point_dict(at)
                         at.save()
                         counter += 1
                         j += 1
@@ -65,7 +62,6 @@ def make_access_times(min_num_times=10, max_num_times=10):
                             the_rfid=keycard.the_rfid,
                             access_time=the_date_time,
                             lockuser=lockuser, door=door)
-                        assign_data_point_dict(at)
                         at.save()
                         counter += 1
                         j += 1
@@ -76,7 +72,6 @@ def make_access_times(min_num_times=10, max_num_times=10):
                 at = AccessTime(
                     the_rfid=keycard.the_rfid, access_time=the_date_time,
                     lockuser=lockuser, door=door)
-                assign_data_point_dict(at)
                 at.save()
                 counter += 1
     return "created %d access times" % counter
@@ -92,30 +87,3 @@ def get_random_time():
     time_period_seconds = time_period.total_seconds()
     random_second = random.randrange(time_period_seconds)
     return (start + timedelta(seconds=random_second))
-
-
-def assign_data_point_dict(at):
-    # data point dict to JSONify for the access times highchart
-    data_point_dict = {}
-    data_point = {}
-    # subtract 1 from the month because months start at 0 in JavaScript, not 1
-    data_point_dict['x'] = 'Date.UTC(%d,%d,%d)' % (
-        at.access_time.year, at.access_time.month - 1, at.access_time.day)
-    # new way to format string is .format
-    data_point_dict['x'] = 'Date.UTC({},{},{})'.format(
-        at.access_time.year,
-        at.access_time.month - 1,
-        at.access_time.day
-    )
-    # or. havent checked it, but works somehow like it
-    data_point_dict['x'] = 'Date.UTC({year},{month},{day})'.format(
-        year=at.access_time.year,
-        month=at.access_time.month - 1,
-        day=at.access_time.day
-    )
-
-    data_point_dict['y'] = 'Date.UTC(0,0,0, %d,%d,%d)' % (
-        at.access_time.hour, at.access_time.minute, at.access_time.second)
-    data_point_dict['user'] = '"%s %s"' % (
-        at.lockuser.first_name, at.lockuser.last_name)
-    at.data_point = simplejson.dumps(data_point_dict)
@@ -0,0 +1,26 @@
+# gunicorn settings for serving the locks, e.g.
+#
+#     $ gunicorn -c gunicorn.conf.py proj_rfid_lock_management.lock_wsgi:application
+#
+# The gevent worker class serves each request in a greenlet, so the locks
+# waiting on door/<id>/wait_changes/ (up to ALLOWLIST_WAIT_TIMEOUT seconds
+# each) are cheap to hold open: hundreds of them take a few greenlets' worth
+# of memory instead of a worker process each.
+#
+# One worker: the authorization index, the scan state registry and the cache
+# of the doors staff users may manage (see rfid_lock_management) notice
+# changes through the Django cache, and the default cache (local memory) is
+# per process, so a second worker wouldn't see the first one's changes --
+# and could let a revoked keycard in for up to RFID_AUTH_INDEX_MAX_AGE. Once
+# CACHES in settings.py points at a shared backend (e.g. memcached), set
+# GUNICORN_WORKERS (say, to the number of CPUs + 1) for more.
+import os
+
+bind = '0.0.0.0:8000'
+worker_class = 'gevent'
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+# open connections (waiting locks included) per worker
+worker_connections = 1000
+# longer than ALLOWLIST_WAIT_TIMEOUT, so waiting requests aren't killed
+timeout = 90
+graceful_timeout = 30
@@ -0,0 +1,14 @@
+"""
+WSGI config like wsgi.py, but with the locks' checkdoor and getallowed
+requests answered by rfid_lock_management.lock_gateway, bypassing Django's
+middleware; everything else goes to the Django application as usual.
+
+    $ gunicorn -c gunicorn.conf.py proj_rfid_lock_management.lock_wsgi:application
+"""
+import os
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "proj_rfid_lock_management.settings")
+
+from django.core.wsgi import get_wsgi_application
+from rfid_lock_management.lock_gateway import LockGateway
+application = LockGateway(get_wsgi_application())
@@ -185,3 +185,71 @@ INTERNAL_IPS = ('127.0.0.1', )
 DEBUG_TOOLBAR_CONFIG = {
     'INTERCEPT_REDIRECTS': False,
 }
+
+# The in-process authorization index used when checking a keycard at a door is
+# rebuilt whenever the allowed doors or keycards change (see
+# rfid_lock_management/access_index.py), and at least this often (in seconds).
+# With more than one worker process, point CACHES at a shared backend so the
+# workers notice each other's changes, e.g. (with python-memcached installed)
+#
+#     CACHES = {
+#         'default': {
+#             'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+#             'LOCATION': '127.0.0.1:11211',
+#         }
+#     }
+#
+# Until then gunicorn.conf.py runs a single worker.
+RFID_AUTH_INDEX_MAX_AGE = 60
+# Set to False to check each swipe with one database query instead.
+RFID_AUTH_INDEX = True
+
+# Whether a new keycard scan is pending is kept in the cache (see
+# rfid_lock_management/scan_state.py) and looked up in the database again at
+# least this often (in seconds). With more than one worker process, point
+# CACHES at a shared backend.
+NEW_KEYCARD_SCAN_STATE_MAX_AGE = 5
+
+# How the AccessTime for a granted swipe is recorded: 'sync' saves it before
+# the lock gets its response; 'buffered' spools it to a local file and writes
+# queued AccessTimes in bulk once there are ACCESS_TIME_BUFFER_SIZE of them or
+# the oldest is ACCESS_TIME_BUFFER_SECONDS old (see
+# rfid_lock_management/access_log.py).
+ACCESS_TIME_LOGGING = 'sync'
+ACCESS_TIME_BUFFER_SIZE = 50
+ACCESS_TIME_BUFFER_SECONDS = 5
+ACCESS_TIME_SPOOL_DIR = os.path.join(ONE_UP_SETTINGS_ROOT, 'access_time_spool')
+
+# Default false-positive rate of the Bloom filters of door allowlists (see
+# rfid_lock_management/bloom.py); a lock can ask for another with ?fp= (rounded
+# to one significant digit).
+RFID_BLOOM_FP_RATE = 0.01
+
+# Locks waiting for changes to their allowlist (door/<id>/wait_changes/) are
+# answered after at most ALLOWLIST_WAIT_TIMEOUT seconds. While they wait, the
+# cache is polled every ALLOWLIST_WAIT_POLL_SECONDS and the database every
+# ALLOWLIST_WAIT_RECHECK_SECONDS (see wait_for_change in
+# rfid_lock_management/allowlists.py). Serve these with gunicorn's gevent
+# workers (gunicorn.conf.py) so that each waiting lock costs a greenlet rather
+# than a worker.
+ALLOWLIST_WAIT_TIMEOUT = 50
+ALLOWLIST_WAIT_POLL_SECONDS = 0.5
+ALLOWLIST_WAIT_RECHECK_SECONDS = 10
+
+# Likewise, the lock user change form waiting for the new keycard to be
+# swiped (wait_scan/<id>/) is answered after at most
+# NEW_KEYCARD_SCAN_WAIT_TIMEOUT seconds, polling the cache every
+# NEW_KEYCARD_SCAN_WAIT_POLL_SECONDS and the database every
+# NEW_KEYCARD_SCAN_WAIT_RECHECK_SECONDS (see wait_for_rfid in
+# rfid_lock_management/scan_state.py).
+NEW_KEYCARD_SCAN_WAIT_TIMEOUT = 50
+NEW_KEYCARD_SCAN_WAIT_POLL_SECONDS = 0.5
+NEW_KEYCARD_SCAN_WAIT_RECHECK_SECONDS = 10
+
+# The access times chart (chart/) shows this many days to begin with.
+CHART_DEFAULT_DAYS = 180
+
+# Create the test database with syncdb rather than by running the South
+# migrations, so that content types (and the permission fixtures that refer to
+# them) get the same ids as they always have.
+SOUTH_TESTS_MIGRATE = False
@@ -30,19 +30,41 @@ urlpatterns = patterns('',
        views.initiate_new_keycard_scan),
    url(r'done_scan/(?P<new_scan_pk>\d+)/$',
        views.finished_new_keycard_scan),
+   # same, but waiting for the keycard to be swiped (long poll)
+   url(r'wait_scan/(?P<new_scan_pk>\d+)/$',
+       views.wait_new_keycard_scan),
 
    # Highchart of visitors
+   url(r'^chart/data/$', views.chart_data),
+   url(r'^chart/heatmap/$', views.chart_heatmap),
    url(r'^chart/', views.chartify),
 
    # keycard authentication
    url(r'checkdoor/(?P<doorid>\d+)/checkrfid/(?P<rfid>\w{10})/$',
        views.check),
 
+   # keycard authentication for many swipes at once (gateways)
+   url(r'^checkbatch/$', views.check_batch),
+
    # Arduino requesting list of all allowed RFIDs for
    # specified door
    url(r'door/(?P<doorid>\d+)/getallowed/$',
        views.get_allowed_rfids),
 
+   # Arduino requesting the RFIDs added to and revoked from the list of
+   # allowed RFIDs for specified door since the version it has
+   url(r'door/(?P<doorid>\d+)/allowed_changes/$',
+       views.get_allowed_rfid_changes),
+
+   # Same, but waiting until there are changes (long poll)
+   url(r'door/(?P<doorid>\d+)/wait_changes/$',
+       views.wait_allowed_rfid_changes),
+
+   # Arduino requesting a Bloom filter of the allowed RFIDs for
+   # specified door
+   url(r'door/(?P<doorid>\d+)/getbloom/$',
+       views.get_allowed_bloom),
+
    # Uncomment the admin/doc line below to enable admin documentation:
    # url(r'^admin/doc/',
    # include('django.contrib.admindocs.urls')),
@@ -0,0 +1,186 @@
+"""
+In-process authorization index used by views.check, so that deciding whether
+an RFID may open a door is a dictionary lookup rather than several queries.
+
+Each worker process keeps its own copy of the index. Signal handlers in
+models.py call invalidate() whenever a LockUser's doors, an RFIDkeycard or a
+Door changes; that bumps a generation number kept in the Django cache, and
+every worker rebuilds its copy (one query) on its next lookup. With more than
+one worker process, CACHES must point at a shared backend (e.g. memcached) for
+the other workers to notice; RFID_AUTH_INDEX_MAX_AGE additionally bounds how
+stale any copy can get.
+
+A change saved inside a transaction (as the admin saves everything) isn't
+there for other workers to see until it is committed, and a copy one of them
+rebuilt in between would otherwise be current until the next change or for
+RFID_AUTH_INDEX_MAX_AGE -- with a revoked keycard still in it. So the
+signal handlers call invalidate_on_commit(), which invalidates again at the
+end of the request (invalidate_pending(), on request_finished), after the
+commit; clear_pending(), on request_started, starts each request afresh.
+Code saving inside a transaction outside of a request should call
+invalidate() itself once it has committed (as door_import.import_doors does).
+"""
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+GENERATION_CACHE_KEY = 'rfid_lock_management:auth_index_generation'
+
+# What the index knows about an active RFID
+IndexEntry = namedtuple('IndexEntry', ['lockuser_id', 'lockuser_name', 'door_ids'])
+
+
+class AuthorizationIndex(object):
+    """
+    Maps each active (not revoked) RFID to the LockUser it belongs to and the
+    set of Door ids that LockUser is allowed to access.
+    """
+
+    def __init__(self):
+        self._entries = None
+        self._generation = None
+        self._built_at = 0
+        self._lock = threading.Lock()
+        # per thread (or greenlet): whether to invalidate() again once the
+        # request's transaction is committed
+        self._pending = threading.local()
+
+    def lookup(self, rfid):
+        """
+        Return the IndexEntry for this RFID, or None if it is not the RFID of
+        an active keycard.
+        """
+        return self._get_entries().get(rfid)
+
+    def is_allowed(self, rfid, doorid):
+        """
+        Return the IndexEntry for this RFID if it may open the specified door,
+        otherwise None.
+        """
+        entry = self.lookup(rfid)
+        if entry and int(doorid) in entry.door_ids:
+            return entry
+        return None
+
+    def query(self, rfid, doorid):
+        """
+        Same answer as is_allowed(), but straight from the database (one
+        query, however many times the RFID has been reused), for when
+        RFID_AUTH_INDEX is turned off.
+        """
+        from rfid_lock_management.models import RFIDkeycard
+
+        rows = RFIDkeycard.objects.filter(
+            the_rfid=rfid, date_revoked__isnull=True,
+            lockuser__doors__pk=int(doorid)).values_list(
+                'lockuser_id', 'lockuser__first_name', 'lockuser__last_name')[:1]
+        for lockuser_id, first_name, last_name in rows:
+            return IndexEntry(lockuser_id, u'%s %s' % (first_name, last_name),
+                              frozenset([int(doorid)]))
+        return None
+
+    def invalidate(self):
+        """
+        Mark every worker's copy of the index as stale.
+        """
+        try:
+            cache.incr(GENERATION_CACHE_KEY)
+        except ValueError:
+            # key not in the cache (yet, or anymore)
+            cache.set(GENERATION_CACHE_KEY, _new_generation())
+        self._entries = None
+
+    def invalidate_on_commit(self):
+        """
+        invalidate() now and, if inside a transaction, again when
+        invalidate_pending() is called once it has been committed.
+        """
+        self.invalidate()
+        if transaction.is_managed():
+            self._pending.invalidate = True
+
+    def invalidate_pending(self):
+        """
+        invalidate() if invalidate_on_commit() was called in a transaction
+        since; called when a request has finished (and so its transaction
+        been committed or rolled back).
+        """
+        if self._pending.__dict__.pop('invalidate', False):
+            self.invalidate()
+
+    def clear_pending(self):
+        """
+        Forget any invalidate_on_commit() from before this request (from
+        code run outside of one, which invalidates itself).
+        """
+        self._pending.__dict__.pop('invalidate', None)
+
+    def rebuild(self):
+        """
+        Reload the whole index with a single query across RFIDkeycard,
+        LockUser and the LockUser/Door M2M table.
+        """
+        # imported here since models.py imports this module
+        from rfid_lock_management.models import RFIDkeycard
+
+        generation = self.current_generation()
+        rows = RFIDkeycard.objects.filter(date_revoked__isnull=True).values_list(
+            'the_rfid', 'lockuser_id', 'lockuser__first_name',
+            'lockuser__last_name', 'lockuser__doors')
+        door_ids = {}
+        lockusers = {}
+        for rfid, lockuser_id, first_name, last_name, door_id in rows:
+            lockusers.setdefault(rfid, (lockuser_id, u'%s %s' % (first_name, last_name)))
+            rfid_door_ids = door_ids.setdefault(rfid, set())
+            # LEFT OUTER JOIN - door_id is None if the lockuser has no doors
+            if door_id is not None:
+                rfid_door_ids.add(door_id)
+        entries = {}
+        for rfid, (lockuser_id, lockuser_name) in lockusers.items():
+            entries[rfid] = IndexEntry(lockuser_id, lockuser_name,
+                                       frozenset(door_ids[rfid]))
+        self._entries = entries
+        self._generation = generation
+        self._built_at = time.time()
+        return entries
+
+    def _get_entries(self):
+        entries = self._entries
+        if (entries is None or self._generation != self.current_generation()
+                or time.time() - self._built_at > _max_age()):
+            with self._lock:
+                entries = self.rebuild()
+        return entries
+
+    def current_generation(self):
+        """
+        The generation number invalidate() bumps; it changes whenever a
+        LockUser, RFIDkeycard or Door does.
+        """
+        generation = cache.get(GENERATION_CACHE_KEY)
+        if generation is None:
+            cache.add(GENERATION_CACHE_KEY, _new_generation())
+            generation = cache.get(GENERATION_CACHE_KEY)
+        return generation
+
+
+def _new_generation():
+    # Start from a value no worker could have seen before, in case the cache
+    # was flushed or the key evicted.
+    return int(time.time() * 1000)
+
+
+def is_enabled():
+    return getattr(settings, 'RFID_AUTH_INDEX', True)
+
+
+def _max_age():
+    return getattr(settings, 'RFID_AUTH_INDEX_MAX_AGE', 60)
+
+
+# The index for this worker process
+authorization_index = AuthorizationIndex()
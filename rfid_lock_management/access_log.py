@@ -0,0 +1,240 @@
+"""
+Recording the AccessTime for a granted swipe.
+
+With ACCESS_TIME_LOGGING = 'sync' (the default) the AccessTime is saved before
+the lock gets its response, as it always was. With 'buffered', the AccessTime
+is appended to a local spool file and queued in memory instead, and the queue
+is written with a single bulk_create once it holds ACCESS_TIME_BUFFER_SIZE
+entries or its oldest entry is ACCESS_TIME_BUFFER_SECONDS old -- so the
+database write (and, on SQLite, its fsync) is no longer part of the time it
+takes a door to open.
+
+Each worker process spools to its own file in ACCESS_TIME_SPOOL_DIR. The spool
+is written and flushed (not fsync'ed) on every swipe, so it survives a crashed
+worker; spools left behind by dead workers, or by a flush that failed, are
+inserted on the next flush of any worker, or by running
+"manage.py flush_access_times".
+"""
+import atexit
+import datetime
+import errno
+import glob
+import os
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.utils import simplejson
+from rfid_lock_management.models import AccessTime, LockUser
+
+SPOOL_FILE_NAME = 'accesstimes-%d-%d.spool'   # pid, sequence number
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def log_access_time(at):
+    """
+    Save the given (unsaved) AccessTime, or queue it, depending on
+    ACCESS_TIME_LOGGING.
+    """
+    if getattr(settings, 'ACCESS_TIME_LOGGING', 'sync') == 'buffered':
+        access_time_buffer.add(at)
+    else:
+        at.save()
+
+
+class AccessTimeBuffer(object):
+    """
+    Write-behind queue of AccessTimes, backed by a spool file.
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._spool = None
+        self._spool_path = None
+        self._seq = 0
+        self._timer = None
+        self._flushing = False
+        self._registered_atexit = False
+        self._lock = threading.RLock()
+
+    def add(self, at):
+        """
+        Spool and queue an AccessTime; start a flush in the background if
+        the queue is full, or schedule one if this is the first entry.
+        """
+        line = simplejson.dumps(to_record(at)) + '\n'
+        with self._lock:
+            if self._spool is None:
+                self._open_spool()
+            self._spool.write(line)
+            self._spool.flush()
+            self._pending.append(at)
+            self._schedule_flush()
+
+    def flush(self):
+        """
+        Write all queued AccessTimes with one bulk_create, then insert any
+        spools left behind. Returns the number of AccessTimes written.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+            spool_path = self._spool_path
+            if self._spool is not None:
+                self._spool.close()
+            self._spool = self._spool_path = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        written = 0
+        if pending:
+            # If this fails, the spool file stays where it is and is picked up
+            # by recover_spools() on a later flush.
+            AccessTime.objects.bulk_create(pending)
+            # (bulk_create doesn't send post_save)
+            LockUser.objects.record_accesses(pending)
+            os.remove(spool_path)
+            written = len(pending)
+        return written + recover_spools(exclude=self.active_spool_path())
+
+    def active_spool_path(self):
+        return self._spool_path
+
+    def next_spool_path(self):
+        with self._lock:
+            self._seq += 1
+            return os.path.join(_spool_dir(),
+                                SPOOL_FILE_NAME % (os.getpid(), self._seq))
+
+    def _open_spool(self):
+        if not os.path.isdir(_spool_dir()):
+            os.makedirs(_spool_dir())
+        if not self._registered_atexit:
+            atexit.register(self.flush)
+            self._registered_atexit = True
+        self._spool_path = self.next_spool_path()
+        self._spool = open(self._spool_path, 'a')
+
+    def _schedule_flush(self):
+        """
+        Start a flush in the background if the queue is full, otherwise
+        make sure one is scheduled. (Called with the lock held.)
+        """
+        if len(self._pending) >= _buffer_size():
+            self._flush_in_background()
+        elif self._timer is None:
+            self._timer = threading.Timer(_buffer_seconds(), self._timer_fired)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _timer_fired(self):
+        with self._lock:
+            self._timer = None
+        self._flush_in_background()
+
+    def _flush_in_background(self):
+        with self._lock:
+            if self._flushing:
+                # _flush_finished() will see to what is queued meanwhile
+                return
+            self._flushing = True
+        thread = threading.Thread(target=self._flush_and_close_connection)
+        thread.daemon = True
+        thread.start()
+
+    def _flush_and_close_connection(self):
+        try:
+            self.flush()
+        finally:
+            self._flush_finished()
+            # this thread's own database connection
+            connection.close()
+
+    def _flush_finished(self):
+        """
+        A background flush is done: flush (or schedule a flush of) whatever
+        was queued while it ran, which no new swipe may come along to do.
+        """
+        with self._lock:
+            self._flushing = False
+            if self._pending:
+                self._schedule_flush()
+
+
+def recover_spools(exclude=None):
+    """
+    Insert the AccessTimes from spool files that no live worker is writing
+    to, and delete those files. Returns the number of AccessTimes inserted.
+    """
+    recovered = 0
+    pattern = os.path.join(_spool_dir(), SPOOL_FILE_NAME.replace('%d', '*'))
+    for path in sorted(glob.glob(pattern)):
+        if path == exclude:
+            continue
+        pid = int(os.path.basename(path).split('-')[1])
+        if pid != os.getpid() and _is_running(pid):
+            continue
+        # Claim the file by renaming it, so no other worker inserts it too.
+        claimed_path = access_time_buffer.next_spool_path()
+        try:
+            os.rename(path, claimed_path)
+        except OSError:
+            continue
+        access_times = []
+        with open(claimed_path) as spool:
+            for line in spool:
+                try:
+                    access_times.append(from_record(simplejson.loads(line)))
+                except ValueError:
+                    # incomplete last line, from a worker that died mid-write
+                    pass
+        AccessTime.objects.bulk_create(access_times)
+        LockUser.objects.record_accesses(access_times)
+        os.remove(claimed_path)
+        recovered += len(access_times)
+    return recovered
+
+
+def to_record(at):
+    """
+    AccessTime as a dict that can be written to the spool
+    """
+    return {'the_rfid': at.the_rfid,
+            'access_time': at.access_time.strftime(TIME_FORMAT),
+            'lockuser_id': at.lockuser_id,
+            'door_id': at.door_id}
+
+
+def from_record(record):
+    """
+    AccessTime (unsaved) from a dict read from the spool
+    """
+    record['access_time'] = datetime.datetime.strptime(
+        record['access_time'], TIME_FORMAT)
+    # (spooled before AccessTime.data_point was dropped)
+    record.pop('data_point', None)
+    return AccessTime(**dict((str(key), value)
+                             for key, value in record.items()))
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def _buffer_size():
+    return getattr(settings, 'ACCESS_TIME_BUFFER_SIZE', 50)
+
+
+def _buffer_seconds():
+    return getattr(settings, 'ACCESS_TIME_BUFFER_SECONDS', 5)
+
+
+def _spool_dir():
+    return getattr(settings, 'ACCESS_TIME_SPOOL_DIR', 'access_time_spool')
+
+
+# The buffer for this worker process
+access_time_buffer = AccessTimeBuffer()
@@ -1,7 +1,9 @@
 from django.contrib import admin
 from django.forms import CheckboxSelectMultiple, ModelForm
 from django.db import models
-from rfid_lock_management.models import LockUser, AccessTime, RFIDkeycard, Door
+from rfid_lock_management import door_permissions, request_memo
+from rfid_lock_management.models import (LockUser, AccessTime, RFIDkeycard,
+                                          Door, DoorACLEntry)
 from termcolor import colored
 from django import forms
 from django.contrib import messages
@@ -141,6 +143,18 @@ class LockUserAdmin(admin.ModelAdmin):
     )
     list_filter = ('doors', )
 
+    def queryset(self, request):
+        """
+        Fetch what the change list's columns show with the LockUsers, so that
+        the page takes the same number of queries however many rows it has:
+        the current keycard (and its assigner) and the last access door by
+        join, from the columns LockUser stores them in, and the allowed doors
+        in one more query for the whole page.
+        """
+        return super(LockUserAdmin, self).queryset(request).select_related(
+            'current_keycard__assigner', 'last_access_door').prefetch_related(
+            'doors')
+
     def get_form(self, request, obj=None, **kwargs):
         ModelForm = super(LockUserAdmin, self).get_form(request, obj, **kwargs)
 
@@ -188,49 +202,46 @@ class LockUserAdmin(admin.ModelAdmin):
     _current_rfid_heading.short_description = 'Current RFID'
 
     def get_doors_to_show(self, request):
+        """
+        Doors the staff User may administer (the same QuerySet, evaluated
+        once, for the whole request; see request_memo.py).
+        """
+        return request_memo.memoize(
+            request, ('doors_to_show', request.user.pk),
+            lambda: self._get_doors_to_show(request))
+
+    def _get_doors_to_show(self, request):
         # superuser will always see all doors (doors_to_show)
         #(exclude from coverage report - superuser distinction is a
         # development-only feature)
         if request.user.is_superuser:  # pragma: no cover
             return Door.objects.all()
-        # otherwise filter on permissions
-        doors_to_show = Door.objects.none()  # creates an EmptyQuerySet
-        for door in Door.objects.all():
-            # put in proper format for has_perm
-            perm = "rfid_lock_management.can_manage_door_%d" % door.pk
-            if request.user.has_perm(perm):
-                # concatenating QuerySets
-                doors_to_show = doors_to_show | Door.objects.filter(pk=door.pk)
-        return doors_to_show
+        # otherwise filter on permissions (cached, see door_permissions.py)
+        return Door.objects.filter(
+            pk__in=door_permissions.manageable_door_ids(request.user))
 
     # Issue h
     def get_other_doors(self, request, object_id):
         """
-        Doors that the staff User is not allowed to administer. In change_form
-        template, will get a set of these Door objects from context, then check
-        the lockuser_set of each to see if the current lockuser has access to
-        it.
+        Doors that the staff User is not allowed to administer, of those the
+        lockuser has access to. The change_form template lists them (from
+        context) under the doors field. (Worked out once per request; see
+        request_memo.py.)
         """
+        return request_memo.memoize(
+            request, ('other_doors', request.user.pk, int(object_id)),
+            lambda: self._get_other_doors(request, object_id))
+
+    def _get_other_doors(self, request, object_id):
         #(exclude from coverage report - superuser distinction is a
         # development-only feature)
         if request.user.is_superuser:  # pragma: no cover
             # superuser will always see all doors (doors_to_show)
             return None
-        # otherwise filter on permissions
-        # creates an EmptyQuerySet
-        doors_not_permitted_to_this_staff_user = Door.objects.none()
-        for door in Door.objects.all():
-            # put in proper format for has_perm
-            perm = "rfid_lock_management.can_manage_door_%d" % door.pk
-            if not request.user.has_perm(perm):
-                doors_not_permitted_to_this_staff_user = doors_not_permitted_to_this_staff_user | \
-                    Door.objects.filter(pk=door.pk)  # concatenating QuerySets
-        # all elem that are in this set but not the other. i.e. all doors
-        this_lu = LockUser.objects.get(pk=object_id)
-        ok_for_user_set = set(this_lu.get_allowed_doors())
-        not_for_staff_set = set(doors_not_permitted_to_this_staff_user)
-        doors_not_ok_for_staff = not_for_staff_set.intersection(ok_for_user_set)
-        return doors_not_ok_for_staff
+        # otherwise filter on permissions: the doors this lockuser is allowed
+        # that the staff user may not manage
+        return set(Door.objects.filter(lockuser=object_id).exclude(
+            pk__in=door_permissions.manageable_door_ids(request.user)))
 
     def formfield_for_manytomany(self, db_field, request, **kwargs):
         """
@@ -254,10 +265,14 @@ class LockUserAdmin(admin.ModelAdmin):
         all Doors have been unchecked.  In change_form template, will get a set
         of these Door objects from context, then check the lockuser_set of each
         to see if the current lockuser has access to it.
+
+        Also, the Doors a new keycard can be scanned at: those the staff user
+        can manage.
         """
         extra_context = {
             "doors_not_permitted_to_this_staff_user":
-            self.get_other_doors(request, object_id)}
+            self.get_other_doors(request, object_id),
+            "scan_doors": self.get_doors_to_show(request)}
         return super(LockUserAdmin, self).change_view(
             request, object_id, form_url, extra_context=extra_context)
 
@@ -348,9 +363,21 @@ class AccessTimeAdmin(admin.ModelAdmin):
     lockuser_html_heading.short_description = 'User'
     lockuser_html_heading.allow_tags = True
 
+
+class DoorACLEntryAdmin(admin.ModelAdmin):
+    """
+    Which staff users (and groups) may manage which doors. (Staff users
+    don't have the permissions to change these, only superusers.)
+    """
+    list_display = ('door', 'user', 'group')
+    list_filter = ('door', 'group')
+    list_select_related = True
+
+
 # Register models
 admin.site.register(LockUser, LockUserAdmin)
 admin.site.register(AccessTime, AccessTimeAdmin)
+admin.site.register(DoorACLEntry, DoorACLEntryAdmin)
 
 # Globally disable deletion of selected objects (i.e this will not be an
 # available action in the Actions dropdown of all ModelAdmins/change_list
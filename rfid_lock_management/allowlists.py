@@ -0,0 +1,204 @@
+"""
+Door allowlists (the RFIDs allowed through a door) as served to the lock
+controllers, rendered once per door and allowlist_version and then served from
+the cache.
+"""
+import logging
+import struct
+import time
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from rfid_lock_management.models import AllowlistChange, Door, RFIDkeycard
+
+CACHE_KEY = 'rfid_lock_management:allowlist:%s:%s:%s'  # format, door, version
+CACHE_SECONDS = 24 * 60 * 60
+VERSION_HINT_CACHE_KEY = 'rfid_lock_management:allowlist_version:%s'  # door
+VERSION_HINT_SECONDS = 5 * 60
+
+logger = logging.getLogger(__name__)
+
+
+def get_allowlist_version(doorid):
+    """
+    Current allowlist_version of the Door, or None if there is no such Door.
+    """
+    versions = Door.objects.filter(pk=doorid).values_list(
+        'allowlist_version', flat=True)
+    if versions:
+        return versions[0]
+    return None
+
+
+def notify_versions(versions):
+    """
+    Let wait_for_change() calls, in any worker sharing the cache, know about
+    new allowlist_versions, given as {door_id: version}.
+    """
+    cache.set_many(dict((VERSION_HINT_CACHE_KEY % door_id, version)
+                        for door_id, version in versions.items()),
+                   VERSION_HINT_SECONDS)
+
+
+def wait_for_change(doorid, version, timeout):
+    """
+    Wait until the allowlist_version of the Door is no longer version, or
+    until timeout seconds have passed, and return the allowlist_version then.
+
+    While waiting, only the cache is polled (every ALLOWLIST_WAIT_POLL_SECONDS)
+    for the version notify_versions() was given; the database is checked when
+    that is newer than version, and otherwise every
+    ALLOWLIST_WAIT_RECHECK_SECONDS in case a notification was missed (e.g. by
+    a worker that doesn't share the cache). The database connection is let go
+    of in between, so idle waiters don't each hold one.
+    """
+    deadline = time.time() + timeout
+    hint_key = VERSION_HINT_CACHE_KEY % int(doorid)
+    next_check = 0
+    while True:
+        now = time.time()
+        hint = cache.get(hint_key)
+        if (hint is not None and hint > version) or now >= next_check:
+            # A newer hint may be from a transaction that hasn't committed
+            # yet, in which case the database is checked again next poll.
+            current = get_allowlist_version(doorid)
+            if current != version:
+                return current
+            next_check = now + getattr(settings,
+                                       'ALLOWLIST_WAIT_RECHECK_SECONDS', 10)
+            if not transaction.is_managed():
+                connection.close()
+        if now >= deadline:
+            return version
+        time.sleep(min(getattr(settings, 'ALLOWLIST_WAIT_POLL_SECONDS', 0.5),
+                       deadline - now))
+
+
+def make_etag(doorid, version, format_name='text'):
+    if format_name == 'text':
+        return '"%d-%d"' % (int(doorid), version)
+    return '"%d-%d-%s"' % (int(doorid), version, format_name)
+
+
+def get_allowed_rfids(doorid):
+    """
+    Sorted list of the RFIDs allowed through the Door, from the database.
+    """
+    return list(RFIDkeycard.objects.filter(
+        lockuser__doors__pk=doorid, date_revoked__isnull=True).order_by(
+            'the_rfid').values_list('the_rfid', flat=True))
+
+
+def get_rendered(doorid, version, format_name, render):
+    """
+    The allowlist of the Door at this version, as rendered by
+    render(list_of_rfids), from the cache if it has been rendered before.
+    """
+    key = CACHE_KEY % (format_name, int(doorid), version)
+    rendered = cache.get(key)
+    if rendered is None:
+        rendered = render(get_allowed_rfids(doorid))
+        cache.set(key, rendered, CACHE_SECONDS)
+    return rendered
+
+
+def render_text(rfids):
+    """
+    The original format: RFIDs separated by spaces, with a null terminator
+    (we don't feel like making the arduino parse JSON).
+    """
+    return ' '.join(rfids) + '\0'
+
+
+# Binary format, for controllers that binary-search the list in place:
+#   header: magic "RFAL", format version (uint8), bytes per RFID (uint8),
+#           number of RFIDs (uint32), door allowlist_version (uint32),
+#           CRC-32 of the RFIDs that follow (uint32)
+#   then the RFIDs, as BINARY_RFID_SIZE-byte unsigned integers, sorted
+# All big-endian, so comparing two packed RFIDs with memcmp() orders them
+# the same way as comparing the numbers. An RFID is read as the hexadecimal
+# number it spells (as the readers send the card's 40-bit ID), which fills
+# the 5 bytes exactly; format version 1 read them as decimal, so that
+# RFIDs with letters in them couldn't be packed.
+BINARY_HEADER = struct.Struct('>4sBBIII')
+BINARY_MAGIC = 'RFAL'
+BINARY_FORMAT_VERSION = 2
+BINARY_RFID_SIZE = 5
+
+
+def pack_rfid(rfid):
+    """
+    The RFID (ten hexadecimal digits) as a BINARY_RFID_SIZE-byte big-endian
+    unsigned integer; ValueError if it isn't hexadecimal.
+    """
+    return struct.pack('>Q', int(rfid, 16))[-BINARY_RFID_SIZE:]
+
+
+def render_binary(version):
+    """
+    Returns a render function for the binary format at this door version.
+    RFIDs that aren't hexadecimal (none a reader sends) can't be packed, and
+    are left out with a warning logged.
+    """
+    def render(rfids):
+        entries = set()
+        skipped = []
+        for rfid in rfids:
+            try:
+                entries.add(pack_rfid(rfid))
+            except ValueError:
+                skipped.append(rfid)
+        if skipped:
+            logger.warning(
+                "Left %d RFIDs that aren't hexadecimal out of a binary "
+                "allowlist (version %s): %s", len(skipped), version,
+                ', '.join(sorted(skipped)))
+        entries = ''.join(sorted(entries))
+        return BINARY_HEADER.pack(
+            BINARY_MAGIC, BINARY_FORMAT_VERSION, BINARY_RFID_SIZE,
+            len(entries) // BINARY_RFID_SIZE, version,
+            zlib.crc32(entries) & 0xffffffff) + entries
+    return render
+
+
+def get_changes_since(doorid, since, version):
+    """
+    RFIDs added to and revoked from the Door's allowlist after version since,
+    up to version, as two sorted lists -- or None if the AllowlistChange
+    journal doesn't go back that far.
+    """
+    if since > version:
+        return None
+    changes = list(AllowlistChange.objects.filter(
+        door=doorid, version__gt=since, version__lte=version).order_by(
+            'version', 'pk').values_list('version', 'the_rfid', 'added'))
+    if since < version and (not changes or changes[0][0] != since + 1):
+        # the changes right after since have been pruned
+        return None
+    # only the last change to each RFID counts
+    last_change = {}
+    for change_version, rfid, added in changes:
+        last_change[rfid] = added
+    added = sorted(rfid for rfid, was_added in last_change.items() if was_added)
+    revoked = sorted(rfid for rfid, was_added in last_change.items()
+                     if not was_added)
+    return added, revoked
+
+
+def render_changes(version, added, revoked):
+    """
+    e.g. "delta 17 +1122135122 -9999999992" with a null terminator
+    """
+    tokens = ['delta', str(version)]
+    tokens.extend('+' + rfid for rfid in added)
+    tokens.extend('-' + rfid for rfid in revoked)
+    return ' '.join(tokens) + '\0'
+
+
+def render_full(version, rfids):
+    """
+    e.g. "full 17 1122135122 1122135199" with a null terminator
+    """
+    return ' '.join(['full', str(version)] + list(rfids)) + '\0'
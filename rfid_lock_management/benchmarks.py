@@ -0,0 +1,388 @@
+"""
+Benchmarks, run with "manage.py benchmark <name> ..." against a throwaway
+test database loaded with initial.json (see
+management/commands/benchmark.py). Each benchmark is a function taking the
+stream to report to and the number of requests (or iterations) to time.
+"""
+import itertools
+import time
+from wsgiref.util import setup_testing_defaults
+
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    """
+    Decorator: make func available to the benchmark command by its name.
+    """
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def time_each(func, times):
+    """
+    Call func the given number of times; returns the sorted durations of the
+    calls, in seconds.
+    """
+    timings = []
+    for i in range(times):
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    return sorted(timings)
+
+
+def percentile(sorted_timings, fraction):
+    return sorted_timings[min(int(len(sorted_timings) * fraction),
+                              len(sorted_timings) - 1)]
+
+
+def report(label, sorted_timings):
+    """
+    e.g. "check granted, django: 1000 in 2.31s, 433/s, p50 2.20 ms,
+    p99 3.70 ms"
+    """
+    total = sum(sorted_timings)
+    return '%s: %d in %.2fs, %.0f/s, p50 %.2f ms, p99 %.2f ms' % (
+        label, len(sorted_timings), total, len(sorted_timings) / total,
+        percentile(sorted_timings, 0.5) * 1000,
+        percentile(sorted_timings, 0.99) * 1000)
+
+
+def call_wsgi(app, path, **environ):
+    """
+    GET path from the WSGI application; returns (status, body).
+    """
+    environ.update({'PATH_INFO': path, 'REQUEST_METHOD': 'GET'})
+    setup_testing_defaults(environ)
+    statuses = []
+
+    def start_response(status, headers, exc_info=None):
+        statuses.append(status)
+
+    result = app(environ, start_response)
+    try:
+        body = ''.join(result)
+    finally:
+        # Django's handler finishes the request (closing the database
+        # connection etc.) here
+        if hasattr(result, 'close'):
+            result.close()
+    return statuses[0], body
+
+
+@benchmark
+def lock_gateway(stdout, requests):
+    """
+    The locks' requests answered by Django (as views.check and
+    views.get_allowed_rfids, through all the middleware) and by
+    lock_gateway.LockGateway.
+    """
+    from django.core.handlers.wsgi import WSGIHandler
+    from rfid_lock_management.lock_gateway import LockGateway
+
+    apps = [('django', WSGIHandler()), ('gateway', LockGateway())]
+    paths = [('check granted', '/checkdoor/2/checkrfid/9999999992/'),
+             ('check denied', '/checkdoor/2/checkrfid/9123456789/'),
+             ('getallowed', '/door/1/getallowed/')]
+    for label, path in paths:
+        # warm up (the authorization index, the allowlist cache), and make
+        # sure both give the same answer
+        answers = set(call_wsgi(app, path)[1] for name, app in apps)
+        assert len(answers) == 1, (path, answers)
+        for name, app in apps:
+            timings = time_each(lambda: call_wsgi(app, path), requests)
+            stdout.write(report('%s, %s' % (label, name), timings) + '\n')
+
+
+@benchmark
+def new_keycard_scans(stdout, requests):
+    """
+    A swipe and LockUser.save, each looking up its door's or lock user's
+    pending NewKeycardScan in the database (the scan state registry is
+    emptied before every call), with no past scans and with 50,000 of them;
+    then NewKeycardScanManager.sweep() clearing those away.
+    """
+    import datetime
+
+    from django.contrib.auth.models import User
+    from rfid_lock_management import scan_state
+    from rfid_lock_management.lock_gateway import LockGateway
+    from rfid_lock_management.models import LockUser, NewKeycardScan
+
+    app = LockGateway()
+    path = '/checkdoor/2/checkrfid/9999999992/'
+    lockuser = LockUser.objects.get(pk=1)
+    # the registry entries both calls look up
+    registry_keys = NewKeycardScan(door_id=2, lockuser_id=lockuser.pk)
+
+    def swipe():
+        scan_state.forget_scan(registry_keys)
+        call_wsgi(app, path)
+
+    def save_lockuser():
+        scan_state.forget_scan(registry_keys)
+        lockuser.save()
+
+    def time_calls(label):
+        swipe(), save_lockuser()   # warm up
+        for name, func in [('swipe', swipe), ('LockUser.save', save_lockuser)]:
+            stdout.write(report('%s, %s' % (name, label),
+                                time_each(func, requests)) + '\n')
+
+    time_calls('%d past scans' % NewKeycardScan.objects.count())
+
+    assigner = User.objects.all()[0]
+    # (in chunks: SQLite limits the number of parameters per query)
+    for chunk in range(0, 50000, 100):
+        NewKeycardScan.objects.bulk_create([
+            NewKeycardScan(assigner_user=assigner, door_id=2,
+                           lockuser=lockuser, doorid='2', rfid='%010d' % i,
+                           waiting_for_scan=False)
+            for i in range(chunk, chunk + 100)])
+    # (time_initiated is auto_now_add)
+    NewKeycardScan.objects.update(
+        time_initiated=datetime.datetime.now() - datetime.timedelta(days=2))
+    time_calls('%d past scans' % NewKeycardScan.objects.count())
+
+    start = time.time()
+    marked, deleted = NewKeycardScan.objects.sweep()
+    stdout.write('sweep: deleted %d in %.2fs, %d left\n' % (
+        deleted, time.time() - start, NewKeycardScan.objects.count()))
+
+
+@benchmark
+def access_times(stdout, requests):
+    """
+    Inserting AccessTimes for granted swipes (as swipes.make_access_time
+    makes them) one at a time and with one bulk insert, and the space they
+    take up in the database.
+    """
+    from django.db import connection
+    from rfid_lock_management.access_index import IndexEntry
+    from rfid_lock_management.models import AccessTime
+    from rfid_lock_management.swipes import make_access_time
+
+    index_entry = IndexEntry(2, u'Homer Simpson', frozenset([1, 2]))
+    size_before = _table_size(connection, AccessTime._meta.db_table)
+
+    timings = time_each(
+        lambda: make_access_time(2, '9999999992', index_entry).save(),
+        requests)
+    stdout.write(report('save', timings) + '\n')
+
+    batch = [make_access_time(2, '9999999992', index_entry)
+             for i in range(requests)]
+    start = time.time()
+    # (in chunks: SQLite limits the number of parameters per query)
+    for chunk in range(0, requests, 100):
+        AccessTime.objects.bulk_create(batch[chunk:chunk + 100])
+    duration = time.time() - start
+    stdout.write('bulk_create: %d in %.2fs, %.0f/s\n' % (
+        requests, duration, requests / duration))
+
+    size_after = _table_size(connection, AccessTime._meta.db_table)
+    if size_after is not None:
+        stdout.write('size: %.1f bytes per AccessTime\n' % (
+            float(size_after - size_before) / (2 * requests)))
+
+
+def _table_size(connection, table):
+    """
+    Bytes taken up by the table (with its indexes), if the database can tell.
+    """
+    cursor = connection.cursor()
+    if connection.vendor == 'sqlite':
+        # (the whole database: the test database is in memory)
+        cursor.execute('PRAGMA page_count')
+        page_count = cursor.fetchone()[0]
+        cursor.execute('PRAGMA page_size')
+        return page_count * cursor.fetchone()[0]
+    if connection.vendor == 'postgresql':
+        cursor.execute('SELECT pg_total_relation_size(%s)', [table])
+        return cursor.fetchone()[0]
+    return None
+
+
+# AccessTimes in the heatmap benchmark's synthetic log
+HEATMAP_ROWS = 5000000
+
+
+@benchmark
+def heatmap(stdout, requests):
+    """
+    The occupancy heatmap (views.chart_heatmap, through all the middleware)
+    over a synthetic log of HEATMAP_ROWS AccessTimes spread over two years:
+    the rollups rebuilt over all of them, then requests for every
+    door's heatmap, and, for comparison, binning the AccessTimes themselves.
+    """
+    import datetime
+    import random
+
+    from django.conf import settings
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db import connection, transaction
+    from django.test.client import Client
+    from rfid_lock_management import heatmap, rollups
+    from rfid_lock_management.models import AccessTime, Door, LockUser
+
+    door_ids = list(Door.objects.values_list('pk', flat=True))
+    lockuser_ids = list(LockUser.objects.values_list('pk', flat=True))
+    first = datetime.datetime.now() - datetime.timedelta(days=2 * 365)
+    seconds = 2 * 365 * 24 * 60 * 60
+    sql = ('INSERT INTO %s (the_rfid, access_time, lockuser_id, door_id) '
+           'VALUES (%%s, %%s, %%s, %%s)' % AccessTime._meta.db_table)
+    random.seed(0)
+    start = time.time()
+    for chunk in range(0, HEATMAP_ROWS, 100000):
+        end = min(chunk + 100000, HEATMAP_ROWS)
+        # (in time order, as swipes are logged)
+        offsets = sorted(random.randrange(chunk * seconds // HEATMAP_ROWS,
+                                          end * seconds // HEATMAP_ROWS)
+                         for i in range(chunk, end))
+        with transaction.commit_on_success():
+            connection.cursor().executemany(sql, [
+                ('9999999992', first + datetime.timedelta(seconds=offset),
+                 random.choice(lockuser_ids), random.choice(door_ids))
+                for offset in offsets])
+    stdout.write('inserted %d AccessTimes in %.2fs\n' % (
+        HEATMAP_ROWS, time.time() - start))
+
+    start = time.time()
+    counted = rollups.rebuild()
+    stdout.write('rollups: counted %d in %.2fs\n' % (
+        counted, time.time() - start))
+
+    app = WSGIHandler()
+    # (chart_heatmap is login_required: use a test client's session)
+    client = Client()
+    client.login(username='moe', password='moe')
+    cookie = '%s=%s' % (settings.SESSION_COOKIE_NAME,
+                        client.cookies[settings.SESSION_COOKIE_NAME].value)
+    status, body = call_wsgi(app, '/chart/heatmap/', HTTP_COOKIE=cookie)
+    assert status.startswith('200'), status
+    stdout.write('response: %d bytes\n' % len(body))
+    timings = time_each(
+        lambda: call_wsgi(app, '/chart/heatmap/', HTTP_COOKIE=cookie),
+        requests)
+    stdout.write(report('chart_heatmap', timings) + '\n')
+
+    start = time.time()
+    rows = list(AccessTime.objects.values_list('door', 'access_time'))
+    heatmap.bin_hours(sorted(door_ids), [row[0] for row in rows],
+                      [row[1] for row in rows])
+    stdout.write('binning the AccessTimes themselves: %.2fs\n' % (
+        time.time() - start))
+
+
+# Doors and staff users in the door_permissions benchmark
+PERMISSION_DOORS = 500
+PERMISSION_STAFF = 50
+
+
+@benchmark
+def door_permissions(stdout, requests):
+    """
+    The Doors a staff user may manage, as every LockUser change form works
+    them out (LockUserAdmin.get_doors_to_show and get_other_doors, each
+    request with a freshly fetched User), with PERMISSION_DOORS Doors and
+    PERMISSION_STAFF staff users each allowed half of them, some directly
+    and some through a Group (DoorACLEntries): with door_permissions' cache
+    empty and filled, and the DoorACLEntry query on its own.
+    """
+    import random
+
+    from django.contrib.admin.sites import AdminSite
+    from django.contrib.auth.models import Group, User
+    from django.test.client import RequestFactory
+    from rfid_lock_management import door_permissions
+    from rfid_lock_management.admin import LockUserAdmin
+    from rfid_lock_management.models import Door, DoorACLEntry, LockUser
+
+    start = time.time()
+    for i in range(PERMISSION_DOORS - Door.objects.count()):
+        Door.objects.create(name='Door %d' % i)
+    door_ids = list(Door.objects.values_list('pk', flat=True))
+    random.seed(0)
+    entries = []
+    groups = []
+    for i in range(5):
+        group = Group.objects.create(name='Staff %d' % i)
+        entries.extend(DoorACLEntry(door_id=door_id, group=group) for door_id
+                       in random.sample(door_ids, len(door_ids) // 4))
+        groups.append(group)
+    user_ids = []
+    for i in range(PERMISSION_STAFF):
+        user = User.objects.create_user('staff%d' % i, 'staff%d@example.com'
+                                        % i, 'staff')
+        user.is_staff = True
+        user.save()
+        entries.extend(DoorACLEntry(door_id=door_id, user=user) for door_id
+                       in random.sample(door_ids, len(door_ids) // 4))
+        user.groups.add(groups[i % len(groups)])
+        user_ids.append(user.pk)
+    # (in chunks: SQLite limits the number of parameters per query)
+    for chunk in range(0, len(entries), 100):
+        DoorACLEntry.objects.bulk_create(entries[chunk:chunk + 100])
+    lockuser = LockUser.objects.get(pk=1)
+    lockuser.doors.add(*Door.objects.all()[:50])
+    stdout.write('%d doors, %d staff users, %d ACL entries in %.2fs\n' % (
+        len(door_ids), len(user_ids), len(entries), time.time() - start))
+
+    lockuser_admin = LockUserAdmin(LockUser, AdminSite())
+    users = itertools.cycle(user_ids)
+
+    def change_form_doors():
+        # (a new request each time, as the request memo would otherwise
+        # answer)
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(pk=next(users))
+        return (set(lockuser_admin.get_doors_to_show(request)),
+                lockuser_admin.get_other_doors(request, lockuser.pk))
+
+    door_permissions.invalidate()
+    timings = time_each(change_form_doors, len(user_ids))
+    stdout.write(report('cache empty', timings) + '\n')
+    stdout.write(report('cache filled', time_each(change_form_doors,
+                                                  requests)) + '\n')
+    users_fetched = [User.objects.get(pk=user_id) for user_id in user_ids]
+    stdout.write(report('DoorACLEntry query', time_each(
+        lambda: list(door_permissions.query_door_ids(
+            users_fetched[random.randrange(len(users_fetched))])),
+        requests)) + '\n')
+
+
+# Doors in the door_import benchmark
+IMPORT_DOORS = 2000
+
+
+@benchmark
+def door_import(stdout, requests):
+    """
+    Adding IMPORT_DOORS Doors, each with a staff user who may manage it: with
+    door_import.import_doors, and, for comparison, saving each Door and
+    DoorACLEntry in turn, as the admin would. (requests isn't used.)
+    """
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from rfid_lock_management import door_import
+    from rfid_lock_management.models import Door, DoorACLEntry
+
+    moe = User.objects.get(username='moe')
+    doors = [{'name': 'Imported %d' % i, 'description': None,
+              'managers': ['moe'], 'groups': []}
+             for i in range(IMPORT_DOORS)]
+    start = time.time()
+    door_import.import_doors(doors)
+    duration = time.time() - start
+    stdout.write('import_doors: %d in %.2fs, %.0f doors/s\n' % (
+        IMPORT_DOORS, duration, IMPORT_DOORS / duration))
+
+    start = time.time()
+    with transaction.commit_on_success():
+        for i in range(IMPORT_DOORS):
+            door = Door.objects.create(name='Saved %d' % i)
+            DoorACLEntry.objects.create(door=door, user=moe)
+    duration = time.time() - start
+    stdout.write('one at a time: %d in %.2fs, %.0f doors/s\n' % (
+        IMPORT_DOORS, duration, IMPORT_DOORS / duration))
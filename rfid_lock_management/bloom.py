@@ -0,0 +1,111 @@
+"""
+Bloom filter of a door's allowed RFIDs, for lock controllers without the
+memory for the whole allowlist: a controller checks the filter first and only
+asks the server (checkdoor/<id>/checkrfid/<rfid>/) when the filter says the
+RFID may be allowed, so unknown cards never reach the server.
+
+The hash scheme is fixed so that it can be reimplemented on the controller:
+
+    h1 = FNV-1a (32-bit) of the RFID's ASCII characters
+    h2 = the same FNV-1a loop run over the characters again, starting from h1
+         instead of the offset basis (i.e. FNV-1a of the RFID twice over),
+         then OR'ed with 1
+    bit i (for i = 0 .. k-1) = (h1 + i * h2) mod 2^32 mod m
+
+Bit j of the filter is bit (j & 7) -- least significant first -- of byte
+j >> 3.
+
+Served as a header (see HEADER: magic "RFBF", format version, k, m, number of
+RFIDs, door allowlist_version; all big-endian) followed by the m bits.
+"""
+import math
+import struct
+
+FNV_OFFSET_BASIS = 2166136261
+FNV_PRIME = 16777619
+
+HEADER = struct.Struct('>4sBBIII')
+MAGIC = 'RFBF'
+FORMAT_VERSION = 1
+
+MIN_FP_RATE = 0.0001
+MAX_FP_RATE = 0.5
+MAX_HASHES = 16
+
+
+def fnv1a_32(data, h=FNV_OFFSET_BASIS):
+    for c in data:
+        h = ((h ^ ord(c)) * FNV_PRIME) & 0xffffffff
+    return h
+
+
+def bit_positions(rfid, num_hashes, num_bits):
+    """
+    The num_hashes bit positions of the RFID, in a filter of num_bits bits
+    """
+    h1 = fnv1a_32(rfid)
+    h2 = fnv1a_32(rfid, h1) | 1
+    return [((h1 + i * h2) & 0xffffffff) % num_bits
+            for i in range(num_hashes)]
+
+
+def round_fp_rate(fp_rate):
+    """
+    The false-positive rate, within MIN_FP_RATE and MAX_FP_RATE, rounded to
+    one significant digit (0.01, 0.02, ... 0.1, 0.2, ...), so that a door
+    has a few dozen possible filters per version to render and cache rather
+    than one per rate asked for.
+    """
+    fp_rate = min(max(fp_rate, MIN_FP_RATE), MAX_FP_RATE)
+    return min(max(float('%.1g' % fp_rate), MIN_FP_RATE), MAX_FP_RATE)
+
+
+def filter_size(num_items, fp_rate):
+    """
+    (number of hashes, number of bits) for a filter of num_items items with
+    the given false-positive rate. The number of bits is rounded up to a whole
+    number of bytes.
+    """
+    num_items = max(num_items, 1)
+    num_bits = int(math.ceil(-num_items * math.log(fp_rate) / math.log(2) ** 2))
+    num_bits = max(8, (num_bits + 7) // 8 * 8)
+    num_hashes = int(round(float(num_bits) / num_items * math.log(2)))
+    return min(max(num_hashes, 1), MAX_HASHES), num_bits
+
+
+class BloomFilter(object):
+
+    def __init__(self, num_hashes, num_bits):
+        self.num_hashes = num_hashes
+        self.num_bits = num_bits
+        self.bits = bytearray(num_bits // 8)
+
+    @classmethod
+    def from_rfids(cls, rfids, fp_rate):
+        bloom_filter = cls(*filter_size(len(rfids), fp_rate))
+        for rfid in rfids:
+            bloom_filter.add(rfid)
+        return bloom_filter
+
+    def add(self, rfid):
+        for j in bit_positions(rfid, self.num_hashes, self.num_bits):
+            self.bits[j >> 3] |= 1 << (j & 7)
+
+    def __contains__(self, rfid):
+        return all(self.bits[j >> 3] & (1 << (j & 7))
+                   for j in bit_positions(rfid, self.num_hashes, self.num_bits))
+
+    def to_bytes(self, num_items, version):
+        return HEADER.pack(MAGIC, FORMAT_VERSION, self.num_hashes,
+                           self.num_bits, num_items, version) + str(self.bits)
+
+
+def render_bloom(version, fp_rate):
+    """
+    Returns a render function (for allowlists.get_rendered) for the Bloom
+    filter at this door version and false-positive rate.
+    """
+    def render(rfids):
+        return BloomFilter.from_rfids(rfids, fp_rate).to_bytes(len(rfids),
+                                                                version)
+    return render
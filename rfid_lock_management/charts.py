@@ -0,0 +1,262 @@
+"""
+Data for the access times chart (chart.html), served as JSON by
+views.chart_data: one Highcharts scatter series per door, each point an
+AccessTime, with x the day and y the time of day it happened, both in
+JavaScript milliseconds (x as Date.UTC(year, month, day) would give, y as
+milliseconds since midnight), and the lock user's name for the tooltip:
+
+    [{"name": "Community Theater", "data": [{"x": 1365552000000,
+      "y": 3381644, "user": "Homer Simpson"}, ...]}, ...]
+
+Or, per hour, from the HourlyAccessCount rollup (see rollups.py): a point
+for each lock user and hour in which they went through the door, at the
+start of the hour, with the number of times they did as "count".
+
+All the series come from one query, ordered by door, and are encoded a
+chunk at a time as they are read, so that the response can be sent (and
+gzipped, see gzip_chunks) while the rows are still coming in.
+
+Zoomed out over a long range, that can be far more points than the chart
+has pixels for: given a budget of points per door, the series of the doors
+with more than that are downsampled (see downsample and lttb), so that the
+response and the chart's memory stay bounded however many AccessTimes there
+are. The chart asks for the range it is zoomed in to, and gets every point
+once there are few enough.
+"""
+import calendar
+import datetime
+import hashlib
+import itertools
+import zlib
+
+from django.db.models import Count, Max, Sum
+from django.utils import simplejson
+from rfid_lock_management.models import AccessTime, HourlyAccessCount
+
+DATE_FORMAT = '%Y-%m-%d'
+
+# points encoded per chunk of output
+CHUNK_POINTS = 500
+
+
+def parse_date(value):
+    """
+    datetime.date from a YYYY-MM-DD string; ValueError if it isn't one.
+    """
+    return datetime.datetime.strptime(value, DATE_FORMAT).date()
+
+
+def parse_params(params):
+    """
+    (start, end, door ids) from the request parameters ?from= and ?to=
+    (YYYY-MM-DD dates, None if left out) and ?door= (any number of door ids,
+    sorted; None if none); ValueError if any isn't one.
+    """
+    start, end = [parse_date(params[name]) if params.get(name) else None
+                  for name in ('from', 'to')]
+    door_ids = sorted(int(door_id) for door_id in params.getlist('door'))
+    return start, end, door_ids or None
+
+
+def get_access_times(start=None, end=None, door_ids=None):
+    """
+    AccessTimes from the start date through the end date (either may be
+    None for no limit), at the given doors (None for all).
+    """
+    access_times = AccessTime.objects.filter(door__isnull=False,
+                                             access_time__isnull=False)
+    if start is not None:
+        access_times = access_times.filter(access_time__gte=start)
+    if end is not None:
+        access_times = access_times.filter(
+            access_time__lt=end + datetime.timedelta(days=1))
+    if door_ids is not None:
+        access_times = access_times.filter(door__in=door_ids)
+    return access_times
+
+
+def get_hourly_counts(start=None, end=None, door_ids=None):
+    """
+    As get_access_times, but the HourlyAccessCounts.
+    """
+    hourly_counts = HourlyAccessCount.objects.all()
+    if start is not None:
+        hourly_counts = hourly_counts.filter(hour__gte=start)
+    if end is not None:
+        hourly_counts = hourly_counts.filter(
+            hour__lt=end + datetime.timedelta(days=1))
+    if door_ids is not None:
+        hourly_counts = hourly_counts.filter(door__in=door_ids)
+    return hourly_counts
+
+
+def make_etag(queryset, *args):
+    """
+    ETag for the chart data of the queryset (from get_access_times or
+    get_hourly_counts) given with args (the request's parameters). It
+    changes when AccessTimes (or their counts) are added to or deleted from
+    the range, and only then. One query.
+    """
+    if queryset.model is AccessTime:
+        stats = queryset.aggregate(count=Count('pk'), last=Max('pk'))
+    else:
+        stats = queryset.aggregate(count=Sum('count'), last=Max('pk'))
+    key = repr((args, stats['count'], stats['last']))
+    return '"%s"' % hashlib.md5(key).hexdigest()
+
+
+def get_rows(access_times):
+    """
+    (door name, door id, access_time, lock user first name, last name) for
+    each of the access_times, by door and then by time. (One query, run as
+    the rows are iterated over.)
+    """
+    return access_times.order_by('door', 'access_time').values_list(
+        'door__name', 'door', 'access_time', 'lockuser__first_name',
+        'lockuser__last_name').iterator()
+
+
+def get_hourly_rows(hourly_counts):
+    """
+    As get_rows, but for HourlyAccessCounts, with the hour for access_time
+    and the count at the end.
+    """
+    return hourly_counts.order_by('door', 'hour').values_list(
+        'door__name', 'door', 'hour', 'lockuser__first_name',
+        'lockuser__last_name', 'count').iterator()
+
+
+def get_counts(queryset):
+    """
+    {door id: number of rows} of the queryset (from get_access_times or
+    get_hourly_counts). One query.
+    """
+    return dict(queryset.order_by().values_list('door').annotate(Count('pk')))
+
+
+def downsample(rows, counts, threshold):
+    """
+    The rows (from get_rows or get_hourly_rows), with at most threshold for
+    each door: all of them if there are no more than that, otherwise as
+    picked by lttb(), with x the moment of each row and y the time of day
+    it is plotted at. counts is get_counts() for the same queryset.
+    """
+    for (door_name, door_id), door_rows in itertools.groupby(
+            rows, key=lambda row: (row[0], row[1])):
+        for row in lttb(door_rows, counts.get(door_id, 0), threshold,
+                        x=_row_moment, y=_row_time_of_day):
+            yield row
+
+
+def lttb(rows, count, threshold, x, y):
+    """
+    Largest-Triangle-Three-Buckets downsampling of the count rows (any
+    iterable, in x order) to threshold (at least 3) of them: the first and
+    the last, and for each of threshold - 2 buckets of the ones in between,
+    the one making the largest triangle with the one picked from the bucket
+    before and the average of the bucket after (x and y being functions
+    giving a row's coordinates). This keeps the peaks and the outliers that
+    averaging or taking every nth row would lose. Only two buckets are held
+    in memory at a time.
+
+    If there are no more than threshold rows, they are all yielded. Rows
+    past count (say, inserted since it was counted) go in the last bucket.
+    """
+    rows = iter(rows)
+    if count <= threshold:
+        for row in rows:
+            yield row
+        return
+    every = float(count - 2) / (threshold - 2)
+
+    def take_bucket(i):
+        size = int((i + 1) * every) - int(i * every)
+        return [(x(row), y(row), row)
+                for row in itertools.islice(rows, size)]
+
+    picked = next(rows, None)
+    if picked is None:
+        return
+    yield picked
+    picked_x, picked_y = x(picked), y(picked)
+    bucket = take_bucket(0)
+    for i in range(threshold - 2):
+        if i + 1 < threshold - 2:
+            following = take_bucket(i + 1)
+        else:
+            following = [(x(row), y(row), row) for row in rows]
+            bucket.extend(following[:-1])
+            following = following[-1:]
+        out_of_rows = not following
+        if out_of_rows:
+            # (fewer rows than counted) the last one is in this bucket
+            bucket, following = bucket[:-1], bucket[-1:]
+        if bucket:
+            average_x = float(sum(f[0] for f in following)) / len(following)
+            average_y = float(sum(f[1] for f in following)) / len(following)
+            picked_x, picked_y, picked = max(bucket, key=lambda b: abs(
+                (picked_x - average_x) * (b[1] - picked_y) -
+                (picked_x - b[0]) * (average_y - picked_y)))
+            yield picked
+        bucket = following
+        if out_of_rows:
+            break
+    for b in bucket:
+        yield b[2]
+
+
+def _row_moment(row):
+    # (seconds since the epoch, as if in UTC)
+    return calendar.timegm(row[2].timetuple())
+
+
+def _row_time_of_day(row):
+    return (row[2].hour * 60 + row[2].minute) * 60 + row[2].second
+
+
+def to_point(access_time, first_name, last_name, count=None):
+    x = calendar.timegm(access_time.date().timetuple()) * 1000
+    y = ((access_time.hour * 60 + access_time.minute) * 60 +
+         access_time.second) * 1000
+    user = u'%s %s' % (first_name, last_name) if first_name is not None \
+        else u''
+    point = {'x': x, 'y': y, 'user': user}
+    if count is not None:
+        point['count'] = count
+    return point
+
+
+def encode_series(rows):
+    """
+    The JSON for the chart's series, a chunk (str) at a time, from
+    get_rows() or get_hourly_rows().
+    """
+    yield '['
+    doors = itertools.groupby(rows, key=lambda row: (row[0], row[1]))
+    for i, ((door_name, door_id), door_rows) in enumerate(doors):
+        yield '%s{"name": %s, "data": [' % (',' if i else '',
+                                             simplejson.dumps(door_name))
+        first = True
+        while True:
+            points = [to_point(*row[2:])
+                      for row in itertools.islice(door_rows, CHUNK_POINTS)]
+            if not points:
+                break
+            encoded = simplejson.dumps(points, separators=(',', ':'))[1:-1]
+            yield encoded if first else ',' + encoded
+            first = False
+        yield ']}'
+    yield ']'
+
+
+def gzip_chunks(chunks, level=6):
+    """
+    gzip the chunks as they come, for a Content-Encoding: gzip response.
+    """
+    # (16 + MAX_WBITS: with a gzip header and trailer)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
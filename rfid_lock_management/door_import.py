@@ -0,0 +1,150 @@
+"""
+Adding Doors in bulk (say, all of a new building's readers at once), from
+CSV or JSON, with who may manage each (DoorACLEntries). Used by the
+import_doors command:
+
+    name,description,managers,groups
+    Lab 101,Chemistry lab,moe;curly,Lab staff
+
+or
+
+    [{"name": "Lab 101", "description": "Chemistry lab",
+      "managers": ["moe", "curly"], "groups": ["Lab staff"]}, ...]
+
+managers are usernames, groups Group names (";"-separated in CSV);
+description, managers and groups may be left out.
+
+Saving Doors one at a time takes several queries each (see Door.save and
+the signal handlers in models.py); import_doors() instead inserts all the
+Doors, then all their DoorACLEntries, with a bulk insert per 100, in one
+transaction, so that a few thousand Doors take seconds. Doors whose names
+are already taken are left as they are (but get the DoorACLEntries listed
+for them that they don't have yet), so an import can be run again.
+"""
+import csv
+from collections import Counter, namedtuple
+
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.utils import simplejson
+from rfid_lock_management import door_permissions
+from rfid_lock_management.access_index import authorization_index
+from rfid_lock_management.models import Door, DoorACLEntry
+
+# rows per bulk insert, and names per "IN (...)" lookup (SQLite limits the
+# number of parameters per query)
+CHUNK_SIZE = 100
+LOOKUP_CHUNK_SIZE = 500
+
+# What import_doors() did
+ImportResult = namedtuple('ImportResult', ['created', 'existing',
+                                           'acl_entries'])
+
+
+def read_doors(stream, format):
+    """
+    The doors in the stream, 'csv' or 'json', as dicts with name,
+    description, managers and groups. ValueError if it can't be read.
+    """
+    if format == 'csv':
+        rows = []
+        for row in csv.DictReader(stream):
+            row = dict((key, (value or '').decode('utf-8').strip())
+                       for key, value in row.items() if key is not None)
+            for key in ('managers', 'groups'):
+                row[key] = [item.strip()
+                            for item in row.get(key, '').split(';')
+                            if item.strip()]
+            rows.append(row)
+    elif format == 'json':
+        rows = simplejson.load(stream)
+        if not isinstance(rows, list) or not all(
+                isinstance(row, dict) and
+                isinstance(row.get('managers', []), list) and
+                isinstance(row.get('groups', []), list) for row in rows):
+            raise ValueError("Expected a list of doors, each with a list of "
+                             "managers and of groups")
+    else:
+        raise ValueError("Unknown format %r: 'csv' or 'json'" % format)
+    return [{'name': row.get('name') or '',
+             'description': row.get('description') or None,
+             'managers': list(row.get('managers') or []),
+             'groups': list(row.get('groups') or [])} for row in rows]
+
+
+def import_doors(doors):
+    """
+    Create the doors (as read_doors gives them) that don't exist yet, and
+    the DoorACLEntries for their managers and groups, in one transaction.
+    ValueError, and nothing saved, if a name is missing, too long or given
+    twice, or a manager or group doesn't exist. Returns an ImportResult.
+    """
+    max_length = Door._meta.get_field('name').max_length
+    names = [door['name'] for door in doors]
+    for name in names:
+        if (not isinstance(name, basestring) or
+                not 0 < len(name) <= max_length):
+            raise ValueError("Door names must have 1 to %d characters: %r"
+                             % (max_length, name))
+    repeated = [name for name, count in Counter(names).items() if count > 1]
+    if repeated:
+        raise ValueError("Door names given more than once: %s" %
+                         ', '.join(sorted(repeated)))
+    user_ids = _lookup(User.objects, 'username', set(
+        username for door in doors for username in door['managers']))
+    group_ids = _lookup(Group.objects, 'name', set(
+        group for door in doors for group in door['groups']))
+
+    with transaction.commit_on_success():
+        existing = _lookup(Door.objects, 'name', names, missing_ok=True)
+        new_doors = [Door(name=door['name'], description=door['description'])
+                     for door in doors if door['name'] not in existing]
+        for chunk in range(0, len(new_doors), CHUNK_SIZE):
+            Door.objects.bulk_create(new_doors[chunk:chunk + CHUNK_SIZE])
+        door_ids = _lookup(Door.objects, 'name', names)
+
+        wanted = set()
+        for door in doors:
+            door_id = door_ids[door['name']]
+            wanted.update((door_id, user_ids[username], None)
+                          for username in door['managers'])
+            wanted.update((door_id, None, group_ids[group])
+                          for group in door['groups'])
+        # (only the Doors that were there already can have entries)
+        existing_ids = [door_ids[name] for name in existing]
+        for chunk in range(0, len(existing_ids), LOOKUP_CHUNK_SIZE):
+            wanted.difference_update(DoorACLEntry.objects.filter(
+                door__in=existing_ids[chunk:chunk + LOOKUP_CHUNK_SIZE])
+                .values_list('door', 'user', 'group'))
+        entries = [DoorACLEntry(door_id=door_id, user_id=user_id,
+                                group_id=group_id)
+                   for door_id, user_id, group_id in sorted(wanted)]
+        for chunk in range(0, len(entries), CHUNK_SIZE):
+            DoorACLEntry.objects.bulk_create(
+                entries[chunk:chunk + CHUNK_SIZE])
+
+    # (bulk_create doesn't send post_save)
+    if new_doors or entries:
+        door_permissions.invalidate()
+        authorization_index.invalidate()
+    return ImportResult(len(new_doors), len(existing), len(entries))
+
+
+def _lookup(objects, field, values, missing_ok=False):
+    """
+    {value: pk} of the objects whose field is one of the values, a chunk at
+    a time; ValueError if any isn't found, unless missing_ok.
+    """
+    values = list(values)
+    pks = {}
+    for chunk in range(0, len(values), LOOKUP_CHUNK_SIZE):
+        pks.update(objects.filter(**{
+            field + '__in': values[chunk:chunk + LOOKUP_CHUNK_SIZE]})
+            .values_list(field, 'pk'))
+    if not missing_ok:
+        missing = set(values) - set(pks)
+        if missing:
+            raise ValueError("No %s with the %s %s" % (
+                objects.model._meta.verbose_name, field,
+                ', '.join(sorted(missing))))
+    return pks
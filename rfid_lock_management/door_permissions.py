@@ -0,0 +1,85 @@
+"""
+Which Doors each staff User may manage -- those with a DoorACLEntry for the
+User or for one of their Groups, or every Door for a superuser -- kept in
+the Django cache as a set of Door pks, so that the admin can limit Doors
+with one pk__in filter.
+
+Looking them up takes one query, using the indexes on DoorACLEntry's user
+and group, however many Doors there are; the cache saves even that on most
+requests. Signal handlers in models.py call forget_user() when a User or
+their groups change, and invalidate() -- which bumps a generation number,
+as for the authorization index (see access_index.py), so that every User's
+entry is looked up again -- when a DoorACLEntry is saved or deleted, or a
+Door is added. As there, with more than one worker process CACHES must point
+at a shared backend for the other workers to notice.
+"""
+import time
+
+from django.core.cache import cache
+
+GENERATION_CACHE_KEY = 'rfid_lock_management:door_permissions_generation'
+USER_CACHE_KEY = 'rfid_lock_management:manageable_doors:%s:%s'  # gen., user
+
+
+def manageable_door_ids(user):
+    """
+    frozenset of the pks of the Doors the User may manage; empty for an
+    inactive User. One query if not cached.
+    """
+    key = USER_CACHE_KEY % (current_generation(), user.pk)
+    door_ids = cache.get(key)
+    if door_ids is None:
+        door_ids = frozenset()
+        if user.is_active:
+            door_ids = frozenset(query_door_ids(user))
+        cache.set(key, door_ids)
+    return door_ids
+
+
+def query_door_ids(user):
+    """
+    The pks of the Doors the User may manage, straight from the database.
+    """
+    # imported here since models.py imports this module
+    from django.contrib.auth.models import User
+    from django.db.models import Q
+    from rfid_lock_management.models import Door, DoorACLEntry
+
+    if user.is_superuser:
+        return Door.objects.values_list('pk', flat=True)
+    user_groups = User.groups.through.objects.filter(
+        user=user.pk).values('group')
+    return DoorACLEntry.objects.filter(
+        Q(user=user.pk) | Q(group__in=user_groups)).values_list(
+        'door', flat=True).distinct()
+
+
+def forget_user(user_id):
+    """
+    Look up this User's Doors again next time.
+    """
+    cache.delete(USER_CACHE_KEY % (current_generation(), user_id))
+
+
+def invalidate():
+    """
+    Look up every User's Doors again next time.
+    """
+    try:
+        cache.incr(GENERATION_CACHE_KEY)
+    except ValueError:
+        # key not in the cache (yet, or anymore)
+        cache.set(GENERATION_CACHE_KEY, _new_generation())
+
+
+def current_generation():
+    generation = cache.get(GENERATION_CACHE_KEY)
+    if generation is None:
+        cache.add(GENERATION_CACHE_KEY, _new_generation())
+        generation = cache.get(GENERATION_CACHE_KEY)
+    return generation
+
+
+def _new_generation():
+    # (as access_index._new_generation: one no worker could have seen)
+    return int(time.time() * 1000)
@@ -0,0 +1,112 @@
+"""
+Occupancy heatmaps: for each door, the number of AccessTimes in each hour of
+each day of the week (Monday first, hours from midnight) over a range of
+dates, served as JSON by views.chart_heatmap:
+
+    {"days": ["Mon", "Tue", ..., "Sun"], "doors": [{"id": 1,
+      "name": "Community Theater", "data": [[0, 0, ..., 3], ...]}, ...]}
+
+"data" is always 7 lists of 24 counts, however many AccessTimes went into
+it, so the response stays small where the scatter chart's would not.
+
+The grids are made from the HourlyAccessCount rollup (see rollups.py)
+rather than from AccessTime itself, so that the cost is in proportion to the
+hours in the range rather than to the swipes. Where the database can tell
+the day of the week and hour of an HourlyAccessCount (WEEK_HOUR_SQL), it
+also sums them by door, day and hour, and only the (at most 168 per door)
+sums are read; otherwise every door and hour is, as datetimes. Either way
+the rows are binned with NumPy: the door, day and hour of each become a
+single index into the grids, and numpy.bincount sums the counts at those
+indexes.
+"""
+import numpy
+
+from django.db import connection
+from django.db.models import Sum
+from django.utils.datastructures import SortedDict
+from rfid_lock_management.models import Door, HourlyAccessCount
+
+DAY_NAMES = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+# weekday (Monday 0) of 1970-01-01, day 0 of datetime64
+EPOCH_WEEKDAY = 3
+
+# SQL for the day of the week (Sunday 0) and the hour of the day of
+# HourlyAccessCount.hour ("%(hour)s"), by database vendor
+WEEK_HOUR_SQL = {
+    'sqlite': ("CAST(strftime('%%%%w', %(hour)s) AS INTEGER)",
+               "CAST(strftime('%%%%H', %(hour)s) AS INTEGER)"),
+    'postgresql': ("CAST(EXTRACT(DOW FROM %(hour)s) AS INTEGER)",
+                   "CAST(EXTRACT(HOUR FROM %(hour)s) AS INTEGER)"),
+}
+
+
+def bin_week_hours(doors, door_ids, weekdays, hours, counts=None):
+    """
+    (len(doors), 7, 24) array of the counts (default: 1 each) summed by door
+    (its position in doors, a sorted sequence of door ids), weekday (Monday
+    0) and hour of the day. door_ids, weekdays, hours and counts are
+    sequences of the same length; entries whose door isn't in doors are
+    left out.
+    """
+    doors = numpy.asarray(doors, dtype=numpy.int64)
+    door_ids = numpy.asarray(door_ids, dtype=numpy.int64)
+    weekdays = numpy.asarray(weekdays, dtype=numpy.int64)
+    hours = numpy.asarray(hours, dtype=numpy.int64)
+    if counts is None:
+        counts = numpy.ones(len(door_ids), dtype=numpy.int64)
+    counts = numpy.asarray(counts, dtype=numpy.int64)
+
+    known = numpy.in1d(door_ids, doors)
+    cells = ((numpy.searchsorted(doors, door_ids[known]) * 7 +
+              weekdays[known]) * 24 + hours[known])
+    grids = numpy.bincount(cells, weights=counts[known],
+                           minlength=len(doors) * 7 * 24)
+    return grids.astype(numpy.int64).reshape(len(doors), 7, 24)
+
+
+def bin_hours(doors, door_ids, times, counts=None):
+    """
+    As bin_week_hours, by the weekday and hour of the times (datetimes or
+    datetime64s).
+    """
+    hours = numpy.asarray(times, dtype='datetime64[h]').astype(numpy.int64)
+    return bin_week_hours(doors, door_ids, (hours // 24 + EPOCH_WEEKDAY) % 7,
+                          hours % 24, counts)
+
+
+def get_heatmaps(hourly_counts, door_ids=None):
+    """
+    The heatmaps (as in the JSON above, without "days") of the
+    HourlyAccessCounts (see charts.get_hourly_counts), for the doors with
+    the given ids (None for all), by door id. Two queries.
+    """
+    doors = Door.objects.order_by('pk')
+    if door_ids is not None:
+        doors = doors.filter(pk__in=door_ids)
+    doors = list(doors.values_list('pk', 'name'))
+    door_pks = [pk for pk, name in doors]
+
+    hourly_counts = hourly_counts.order_by()
+    week_hour_sql = WEEK_HOUR_SQL.get(connection.vendor)
+    if week_hour_sql is not None:
+        hour = '%s.%s' % (
+            connection.ops.quote_name(HourlyAccessCount._meta.db_table),
+            connection.ops.quote_name('hour'))
+        weekday_sql, hour_sql = [sql % {'hour': hour}
+                                 for sql in week_hour_sql]
+        rows = list(hourly_counts.extra(select=SortedDict([
+            ('weekday', weekday_sql), ('hour_of_day', hour_sql)]))
+            .values_list('door', 'weekday', 'hour_of_day')
+            .annotate(Sum('count')))
+        grids = bin_week_hours(
+            door_pks, [row[0] for row in rows],
+            [(row[1] + 6) % 7 for row in rows],   # Monday 0
+            [row[2] for row in rows], [row[3] for row in rows])
+    else:
+        rows = list(hourly_counts.values_list('door', 'hour')
+                    .annotate(Sum('count')))
+        grids = bin_hours(door_pks, [row[0] for row in rows],
+                          [row[1] for row in rows], [row[2] for row in rows])
+    return [{'id': pk, 'name': name, 'data': grid.tolist()}
+            for (pk, name), grid in zip(doors, grids)]
@@ -0,0 +1,79 @@
+"""
+WSGI application that answers the locks' two most frequent requests --
+checkdoor/<doorid>/checkrfid/<rfid>/ and door/<doorid>/getallowed/ -- itself,
+without going through Django's URL resolver and middleware (sessions, CSRF,
+auth, messages, debug toolbar), none of which the locks use. The answers are
+the same as views.check and views.get_allowed_rfids give: both use swipes.py
+and allowlists.py.
+
+Every other request goes to the wrapped application, so this can be put in
+front of the whole site (see proj_rfid_lock_management/lock_wsgi.py) or
+serve the locks on a port of their own with no fallback.
+"""
+import re
+
+from django.core import signals
+from rfid_lock_management import allowlists, swipes
+
+CHECK_RE = re.compile(r'^/checkdoor/(\d+)/checkrfid/(\w{10})/$', re.UNICODE)
+GETALLOWED_RE = re.compile(r'^/door/(\d+)/getallowed/$')
+
+TEXT_PLAIN = ('Content-Type', 'text/plain; charset=utf-8')
+
+
+class LockGateway(object):
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if environ.get('REQUEST_METHOD', 'GET') in ('GET', 'HEAD'):
+            match = CHECK_RE.match(path)
+            if match:
+                return self.respond(self.check, environ, start_response,
+                                    *match.groups())
+            match = GETALLOWED_RE.match(path)
+            # the binary format is left to views.get_allowed_rfids
+            if match and not ('format=' in environ.get('QUERY_STRING', '') or
+                              'application/octet-stream' in
+                              environ.get('HTTP_ACCEPT', '')):
+                return self.respond(self.get_allowed_rfids, environ,
+                                    start_response, *match.groups())
+        if self.fallback is not None:
+            return self.fallback(environ, start_response)
+        start_response('404 NOT FOUND', [TEXT_PLAIN])
+        return ['']
+
+    def respond(self, view, environ, start_response, *args):
+        # What Django's handler does around each request that matters here:
+        # resetting connection.queries, and closing the database connection.
+        signals.request_started.send(sender=self.__class__)
+        try:
+            status, headers, body = view(environ, *args)
+        finally:
+            signals.request_finished.send(sender=self.__class__)
+        start_response(status, headers + [('Content-Length', str(len(body)))])
+        return [body]
+
+    def check(self, environ, doorid, rfid):
+        """
+        views.check
+        """
+        return '200 OK', [TEXT_PLAIN], str(swipes.check_swipe(doorid, rfid))
+
+    def get_allowed_rfids(self, environ, doorid):
+        """
+        views.get_allowed_rfids, text format only
+        """
+        version = allowlists.get_allowlist_version(doorid)
+        if version is None:
+            # door may not exist, but still need to respond
+            return '200 OK', [TEXT_PLAIN], '\0'
+        etag = allowlists.make_etag(doorid, version)
+        headers = [('ETag', etag), ('X-Allowlist-Version', str(version))]
+        if etag in environ.get('HTTP_IF_NONE_MATCH', ''):
+            return '304 NOT MODIFIED', headers, ''
+        body = allowlists.get_rendered(doorid, version, 'text',
+                                       allowlists.render_text)
+        return '200 OK', [TEXT_PLAIN] + headers, body
@@ -0,0 +1,43 @@
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rfid_lock_management.benchmarks import BENCHMARKS
+from south.management.commands import patch_for_test_db_setup
+
+
+class Command(BaseCommand):
+    args = '<benchmark benchmark ...>'
+    help = ("Run the named benchmarks (from rfid_lock_management/benchmarks.py) "
+            "against a test database loaded with initial.json. Available: " +
+            ', '.join(sorted(BENCHMARKS)) + '.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--requests', type='int', default=1000,
+                    help='Number of requests (or iterations) to time '
+                         '(default 1000).'),
+    )
+
+    def handle(self, *names, **options):
+        if not names:
+            raise CommandError("Name at least one benchmark: %s" %
+                               ', '.join(sorted(BENCHMARKS)))
+        for name in names:
+            if name not in BENCHMARKS:
+                raise CommandError("No benchmark named %s" % name)
+
+        # create the tables with the migrations (whatever SOUTH_TESTS_MIGRATE
+        # says), so that the indexes only they create are there
+        settings.SOUTH_TESTS_MIGRATE = True
+        patch_for_test_db_setup()
+        old_name = connection.creation.create_test_db(verbosity=0,
+                                                      autoclobber=True)
+        try:
+            call_command('loaddata', 'initial.json', verbosity=0)
+            for name in names:
+                self.stdout.write("%s\n" % name)
+                BENCHMARKS[name](self.stdout, options['requests'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
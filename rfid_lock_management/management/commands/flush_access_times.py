@@ -0,0 +1,11 @@
+from django.core.management.base import NoArgsCommand
+from rfid_lock_management.access_log import recover_spools
+
+
+class Command(NoArgsCommand):
+    help = ("Insert AccessTimes left in the spool by workers that are no "
+            "longer running (see ACCESS_TIME_LOGGING).")
+
+    def handle_noargs(self, **options):
+        recovered = recover_spools()
+        self.stdout.write("Inserted %d spooled access times.\n" % recovered)
@@ -0,0 +1,38 @@
+import os
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from rfid_lock_management import door_import
+
+
+class Command(BaseCommand):
+    args = '<file>'
+    help = ("Add the doors in a CSV or JSON file (see "
+            "rfid_lock_management/door_import.py), with who may manage them, "
+            "in one transaction. Doors already there are left as they are.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--format', choices=['csv', 'json'],
+                    help="'csv' or 'json' (default: from the file name's "
+                         "extension)."),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Name one file to import.")
+        path = args[0]
+        format = options['format'] or os.path.splitext(path)[1][1:].lower()
+        start = time.time()
+        try:
+            with open(path, 'rb') as stream:
+                doors = door_import.read_doors(stream, format)
+            result = door_import.import_doors(doors)
+        except (IOError, ValueError), e:
+            raise CommandError(e)
+        duration = time.time() - start
+        self.stdout.write(
+            "Imported %d doors (%d already there) and %d ACL entries in "
+            "%.2fs, %.0f doors/s.\n" % (
+                result.created, result.existing, result.acl_entries, duration,
+                len(doors) / duration if duration else 0))
@@ -0,0 +1,24 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from rfid_lock_management.models import AllowlistChange, Door
+
+
+class Command(NoArgsCommand):
+    help = ("Delete old AllowlistChanges, keeping the latest versions of each "
+            "Door. Controllers with an older version get the full allowlist.")
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--keep', type='int', default=1000,
+                    help='Number of versions to keep for each door '
+                         '(default 1000).'),
+    )
+
+    def handle_noargs(self, **options):
+        deleted = 0
+        for door_id, version in Door.objects.values_list('pk', 'allowlist_version'):
+            old_changes = AllowlistChange.objects.filter(
+                door=door_id, version__lte=version - options['keep'])
+            deleted += old_changes.count()
+            old_changes.delete()
+        self.stdout.write("Deleted %d allowlist changes.\n" % deleted)
@@ -0,0 +1,20 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from rfid_lock_management import rollups
+
+
+class Command(NoArgsCommand):
+    help = ("Empty the AccessTime rollups (HourlyAccessCount, "
+            "DailyAccessCount) and count every AccessTime again, a chunk at "
+            "a time.")
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--chunk-size', type='int', default=rollups.CHUNK_SIZE,
+                    help='AccessTimes counted per transaction (default %d).' %
+                         rollups.CHUNK_SIZE),
+    )
+
+    def handle_noargs(self, **options):
+        counted = rollups.rebuild(options['chunk_size'])
+        self.stdout.write("Counted %d access times.\n" % counted)
@@ -0,0 +1,12 @@
+from django.core.management.base import NoArgsCommand
+from rfid_lock_management.models import LockUser
+
+
+class Command(NoArgsCommand):
+    help = ("Work out every LockUser's current keycard and last access "
+            "(time and door) again from their keycards and AccessTimes, and "
+            "fix the ones stored wrong, say after AccessTimes were deleted.")
+
+    def handle_noargs(self, **options):
+        repaired = LockUser.objects.repair()
+        self.stdout.write("Repaired %d lock users.\n" % repaired)
@@ -0,0 +1,32 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from rfid_lock_management.models import NewKeycardScan
+
+
+class Command(NoArgsCommand):
+    help = ("Mark timed-out NewKeycardScans as no longer waiting for a scan, "
+            "and delete finished ones. Run it from cron every few minutes.")
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--timeout', type='int',
+                    default=NewKeycardScan.TIMEOUT_MINUTES,
+                    help='Minutes after which a scan times out (default %d).' %
+                         NewKeycardScan.TIMEOUT_MINUTES),
+        make_option('--keep-finished', type='int', default=60,
+                    help='Minutes to keep finished scans (default 60).'),
+        make_option('--keep-ready', type='int', default=24,
+                    help='Hours to keep scans whose keycard was never '
+                         'assigned (default 24).'),
+        make_option('--batch-size', type='int', default=1000,
+                    help='Scans deleted per query (default 1000).'),
+    )
+
+    def handle_noargs(self, **options):
+        marked, deleted = NewKeycardScan.objects.sweep(
+            timeout_minutes=options['timeout'],
+            keep_finished_minutes=options['keep_finished'],
+            keep_ready_hours=options['keep_ready'],
+            batch_size=options['batch_size'])
+        self.stdout.write("Timed out %d and deleted %d new keycard scans.\n" % (
+            marked, deleted))
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'AllowlistChange'
+        db.create_table('rfid_lock_management_allowlistchange', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('door', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['rfid_lock_management.Door'])),
+            ('version', self.gf('django.db.models.fields.PositiveIntegerField')(db_index=True)),
+            ('the_rfid', self.gf('django.db.models.fields.CharField')(max_length=10)),
+            ('added', self.gf('django.db.models.fields.BooleanField')(default=True)),
+        ))
+        db.send_create_signal('rfid_lock_management', ['AllowlistChange'])
+
+
+    def backwards(self, orm):
+        # Deleting model 'AllowlistChange'
+        db.delete_table('rfid_lock_management_allowlistchange')
+
+
+    models = {
+        'auth.group': {
+            'Meta': {'object_name': 'Group'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        'auth.permission': {
+            'Meta': {'ordering': "('content_type__app_label', 'content_type__model', 'codename')", 'unique_together': "(('content_type', 'codename'),)", 'object_name': 'Permission'},
+            'codename': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        'auth.user': {
+            'Meta': {'object_name': 'User'},
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'blank': 'True'}),
+            'first_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'groups': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Group']", 'symmetrical': 'False', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'last_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'user_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'}),
+            'username': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '30'})
+        },
+        'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        'rfid_lock_management.accesstime': {
+            'Meta': {'object_name': 'AccessTime'},
+            'access_time': ('django.db.models.fields.DateTimeField', [], {'null': 'True'}),
+            'data_point': ('django.db.models.fields.TextField', [], {}),
+            'door': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['rfid_lock_management.Door']", 'null': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'lockuser': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['rfid_lock_management.LockUser']", 'null': 'True'}),
+            'the_rfid': ('django.db.models.fields.CharField', [], {'max_length': '10', 'null': 'True'})
+        },
+        'rfid_lock_management.allowlistchange': {
+            'Meta': {'object_name': 'AllowlistChange'},
+            'added': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'door': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['rfid_lock_management.Door']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'the_rfid': ('django.db.models.fields.CharField', [], {'max_length': '10'}),
+            'version': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'})
+        },
+        'rfid_lock_management.door': {
+            'Meta': {'object_name': 'Door'},
+            'allowlist_version': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'description': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '50'})
+        },
+        'rfid_lock_management.lockuser': {
+            'Meta': {'object_name': 'LockUser'},
+            'address': ('django.db.models.fields.CharField', [], {'max_length': '100', 'blank': 'True'}),
+            'birthdate': ('django.db.models.fields.DateField', [], {'null': 'True'}),
+            'current_keycard_revoker': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['auth.User']", 'null': 'True'}),
+            'deactivate_current_keycard': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'doors': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['rfid_lock_management.Door']", 'symmetrical': 'False', 'blank': 'True'}),
+            'email': ('django.db.models.fields.EmailField', [], {'unique': 'True', 'max_length': '75'}),
+            'first_name': ('django.db.models.fields.CharField', [], {'max_length': '50'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_name': ('django.db.models.fields.CharField', [], {'max_length': '50'}),
+            'phone_number': ('django.db.models.fields.CharField', [], {'max_length': '20', 'null': 'True', 'blank': 'True'})
+        },
+        'rfid_lock_management.newkeycardscan': {
+            'Meta': {'object_name': 'NewKeycardScan'},
+            'assigner_user': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['auth.User']"}),
+            'doorid': ('django.db.models.fields.CharField', [], {'max_length': '50'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'ready_to_assign': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'rfid': ('django.db.models.fields.CharField', [], {'max_length': '10'}),
+            'time_initiated': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'waiting_for_scan': ('django.db.models.fields.BooleanField', [], {'default': 'True'})
+        },
+        'rfid_lock_management.rfidkeycard': {
+            'Meta': {'object_name': 'RFIDkeycard'},
+            'assigner': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'RFIDkeycard_assigned'", 'to': "orm['auth.User']"}),
+            'date_created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'date_revoked': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'lockuser': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['rfid_lock_management.LockUser']"}),
+            'revoker': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'RFIDkeycard_revoked'", 'null': 'True', 'to': "orm['auth.User']"}),
+            'the_rfid': ('django.db.models.fields.CharField', [], {'max_length': '10'})
+        }
+    }
+
+    complete_apps = ['rfid_lock_management']
\ No newline at end of file
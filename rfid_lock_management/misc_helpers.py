@@ -1,4 +1,5 @@
 import inspect
+import math
 
 # thanks,
 def get_arg_default(func, arg_name):
@@ -16,3 +17,15 @@ def get_arg_default(func, arg_name):
         raise ValueError("Parameter '%s' doesn't have a default value" % arg_name)
 
     return defaults[list(have_defaults).index(arg_name)]
+
+
+def finite_float(value):
+    """
+    float(value), for request parameters; ValueError if it isn't a number,
+    or is NaN or infinite (which would get through min() and max() as they
+    are).
+    """
+    number = float(value)
+    if math.isnan(number) or math.isinf(number):
+        raise ValueError("Not a finite number: %r" % value)
+    return number
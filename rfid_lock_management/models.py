@@ -4,10 +4,14 @@ from django.conf import settings
 from django.contrib.auth import models as auth_models
 from django.contrib.auth.management import create_superuser
 from django.db.models import signals
+from django.db.models.fields.related import ReverseManyRelatedObjectsDescriptor
+from django.core.signals import request_finished, request_started
 import datetime
 from termcolor import colored   # temp
-from django.contrib.contenttypes.models import ContentType
-from django.contrib.auth.models import Permission
+from django.contrib.auth.models import Group
+from django.core.exceptions import ValidationError
+from rfid_lock_management import door_permissions, scan_state
+from rfid_lock_management.access_index import authorization_index
 
 
 class Door(models.Model):
@@ -16,6 +20,10 @@ class Door(models.Model):
     """
     name = models.CharField(max_length=50, unique=True, null=False)
     description = models.TextField(null=True, blank=True)
+    # Goes up whenever the set of RFIDs allowed through this door changes
+    # (see record_allowlist_changes()), so lock controllers polling
+    # getallowed can tell whether their copy is current.
+    allowlist_version = models.PositiveIntegerField(default=0, editable=False)
 
     def __unicode__(self):
         """
@@ -24,32 +32,87 @@ class Door(models.Model):
         return self.name
 
     def save(self, *args, **kwargs):
+        # allowlist_version may have been bumped since this Door was fetched;
+        # don't write an old version back.
+        current_version = Door.objects.filter(pk=self.pk).values_list(
+            'allowlist_version', flat=True)
+        if self.pk and current_version:
+            self.allowlist_version = current_version[0]
+        super(Door, self).save(*args, **kwargs)
+
+    def get_allowed_rfids(self):
         """
-        When a new Door is added, create a corresponding Permission, if it does
-        not exist already.
+        Return the RFIDs (active RFIDkeycards) allowed to access this Door.
+        One query, joining RFIDkeycard, LockUser and the LockUser/Door M2M
+        table, however many lockusers the Door has.
         """
+        return list(RFIDkeycard.objects.filter(
+            lockuser__doors=self, date_revoked__isnull=True))
 
-        super(Door, self).save(*args, **kwargs)
 
-        if not Permission.objects.filter(codename='can_manage_door_%d' % self.pk):
-            content_type = ContentType.objects.get(
-                app_label='rfid_lock_management', model='door')
+class DoorACLEntry(models.Model):
+    """
+    An entry in a Door's access control list: the staff User, or every member
+    of the Group, may manage the Door (give LockUsers access to it, and so
+    on; see door_permissions.py). Exactly one of user and group is set.
+    """
+    door = models.ForeignKey(Door)
+    user = models.ForeignKey(User, null=True, blank=True)
+    group = models.ForeignKey(Group, null=True, blank=True)
 
-            Permission.objects.create(
-                codename='can_manage_door_%d' % self.pk,
-                name='Can manage door to %s' % self.name,
-                content_type=content_type
-            )
+    class Meta:
+        # (also the indexes for "which doors may this user or group manage")
+        unique_together = (('user', 'door'), ('group', 'door'))
+        verbose_name = 'door ACL entry'
+        verbose_name_plural = 'door ACL entries'
 
-    def get_allowed_rfids(self):
+    def __unicode__(self):
+        return u'%s may manage %s' % (self.user or self.group, self.door)
+
+    def clean(self):
+        if (self.user_id is None) == (self.group_id is None):
+            raise ValidationError("Choose either a user or a group.")
+
+
+class NewKeycardScanManager(models.Manager):
+
+    def sweep(self, timeout_minutes=2, keep_finished_minutes=60,
+              keep_ready_hours=24, batch_size=1000):
         """
-        Return the RFIDs allowed to access this Door
+        Mark NewKeycardScans that have been waiting for a scan for longer than
+        timeout_minutes as no longer waiting. Then delete, batch_size at a
+        time, those that are finished: no longer waiting and not ready to
+        assign (assigned, or timed out) for longer than keep_finished_minutes,
+        or ready to assign but left that way for longer than keep_ready_hours
+        (the lock user was never saved). Returns (number marked, number
+        deleted).
         """
-        allowed_rfids = []
-        for lu in self.lockuser_set.all():
-            if lu.get_current_rfid():
-                allowed_rfids.append(lu.get_current_rfid())
-        return allowed_rfids
+        now = datetime.datetime.now()
+        expired = self.filter(
+            waiting_for_scan=True,
+            time_initiated__lt=now - datetime.timedelta(minutes=timeout_minutes))
+        expired_scans = list(expired.values_list('pk', 'door', 'lockuser'))
+        marked = self.filter(pk__in=[pk for pk, door_id, lockuser_id
+                                     in expired_scans]).update(
+            waiting_for_scan=False)
+        # (update() doesn't send post_save)
+        for pk, door_id, lockuser_id in expired_scans:
+            scan_state.forget_scan(NewKeycardScan(door_id=door_id,
+                                                  lockuser_id=lockuser_id))
+
+        finished = self.filter(waiting_for_scan=False).filter(
+            models.Q(ready_to_assign=False, time_initiated__lt=now -
+                     datetime.timedelta(minutes=keep_finished_minutes)) |
+            models.Q(time_initiated__lt=now -
+                     datetime.timedelta(hours=keep_ready_hours)))
+        deleted = 0
+        while True:
+            pks = list(finished.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            self.filter(pk__in=pks).delete()
+            deleted += len(pks)
+        return marked, deleted
 
 
 class NewKeycardScan(models.Model):
@@ -57,6 +120,8 @@ class NewKeycardScan(models.Model):
     For checking whether the current request is for authenticating a keycard or
     assigning new keycard.
     """
+    # Minutes a staff user has to scan the new card
+    TIMEOUT_MINUTES = 2
 
     time_initiated = models.DateTimeField(auto_now_add=True)
     waiting_for_scan = models.BooleanField(default=True)
@@ -64,8 +129,15 @@ class NewKeycardScan(models.Model):
     rfid = models.CharField(max_length=10)   # rfid as in the request url
     ready_to_assign = models.BooleanField(default=False)
     assigner_user = models.ForeignKey(User)
+    # The door the new keycard will be scanned at -- only swipes at this door
+    # are taken for this scan -- and the lock user it will be assigned to.
+    # (Null for scans from before scans were bound to a door.)
+    door = models.ForeignKey(Door, null=True, blank=True)
+    lockuser = models.ForeignKey("LockUser", null=True, blank=True)
+
+    objects = NewKeycardScanManager()
 
-    def timed_out(self, minutes=2):
+    def timed_out(self, minutes=TIMEOUT_MINUTES):
         """
         Check whether specified number of minutes have passed since staff user
         indicated they were going to go scan in a card in order to assign it,
@@ -127,10 +199,10 @@ class AccessTime(models.Model):
     """ Represents a visit to a space
     """
     the_rfid = models.CharField(max_length=10, null=True)
-    access_time = models.DateTimeField(null=True)    # the time the rfid was used
+    # the time the rfid was used
+    access_time = models.DateTimeField(null=True, db_index=True)
     lockuser = models.ForeignKey("LockUser", null=True)
     door = models.ForeignKey("Door", null=True)
-    data_point = models.TextField()  # Issue #j
 
     def __unicode__(self):
         #return u'%s' % self.access_time
@@ -148,6 +220,101 @@ class AccessTime(models.Model):
     get_this_lockuser_html.allow_tags = True
 
 
+class AllowlistChange(models.Model):
+    """
+    Journal of the changes to the RFIDs allowed through a Door: the_rfid was
+    added to (or revoked from) the Door's allowlist, and the Door's
+    allowlist_version became version.  Lets lock controllers fetch only what
+    changed since the version they have.
+    """
+    door = models.ForeignKey(Door)
+    version = models.PositiveIntegerField(db_index=True)
+    the_rfid = models.CharField(max_length=10)
+    added = models.BooleanField(default=True)   # False: revoked
+
+
+class HourlyAccessCount(models.Model):
+    """
+    Rollup of AccessTime (kept by rollups.py): the number of times the
+    LockUser went through the Door in the hour starting at hour.
+    """
+    door = models.ForeignKey(Door)
+    lockuser = models.ForeignKey("LockUser", null=True)
+    hour = models.DateTimeField(db_index=True)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (('door', 'lockuser', 'hour'),)
+
+
+class DailyAccessCount(models.Model):
+    """
+    Rollup of AccessTime (kept by rollups.py): the number of times the
+    LockUser went through the Door on day.
+    """
+    door = models.ForeignKey(Door)
+    lockuser = models.ForeignKey("LockUser", null=True)
+    day = models.DateField(db_index=True)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (('door', 'lockuser', 'day'),)
+
+
+class LockUserManager(models.Manager):
+
+    def record_accesses(self, access_times):
+        """
+        Bring the last_access_time and last_access_door of the LockUsers of
+        the (saved) AccessTimes up to date: each gets their latest one,
+        unless they have been through a door since. One query per LockUser.
+        Also counts the AccessTimes in the rollups (see rollups.py).
+        """
+        # imported here since rollups.py imports this module
+        from rfid_lock_management import rollups
+        rollups.record(access_times)
+        latest = {}
+        for at in access_times:
+            if at.lockuser_id is None or at.access_time is None:
+                continue
+            if (at.lockuser_id not in latest or
+                    at.access_time >= latest[at.lockuser_id].access_time):
+                latest[at.lockuser_id] = at
+        for lockuser_id, at in latest.items():
+            self.filter(pk=lockuser_id).filter(
+                models.Q(last_access_time__isnull=True) |
+                models.Q(last_access_time__lte=at.access_time)).update(
+                last_access_time=at.access_time,
+                last_access_door=at.door_id)
+
+    def repair(self):
+        """
+        Work out current_keycard, last_access_time and last_access_door of
+        every LockUser again from RFIDkeycard and AccessTime, and store them
+        where they were out of date (say, after AccessTimes were deleted).
+        Returns the number of LockUsers repaired.
+        """
+        current_keycards = dict(RFIDkeycard.objects.filter(
+            date_revoked__isnull=True).order_by('pk').values_list(
+            'lockuser', 'pk'))
+        repaired = 0
+        for row in self.values_list('pk', 'current_keycard',
+                                    'last_access_time',
+                                    'last_access_door').iterator():
+            pk, stored = row[0], row[1:]
+            last_accesses = AccessTime.objects.filter(
+                lockuser=pk, access_time__isnull=False).order_by(
+                '-access_time', '-pk').values_list('access_time', 'door')[:1]
+            last_access = last_accesses[0] if last_accesses else (None, None)
+            actual = (current_keycards.get(pk),) + tuple(last_access)
+            if tuple(stored) != actual:
+                self.filter(pk=pk).update(current_keycard=actual[0],
+                                          last_access_time=actual[1],
+                                          last_access_door=actual[2])
+                repaired += 1
+        return repaired
+
+
 class LockUser(models.Model):
     """
     (Despite the misleading name, LockUsers are not subclassed Users, but
@@ -164,6 +331,20 @@ class LockUser(models.Model):
     deactivate_current_keycard = models.BooleanField(default=False)
     deactivate_current_keycard.help_text = "Revoke keycard access and deactivate user."
     current_keycard_revoker = models.ForeignKey(User, null=True)
+    # Stored so that lists of LockUsers don't have to look them up for every
+    # one: the active keycard (see keycard_changed()), and the time and door
+    # of the latest AccessTime (see LockUserManager.record_accesses()).
+    # "manage.py repair_lockusers" works them out again.
+    current_keycard = models.ForeignKey(
+        RFIDkeycard, null=True, blank=True, editable=False, related_name='+',
+        on_delete=models.SET_NULL)
+    last_access_time = models.DateTimeField(null=True, blank=True,
+                                            editable=False)
+    last_access_door = models.ForeignKey(
+        Door, null=True, blank=True, editable=False, related_name='+',
+        on_delete=models.SET_NULL)
+
+    objects = LockUserManager()
 
     def save(self, *args, **kwargs):
         """
@@ -174,6 +355,13 @@ class LockUser(models.Model):
             - If we're assigning a new keycard, the keycard is created and
               saved here.
         """
+        # The current keycard and last access may have changed since this
+        # LockUser was fetched; don't write old ones back.
+        stored = LockUser.objects.filter(pk=self.pk).values_list(
+            'current_keycard', 'last_access_time', 'last_access_door')
+        if self.pk and stored:
+            (self.current_keycard_id, self.last_access_time,
+             self.last_access_door_id) = stored[0]
         # Since rfid_lock_management_rfidkeycard.lockuser_id may not be NULL
         # when saving RFIDkeycard object, we need to save the LockUser object
         # first, so we can get self.id (which is also necessary before any work
@@ -185,16 +373,14 @@ class LockUser(models.Model):
         # admin.py), but doors may not have been saved yet, so checking
         # self.doors.exists() would be misleading.
         #if self.doors.exists():
-        new_scan_queryset = NewKeycardScan.objects.all()
-        if new_scan_queryset:
-            # get last created NewKeycardScan object
-            new_scan = new_scan_queryset.latest("pk")
-            # Note:  this --
-            #   new_scan = new_scan_queryset.latest("time_initiated")
-            # -- may not actually return the latest created object if 'start
-            # scan' was hit a bunch of times in a row -- microseconds don't seem
-            # to be at sufficient resolution to actually get the latest object.
-            if new_scan.ready_to_assign:
+        # Is there a NewKeycardScan ready to assign to this LockUser? (Asking
+        # the scan state registry costs no queries in the usual case.)
+        new_scan_pk = scan_state.ready_for_lockuser(self.pk)
+        if new_scan_pk:
+            new_scans = NewKeycardScan.objects.filter(
+                pk=new_scan_pk).select_related('assigner_user')
+            # (check again: the registry may be a moment behind)
+            for new_scan in new_scans.filter(ready_to_assign=True):
                 new_scan.ready_to_assign = False
                 new_scan.save()  # save new_scan before saving new_keycard
                 # assign the rfid from the keycard that was just scanned
@@ -214,6 +400,7 @@ class LockUser(models.Model):
             current_keycard.deactivate(self.current_keycard_revoker)
             # save keycard since have changed it
             current_keycard.save()
+            self.current_keycard = None
             # todo: consider putting the following two statements into
             # deactivate()
             # no current keycard to deactivate anymore
@@ -270,15 +457,15 @@ class LockUser(models.Model):
         """
         Useful in LockUser's list display
         """
-        return self.get_current_rfid() is not None
+        return self.current_keycard_id is not None
 
     def prettify_get_current_rfid(self):
         """
-        Returns results of get_current_rfid(), but as a nice pretty string.
+        Returns the current keycard, but as a nice pretty string.
         Also display date assigned as well as rfid number on LockUser change
         form and list display.
         """
-        curr_rfid = self.get_current_rfid()
+        curr_rfid = self.current_keycard
         try:
             curr_keycard_info = "RFID: %s (activated on %s by %s)" % (
                 curr_rfid.the_rfid,
@@ -296,9 +483,8 @@ class LockUser(models.Model):
         return self.doors.all()
 
     def prettify_get_allowed_doors(self):
-        allowed_doors = self.get_allowed_doors()
-        door_names_list = allowed_doors.values_list('name', flat=True)
-        return ", ".join(door_names_list)
+        # (iterating, rather than values_list, uses prefetched doors)
+        return ", ".join(door.name for door in self.get_allowed_doors())
 
     def get_allowed_doors_html_links(self):
         """
@@ -335,13 +521,7 @@ class LockUser(models.Model):
         Same story with current RFID vs previous one as in the
         comment for get_all_access_time().
         """
-        access_times = self.get_all_access_times()
-
-        # grab the last one
-        if access_times:
-            return access_times[-1]
-        else:
-            return None
+        return self.last_access_time
 
     def prettify_get_last_access_time(self):
         last = self.get_last_access_time()
@@ -354,10 +534,11 @@ class LockUser(models.Model):
         """
         Includes the door this access time is associated with (for change list)
         """
-        # todo: note - a different appraoch than similar methods
-        at_query_set = AccessTime.objects.filter(lockuser=self)
-        last = at_query_set.latest('access_time')
-        return last.access_time.strftime("%B %d, %Y, %I:%M %p") + " (" + last.door.name + ")"
+        if not self.last_access_time:
+            return None
+        return "%s (%s)" % (
+            self.last_access_time.strftime("%B %d, %Y, %I:%M %p"),
+            self.last_access_door.name if self.last_access_door else None)
 
     def last_access_time_and_link_to_more(self):
         """
@@ -375,21 +556,12 @@ class LockUser(models.Model):
         """
         Including link to all access times (for change form)
         """
-        # todo: note - a different appraoch than similar methods
-        at_query_set = AccessTime.objects.filter(lockuser=self)
-        last = at_query_set.latest('access_time')
+        last_time_and_door = self.prettify_get_last_access_time_and_door()
         link = self.all_access_times_link()
-        """
-        if last:
-            return "%s (%s) (%s)" % (last.access_time.strftime("%B %d, %Y, %I:%M %p"), last.door.name, link)
+        if last_time_and_door:
+            return "%s (%s)" % (last_time_and_door, link)
         else:
             return None
-        """
-        # todo (see __B__)
-        return_val = None
-        if last:
-            return_val = "%s (%s) (%s)" % (last.access_time.strftime("%B %d, %Y, %I:%M %p"), last.door.name, link)
-        return return_val
     last_access_time_and_door_and_link_to_more.allow_tags = True
     last_access_time_and_door_and_link_to_more.short_description = "Last access"
 
@@ -401,6 +573,349 @@ class LockUser(models.Model):
             self.first_name, self.last_name)
 
 
+####################################################################
+# Keep the in-process authorization index (see access_index.py) current.
+####################################################################
+def invalidate_authorization_index(sender, **kwargs):
+    """
+    Any change to a LockUser's doors, to an RFIDkeycard or to a Door may change
+    which RFIDs are allowed through which doors. (Again once committed: see
+    access_index.py.)
+    """
+    authorization_index.invalidate_on_commit()
+
+
+def invalidate_pending_authorization_index(sender, **kwargs):
+    authorization_index.invalidate_pending()
+
+
+def clear_pending_authorization_index(sender, **kwargs):
+    authorization_index.clear_pending()
+
+for model in (LockUser, RFIDkeycard, Door):
+    signals.post_save.connect(
+        invalidate_authorization_index, sender=model,
+        dispatch_uid='rfid_lock_management.post_save.%s' % model.__name__)
+    signals.post_delete.connect(
+        invalidate_authorization_index, sender=model,
+        dispatch_uid='rfid_lock_management.post_delete.%s' % model.__name__)
+signals.m2m_changed.connect(
+    invalidate_authorization_index, sender=LockUser.doors.through,
+    dispatch_uid='rfid_lock_management.m2m_changed.LockUser.doors')
+request_started.connect(
+    clear_pending_authorization_index,
+    dispatch_uid='rfid_lock_management.request_started.authorization_index')
+request_finished.connect(
+    invalidate_pending_authorization_index,
+    dispatch_uid='rfid_lock_management.request_finished.authorization_index')
+
+
+####################################################################
+# Keep LockUser.current_keycard and last access current.
+####################################################################
+def keycard_changed(sender, instance, **kwargs):
+    """
+    A keycard was assigned or revoked.
+    """
+    lockusers = LockUser.objects.filter(pk=instance.lockuser_id)
+    # (and the LockUser it was saved with, if any)
+    lockuser = instance.__dict__.get('_lockuser_cache')
+    if instance.is_active():
+        lockusers.update(current_keycard=instance)
+        if lockuser is not None:
+            lockuser.current_keycard = instance
+    else:
+        lockusers.filter(current_keycard=instance).update(current_keycard=None)
+        if lockuser is not None and lockuser.current_keycard_id == instance.pk:
+            lockuser.current_keycard = None
+
+
+def access_time_saved(sender, instance, created, raw, **kwargs):
+    """
+    An AccessTime was logged. (Bulk inserts call
+    LockUser.objects.record_accesses() themselves.)
+    """
+    if not created or raw or instance.access_time is None:
+        return
+    LockUser.objects.record_accesses([instance])
+    lockuser = instance.__dict__.get('_lockuser_cache')
+    if lockuser is not None and (
+            lockuser.last_access_time is None or
+            lockuser.last_access_time <= instance.access_time):
+        lockuser.last_access_time = instance.access_time
+        lockuser.last_access_door_id = instance.door_id
+        lockuser.__dict__.pop('_last_access_door_cache', None)
+
+signals.post_save.connect(
+    keycard_changed, sender=RFIDkeycard,
+    dispatch_uid='rfid_lock_management.current_keycard.post_save.RFIDkeycard')
+signals.post_save.connect(
+    access_time_saved, sender=AccessTime,
+    dispatch_uid='rfid_lock_management.last_access.post_save.AccessTime')
+
+
+####################################################################
+# Journal changes to the RFIDs allowed through each Door, bumping the
+# Door's allowlist_version.
+####################################################################
+def record_allowlist_changes(changes):
+    """
+    Record changes to the RFIDs allowed through Doors, given as (door_id,
+    rfid, added) tuples: bump the allowlist_version of each Door affected, and
+    journal the changes (AllowlistChange) under the new version.
+    """
+    changes = list(changes)
+    if not changes:
+        return
+    door_ids = set(door_id for door_id, rfid, added in changes)
+    Door.objects.filter(pk__in=door_ids).update(
+        allowlist_version=models.F('allowlist_version') + 1)
+    versions = dict(Door.objects.filter(pk__in=door_ids).values_list(
+        'pk', 'allowlist_version'))
+    AllowlistChange.objects.bulk_create([
+        AllowlistChange(door_id=door_id, version=versions[door_id],
+                        the_rfid=rfid, added=added)
+        for door_id, rfid, added in changes if door_id in versions])
+    # imported here since allowlists.py imports this module
+    from rfid_lock_management.allowlists import notify_versions
+    notify_versions(versions)
+
+
+def lockuser_door_ids(lockuser_id):
+    """
+    pks of the Doors this LockUser is allowed access to (without fetching
+    the LockUser itself)
+    """
+    return LockUser.doors.through.objects.filter(
+        lockuser=lockuser_id).values_list('door_id', flat=True)
+
+
+def active_rfids(lockuser_ids):
+    """
+    RFIDs of the active keycards of these LockUsers
+    """
+    return RFIDkeycard.objects.filter(
+        lockuser__in=lockuser_ids, date_revoked__isnull=True).values_list(
+            'the_rfid', flat=True)
+
+
+def lockuser_doors_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Doors were added to or removed from a LockUser (or, in reverse, LockUsers
+    added to or removed from a Door). While LockUser.doors is being assigned
+    to (see DoorsDescriptor), the Doors cleared are kept until the new ones
+    are added, and only the difference journaled.
+    """
+    if action == 'pre_clear':
+        # what is about to be cleared
+        if reverse:
+            instance._cleared_pks = set(LockUser.doors.through.objects.filter(
+                door=instance.pk).values_list('lockuser_id', flat=True))
+        else:
+            instance._cleared_pks = set(lockuser_door_ids(instance.pk))
+        return
+    if action == 'post_clear':
+        if instance.__dict__.get('_assigning_doors'):
+            return
+        revoked_pks = instance.__dict__.pop('_cleared_pks', set())
+        added_pks = set()
+    elif action == 'post_add':
+        revoked_pks = set()
+        added_pks = set(pk_set)
+        if instance.__dict__.get('_assigning_doors'):
+            cleared_pks = instance.__dict__.pop('_cleared_pks', set())
+            revoked_pks = cleared_pks - added_pks
+            added_pks -= cleared_pks
+    elif action == 'post_remove':
+        revoked_pks = set(pk_set)
+        added_pks = set()
+    else:
+        return
+    if reverse:
+        # instance is a Door, the pks LockUser pks
+        changes = [(instance.pk, rfid, added)
+                   for pks, added in ((added_pks, True), (revoked_pks, False))
+                   if pks for rfid in active_rfids(pks)]
+    else:
+        rfids = list(active_rfids([instance.pk])) if (
+            added_pks or revoked_pks) else []
+        changes = [(door_id, rfid, added)
+                   for pks, added in ((added_pks, True), (revoked_pks, False))
+                   for door_id in pks for rfid in rfids]
+    record_allowlist_changes(changes)
+
+
+class DoorsDescriptor(ReverseManyRelatedObjectsDescriptor):
+    """
+    LockUser.doors. Assigning to it (as the admin does on every save) clears
+    the Doors and then adds the new ones; lockuser_doors_changed journals
+    the difference once they are added, rather than revoking and granting
+    every Door again -- or, if none are, the Doors cleared as revoked here.
+    """
+
+    def __set__(self, instance, value):
+        instance._assigning_doors = True
+        try:
+            super(DoorsDescriptor, self).__set__(instance, value)
+        finally:
+            del instance._assigning_doors
+            cleared_pks = instance.__dict__.pop('_cleared_pks', None)
+            if cleared_pks:
+                rfids = list(active_rfids([instance.pk]))
+                record_allowlist_changes(
+                    (door_id, rfid, False)
+                    for door_id in cleared_pks for rfid in rfids)
+
+LockUser.doors = DoorsDescriptor(LockUser._meta.get_field('doors'))
+
+
+def allowed_by_keycard(lockuser_id, rfid):
+    """
+    (door_id, rfid) of the Doors an active keycard lets through
+    """
+    return set((door_id, rfid) for door_id in lockuser_door_ids(lockuser_id))
+
+
+def keycard_about_to_be_saved(sender, instance, **kwargs):
+    """
+    Keep what the keycard (as stored) allowed, for keycard_saved to compare.
+    """
+    instance._allowed_before = set()
+    if instance.pk is not None:
+        for lockuser_id, rfid in RFIDkeycard.objects.filter(
+                pk=instance.pk, date_revoked__isnull=True).values_list(
+                'lockuser_id', 'the_rfid'):
+            instance._allowed_before = allowed_by_keycard(lockuser_id, rfid)
+
+
+def keycard_saved(sender, instance, **kwargs):
+    """
+    A keycard was assigned or revoked (or its RFID changed); saving it
+    otherwise changes nothing.
+    """
+    before = instance.__dict__.pop('_allowed_before', set())
+    after = set()
+    if instance.is_active():
+        after = allowed_by_keycard(instance.lockuser_id, instance.the_rfid)
+    record_allowlist_changes(
+        [(door_id, rfid, False) for door_id, rfid in before - after] +
+        [(door_id, rfid, True) for door_id, rfid in after - before])
+
+
+def keycard_deleted(sender, instance, **kwargs):
+    record_allowlist_changes(
+        (door_id, instance.the_rfid, False)
+        for door_id in lockuser_door_ids(instance.lockuser_id))
+
+
+def lockuser_about_to_be_deleted(sender, instance, **kwargs):
+    instance._revoked_on_delete = [
+        (door_id, rfid, False)
+        for door_id in lockuser_door_ids(instance.pk)
+        for rfid in active_rfids([instance.pk])]
+
+
+def lockuser_deleted(sender, instance, **kwargs):
+    record_allowlist_changes(instance.__dict__.pop('_revoked_on_delete', []))
+
+signals.m2m_changed.connect(
+    lockuser_doors_changed, sender=LockUser.doors.through,
+    dispatch_uid='rfid_lock_management.allowlist_version.LockUser.doors')
+signals.pre_save.connect(
+    keycard_about_to_be_saved, sender=RFIDkeycard,
+    dispatch_uid='rfid_lock_management.allowlist_version.pre_save.RFIDkeycard')
+signals.post_save.connect(
+    keycard_saved, sender=RFIDkeycard,
+    dispatch_uid='rfid_lock_management.allowlist_version.post_save.RFIDkeycard')
+signals.post_delete.connect(
+    keycard_deleted, sender=RFIDkeycard,
+    dispatch_uid='rfid_lock_management.allowlist_version.post_delete.RFIDkeycard')
+signals.pre_delete.connect(
+    lockuser_about_to_be_deleted, sender=LockUser,
+    dispatch_uid='rfid_lock_management.allowlist_version.pre_delete.LockUser')
+signals.post_delete.connect(
+    lockuser_deleted, sender=LockUser,
+    dispatch_uid='rfid_lock_management.allowlist_version.post_delete.LockUser')
+
+
+####################################################################
+# Keep the scan state registry (see scan_state.py) current.
+####################################################################
+def new_keycard_scan_changed(sender, instance, **kwargs):
+    scan_state.forget_scan(instance)
+
+
+def new_keycard_scan_saved(sender, instance, **kwargs):
+    # for anyone waiting on the swipe (views.wait_new_keycard_scan)
+    if instance.rfid and instance.waiting_for_scan:
+        scan_state.notify_scanned(instance)
+
+signals.post_save.connect(
+    new_keycard_scan_saved, sender=NewKeycardScan,
+    dispatch_uid='rfid_lock_management.post_save.NewKeycardScan.rfid')
+signals.post_save.connect(
+    new_keycard_scan_changed, sender=NewKeycardScan,
+    dispatch_uid='rfid_lock_management.post_save.NewKeycardScan')
+signals.post_delete.connect(
+    new_keycard_scan_changed, sender=NewKeycardScan,
+    dispatch_uid='rfid_lock_management.post_delete.NewKeycardScan')
+
+
+####################################################################
+# Keep the cache of the Doors each staff User may manage (see
+# door_permissions.py) current.
+####################################################################
+def user_changed(sender, instance, **kwargs):
+    # (say, made inactive, or a superuser)
+    door_permissions.forget_user(instance.pk)
+
+
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Groups were added to or removed from a User (or, in reverse, Users to or
+    from a Group).
+    """
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        door_permissions.forget_user(instance.pk)
+    elif pk_set:
+        for user_id in pk_set:
+            door_permissions.forget_user(user_id)
+    else:
+        # (cleared: which Users isn't known any more)
+        door_permissions.invalidate()
+
+
+def door_acl_changed(sender, **kwargs):
+    """
+    A DoorACLEntry was saved or deleted (say, with its Door, User or Group),
+    or a Door added (superusers may manage every Door).
+    """
+    if sender is Door and not kwargs['created']:
+        return
+    door_permissions.invalidate()
+
+signals.post_save.connect(
+    user_changed, sender=User,
+    dispatch_uid='rfid_lock_management.door_permissions.post_save.User')
+signals.post_delete.connect(
+    user_changed, sender=User,
+    dispatch_uid='rfid_lock_management.door_permissions.post_delete.User')
+signals.m2m_changed.connect(
+    user_groups_changed, sender=User.groups.through,
+    dispatch_uid='rfid_lock_management.door_permissions.m2m_changed.User')
+for model in (DoorACLEntry, Door):
+    signals.post_save.connect(
+        door_acl_changed, sender=model,
+        dispatch_uid='rfid_lock_management.door_permissions.post_save.%s'
+                     % model.__name__)
+signals.post_delete.connect(
+    door_acl_changed, sender=DoorACLEntry,
+    dispatch_uid='rfid_lock_management.door_permissions.post_delete.'
+                 'DoorACLEntry')
+
+
 ####################################################################
 # Prevent interactive question about wanting a superuser created.
 ####################################################################
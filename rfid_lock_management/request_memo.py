@@ -0,0 +1,25 @@
+"""
+Values worked out once per request and shared by everything handling it: a
+LockUser change form, for instance, needs the Doors the staff user may
+manage (LockUserAdmin.get_doors_to_show) for the doors field, the doors to
+scan a new keycard at and the "Doors you manage" line of every admin page
+(custom_filters.get_doors_you_manage), and the lock user's Doors the staff
+user may not manage (LockUserAdmin.get_other_doors) for the change view,
+every form instantiated and the note under the doors field.
+
+The values are kept on the request object itself, so they go away with it.
+"""
+
+MEMO_ATTRIBUTE = '_rfid_lock_management_memo'
+
+
+def memoize(request, key, compute):
+    """
+    compute() the first time the key is asked for during the request; what
+    it returned then every other time. Keys should include whatever else the
+    value depends on, such as request.user.pk.
+    """
+    memo = request.__dict__.setdefault(MEMO_ATTRIBUTE, {})
+    if key not in memo:
+        memo[key] = compute()
+    return memo[key]
@@ -0,0 +1,127 @@
+"""
+Rollups of AccessTime: HourlyAccessCount and DailyAccessCount hold the number
+of AccessTimes per door, lock user and hour or day, so that questions like
+visits per door per hour or unique users per day, and the chart and the
+AccessTime admin's date drilldown, cost in proportion to the time range asked
+about rather than to every swipe ever recorded.
+
+The rollups are kept up to date as AccessTimes are written: record() counts
+them, called by the post_save handler for AccessTime (see models.py) and by
+the bulk inserts (see access_log.py and swipes.py), which go through
+LockUser.objects.record_accesses() too. "manage.py rebuild_access_rollups"
+counts the whole history again, after AccessTimes are loaded some other way
+(loaddata doesn't count them) or if the rollups are ever off.
+
+AccessTimes are never changed once inserted, and only deleted along with
+their LockUser or Door, which deletes the rollup rows for them too.
+AccessTimes with no door or no access_time aren't counted.
+"""
+import collections
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from rfid_lock_management.models import (AccessTime, DailyAccessCount,
+                                          HourlyAccessCount)
+
+# AccessTimes counted per transaction by rebuild()
+CHUNK_SIZE = 10000
+
+
+def record(access_times):
+    """
+    Count the (saved) AccessTimes in the rollups. A few queries, however
+    many there are.
+    """
+    rows = [(at.door_id, at.lockuser_id, at.access_time)
+            for at in access_times]
+    if transaction.is_managed():
+        # (in the caller's transaction, which rolls back with it)
+        return _add(rows)
+    for attempt in range(3):
+        try:
+            with transaction.commit_on_success():
+                return _add(rows)
+        except IntegrityError:
+            # Another process created one of the same rows first; it's
+            # there now, so the next try adds to it.
+            if attempt == 2:
+                raise
+
+
+def rebuild(chunk_size=CHUNK_SIZE):
+    """
+    Empty the rollups and count every AccessTime again, chunk_size at a
+    time. Returns the number of AccessTimes counted.
+
+    The ones inserted while this runs, after the rollups are emptied, are
+    counted by record() as they are written rather than here. (An insert
+    still uncommitted when they are emptied may be counted twice: run it
+    while the doors are quiet.)
+    """
+    with transaction.commit_on_success():
+        HourlyAccessCount.objects.all().delete()
+        DailyAccessCount.objects.all().delete()
+        last_pk = AccessTime.objects.aggregate(last=Max('pk'))['last'] or 0
+    counted = 0
+    for start in range(0, last_pk, chunk_size):
+        with transaction.commit_on_success():
+            counted += _add(AccessTime.objects.filter(
+                pk__gt=start, pk__lte=min(start + chunk_size, last_pk),
+                door__isnull=False, access_time__isnull=False).values_list(
+                'door', 'lockuser', 'access_time').iterator())
+    return counted
+
+
+def _add(rows):
+    """
+    Count the (door id, lock user id, access_time) rows in the rollups.
+    Returns how many were counted.
+    """
+    hourly = collections.Counter()
+    daily = collections.Counter()
+    for door_id, lockuser_id, access_time in rows:
+        if door_id is None or access_time is None:
+            continue
+        hourly[door_id, lockuser_id, access_time.replace(
+            minute=0, second=0, microsecond=0)] += 1
+        daily[door_id, lockuser_id, access_time.date()] += 1
+    _add_counts(HourlyAccessCount, 'hour', hourly)
+    _add_counts(DailyAccessCount, 'day', daily)
+    return sum(daily.values())
+
+
+def _add_counts(model, bucket_field, counts):
+    """
+    Add the counts, by (door id, lock user id, hour or day), to the
+    rollup's rows, creating the ones there aren't yet. A few queries per
+    chunk: the rows already there are looked up together (AccessTimes come
+    in roughly in time order, so the chunk's buckets span a short range)
+    and updated together by how much is added to them.
+    """
+    if not counts:
+        return
+    buckets = [bucket for door_id, lockuser_id, bucket in counts]
+    existing = model.objects.filter(**{
+        bucket_field + '__range': (min(buckets), max(buckets)),
+        'door__in': set(door_id for door_id, lockuser_id, bucket in counts)})
+    pks = dict(((door_id, lockuser_id, bucket), pk)
+               for pk, door_id, lockuser_id, bucket in existing.values_list(
+                   'pk', 'door', 'lockuser', bucket_field))
+
+    pks_by_increment = collections.defaultdict(list)
+    new_rows = []
+    for (door_id, lockuser_id, bucket), count in counts.items():
+        if (door_id, lockuser_id, bucket) in pks:
+            pks_by_increment[count].append(pks[door_id, lockuser_id, bucket])
+        else:
+            new_rows.append(model(door_id=door_id, lockuser_id=lockuser_id,
+                                  count=count, **{bucket_field: bucket}))
+    # (in chunks: SQLite limits the number of parameters per query)
+    for count, increment_pks in pks_by_increment.items():
+        for chunk in range(0, len(increment_pks), 100):
+            model.objects.filter(
+                pk__in=increment_pks[chunk:chunk + 100]).update(
+                count=F('count') + count)
+    for chunk in range(0, len(new_rows), 100):
+        model.objects.bulk_create(new_rows[chunk:chunk + 100])
+
@@ -0,0 +1,131 @@
+"""
+Registry of pending new keycard scans (NewKeycardScan enrollment sessions),
+kept in the Django cache, so that views.check and LockUser.save, which only
+need to know whether there is a new keycard scan to take care of, don't query
+the NewKeycardScan table every time (in the usual case, there isn't).
+
+Each session is bound to a Door (where the keycard will be scanned) and a
+LockUser (who will get the keycard), and the registry is kept per Door --
+the session waiting for a scan at that door, if any -- and per LockUser --
+the session whose RFID is ready to be assigned to them, if any -- so that
+sessions at different doors don't get in each other's way.
+
+Signal handlers in models.py call forget_scan() whenever a NewKeycardScan is
+saved (by initiate_new_keycard_scan, finished_new_keycard_scan, check and
+LockUser.save) or deleted, and the entries for its door and lockuser are
+looked up again (one indexed query) next time. As with the authorization
+index, with more than one worker process CACHES must point at a shared backend
+for the other workers to see the change right away;
+NEW_KEYCARD_SCAN_STATE_MAX_AGE bounds how long they can otherwise miss it.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+DOOR_CACHE_KEY = 'rfid_lock_management:new_keycard_scan:door:%s'
+LOCKUSER_CACHE_KEY = 'rfid_lock_management:new_keycard_scan:lockuser:%s'
+RFID_HINT_CACHE_KEY = 'rfid_lock_management:new_keycard_scan:rfid:%s'  # scan
+RFID_HINT_SECONDS = 5 * 60
+
+# cached for "no such NewKeycardScan" (None would be a cache miss)
+NO_SCAN = 0
+
+
+def waiting_at_door(door_id):
+    """
+    pk of the latest NewKeycardScan waiting for a scan at the Door (and not
+    timed out), or None.
+    """
+    # imported here since models.py imports this module
+    from rfid_lock_management.models import NewKeycardScan
+
+    started_after = datetime.datetime.now() - datetime.timedelta(
+        minutes=NewKeycardScan.TIMEOUT_MINUTES)
+    return _get(DOOR_CACHE_KEY % int(door_id), NewKeycardScan.objects.filter(
+        door=door_id, waiting_for_scan=True, time_initiated__gte=started_after))
+
+
+def ready_for_lockuser(lockuser_id):
+    """
+    pk of the latest NewKeycardScan whose RFID is ready to be assigned to the
+    LockUser, or None.
+    """
+    from rfid_lock_management.models import NewKeycardScan
+
+    return _get(LOCKUSER_CACHE_KEY % int(lockuser_id),
+                NewKeycardScan.objects.filter(lockuser=lockuser_id,
+                                              ready_to_assign=True))
+
+
+def forget_scan(scan):
+    """
+    The NewKeycardScan was saved or deleted: look up its door's and
+    lockuser's entries again next time.
+    """
+    keys = []
+    if scan.door_id is not None:
+        keys.append(DOOR_CACHE_KEY % scan.door_id)
+    if scan.lockuser_id is not None:
+        keys.append(LOCKUSER_CACHE_KEY % scan.lockuser_id)
+    cache.delete_many(keys)
+
+
+def notify_scanned(scan):
+    """
+    Let wait_for_rfid() calls, in any worker sharing the cache, know that the
+    NewKeycardScan has an RFID now.
+    """
+    cache.set(RFID_HINT_CACHE_KEY % scan.pk, scan.rfid, RFID_HINT_SECONDS)
+
+
+def wait_for_rfid(new_scan_pk, timeout):
+    """
+    Wait until a swipe has been recorded on the NewKeycardScan (it has an
+    RFID), it is no longer waiting for a scan or has timed out, or timeout
+    seconds have passed, and return the NewKeycardScan then (None if there is no such
+    NewKeycardScan).
+
+    As allowlists.wait_for_change does: while waiting only the cache is
+    polled (every NEW_KEYCARD_SCAN_WAIT_POLL_SECONDS) for notify_scanned()'s
+    hint, the database is checked when there is one and otherwise every
+    NEW_KEYCARD_SCAN_WAIT_RECHECK_SECONDS, and the database connection is
+    let go of in between.
+    """
+    from rfid_lock_management.models import NewKeycardScan
+
+    deadline = time.time() + timeout
+    hint_key = RFID_HINT_CACHE_KEY % int(new_scan_pk)
+    next_check = 0
+    while True:
+        now = time.time()
+        if cache.get(hint_key) or now >= next_check or now >= deadline:
+            new_scans = NewKeycardScan.objects.filter(pk=new_scan_pk)
+            if not new_scans:
+                return None
+            new_scan = new_scans[0]
+            if (new_scan.rfid or not new_scan.waiting_for_scan or
+                    new_scan.timed_out() or now >= deadline):
+                return new_scan
+            next_check = now + getattr(
+                settings, 'NEW_KEYCARD_SCAN_WAIT_RECHECK_SECONDS', 10)
+            if not transaction.is_managed():
+                connection.close()
+        time.sleep(min(getattr(settings, 'NEW_KEYCARD_SCAN_WAIT_POLL_SECONDS',
+                               0.5),
+                       deadline - now))
+
+
+def _get(key, queryset):
+    pk = cache.get(key)
+    if pk is None:
+        pks = queryset.order_by('-pk').values_list('pk', flat=True)[:1]
+        pk = pks[0] if pks else NO_SCAN
+        cache.set(key, pk, _max_age())
+    return pk or None
+
+
+def _max_age():
+    return getattr(settings, 'NEW_KEYCARD_SCAN_STATE_MAX_AGE', 5)
@@ -0,0 +1,138 @@
+"""
+Deciding what to do with a keycard swiped at a door: record it for a new
+keycard scan, or check whether it may open the door and log the AccessTime.
+Shared by views.check (one swipe) and views.check_batch (many swipes from a
+gateway), so that both decide the same way.
+"""
+import datetime
+import re
+
+from rfid_lock_management import access_index, scan_state
+from rfid_lock_management.access_index import authorization_index
+from rfid_lock_management.access_log import log_access_time
+from rfid_lock_management.models import AccessTime, LockUser, NewKeycardScan
+
+# what the checkdoor/<doorid>/checkrfid/<rfid>/ URL pattern accepts
+DOORID_RE = re.compile(r'^\d+$', re.UNICODE)
+RFID_RE = re.compile(r'^\w{10}$', re.UNICODE)
+
+
+def pending_new_keycard_scan(doorid):
+    """
+    The latest NewKeycardScan waiting for a scan at the door, or None. Costs
+    no queries when the scan state registry knows there's none.
+    """
+    new_scan_pk = scan_state.waiting_at_door(doorid)
+    if new_scan_pk is None:
+        return None
+    # (check again: the registry may be a moment behind)
+    new_scans = NewKeycardScan.objects.filter(pk=new_scan_pk,
+                                              waiting_for_scan=True)
+    for new_scan in new_scans:
+        if not new_scan.timed_out():
+            return new_scan
+    return None
+
+
+def authorize(doorid, rfid):
+    """
+    The authorization index's IndexEntry for the RFID if it may open the
+    door, otherwise None. The authorization index knows the active keycard
+    (if any) for this RFID, the LockUser it belongs to and that LockUser's
+    doors.
+    """
+    # Issue #i
+    if access_index.is_enabled():
+        return authorization_index.is_allowed(rfid, doorid)
+    return authorization_index.query(rfid, doorid)
+
+
+def make_access_time(doorid, rfid, index_entry, access_time=None):
+    """
+    The (unsaved) AccessTime for an authorized swipe at access_time
+    (default: now).
+    """
+    return AccessTime(
+        the_rfid=rfid,
+        door_id=int(doorid),
+        lockuser_id=index_entry.lockuser_id,
+        access_time=access_time or datetime.datetime.now()
+    )
+
+
+def decide(doorid, rfid, new_scan, access_time=None):
+    """
+    Decide on one swipe, given the NewKeycardScan waiting for a scan at the
+    door (or None). Returns (response, AccessTime or None): response is 1 if
+    the door should open; the AccessTime is the one to log for it.
+
+    If there is a new_scan, the swipe is recorded on it (but not saved)
+    instead, and the door stays shut.
+    """
+    # Is the request actually for new keycard assignment?
+    # Issue #e
+    if new_scan is not None:
+        # record the door the new scan request came from
+        new_scan.doorid = doorid
+        new_scan.rfid = rfid
+        return 0, None
+
+    # Or is the request actually for authenticating an existing keycard for
+    # this door?
+    index_entry = authorize(doorid, rfid)
+    if index_entry:
+        return 1, make_access_time(doorid, rfid, index_entry, access_time)
+    return 0, None
+
+
+def check_swipe(doorid, rfid):
+    """
+    Decide on one swipe, save the NewKeycardScan it was recorded on, if any,
+    and log its AccessTime, if any (saved now, or queued --
+    ACCESS_TIME_LOGGING). Returns 1 if the door should open, otherwise 0.
+    """
+    new_scan = pending_new_keycard_scan(doorid)
+    response, at = decide(doorid, rfid, new_scan)
+    if new_scan is not None:
+        new_scan.save()
+    if at is not None:
+        log_access_time(at)
+    return response
+
+
+def check_swipes(swipes):
+    """
+    Decide on many swipes, given as (doorid, rfid, access_time) tuples in the
+    order they happened, as check_swipe would have one by one; access_time
+    may be None for now. Swipes whose doorid or rfid the checkdoor URL would
+    not have accepted are denied. The AccessTimes are saved with a single
+    bulk insert (and each LockUser's last access updated). Returns the list
+    of responses.
+    """
+    new_scans = {}   # door id: NewKeycardScan waiting at that door, or None
+    recorded_scans = set()
+    responses = []
+    access_times = []
+    for doorid, rfid, access_time in swipes:
+        doorid, rfid = unicode(doorid), unicode(rfid)
+        if not (DOORID_RE.match(doorid) and RFID_RE.match(rfid)):
+            responses.append(0)
+            continue
+        if int(doorid) not in new_scans:
+            new_scans[int(doorid)] = pending_new_keycard_scan(doorid)
+        new_scan = new_scans[int(doorid)]
+        response, at = decide(doorid, rfid, new_scan, access_time)
+        responses.append(response)
+        if at is not None:
+            access_times.append(at)
+        elif new_scan is not None:
+            recorded_scans.add(int(doorid))
+    # Nothing in a batch ends a new keycard scan, so one save (with the last
+    # swipe recorded on it) leaves each as the swipes one by one would have.
+    for door_id in recorded_scans:
+        new_scans[door_id].save()
+    if access_times:
+        AccessTime.objects.bulk_create(access_times)
+        # (bulk_create doesn't send post_save)
+        LockUser.objects.record_accesses(access_times)
+    return responses
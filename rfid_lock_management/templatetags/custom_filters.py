@@ -1,8 +1,9 @@
 from django import template
 from django.contrib.admin.sites import AdminSite
+from django.contrib.admin.templatetags.admin_list import date_hierarchy
 from django.contrib.contenttypes.models import ContentType
 from django.template.defaultfilters import stringfilter, safe, cut
-from rfid_lock_management.models import LockUser
+from rfid_lock_management.models import AccessTime, DailyAccessCount, LockUser
 from rfid_lock_management.admin import LockUserAdmin
 
 register = template.Library()
@@ -11,7 +12,8 @@ register = template.Library()
 def get_doors_you_manage(request):
     """
     Give template the list of door names that the staff user can manage,
-    or 'None'
+    or 'None' (from the same Doors as the rest of the request, see
+    request_memo.py)
     """
     lua = LockUserAdmin(LockUser, AdminSite())
     doors_to_show_qs = lua.get_doors_to_show(request)
@@ -20,17 +22,6 @@ def get_doors_you_manage(request):
         return_val = ', '.join([door.name for door in doors_to_show_qs])
     return return_val
 
-@register.filter
-def fix_json_string(string):
-    """
-    Marks a string as not requiring further HTML escaping prior to output.
-    """
-    string = safe(string)
-    string = string.replace('"\\"',"'").replace('\\"\"', "'") # fix quotes
-    string = cut(string,"\"") # keep fixing
-    string = safe(string)  # keep fixing
-    return string
-
 @register.filter
 def does_lockuser_have_active_keycard(object_id):
     try:
@@ -56,3 +47,54 @@ def get_object_type(content_type_id):
         return ct.model
     except:
         return None
+
+
+@register.inclusion_tag('admin/date_hierarchy.html')
+def access_date_hierarchy(cl):
+    """
+    The admin's date_hierarchy tag, except that for the AccessTime change
+    list the dates come from the DailyAccessCount rollup (see rollups.py),
+    filtered by the same door and lock user, rather than from every
+    AccessTime.
+    """
+    if cl.model is not AccessTime:
+        return date_hierarchy(cl)
+    days = DailyAccessCount.objects.all()
+    for lookup, value in cl.params.items():
+        # (the list_filters; DailyAccessCount has the same door and lockuser)
+        if lookup.startswith(('door__', 'lockuser__')):
+            days = days.filter(**{str(lookup): value})
+    return date_hierarchy(RollupDateHierarchy(cl, days))
+
+
+class RollupDateHierarchy(object):
+    """
+    What date_hierarchy needs of a ChangeList, with the DailyAccessCounts as
+    its query_set and day as its date_hierarchy; links are made by the
+    ChangeList.
+    """
+    date_hierarchy = 'day'
+
+    def __init__(self, cl, days):
+        self.cl = cl
+        self.query_set = days
+        self.params = dict((self._to_rollup(key), value)
+                           for key, value in cl.params.items())
+
+    def get_query_string(self, new_params=None, remove=None):
+        return self.cl.get_query_string(
+            dict((self._to_access_time(key), value)
+                 for key, value in (new_params or {}).items()),
+            [self._to_access_time(key) for key in (remove or [])])
+
+    def _to_rollup(self, key):
+        prefix = self.cl.date_hierarchy + '__'
+        if key.startswith(prefix):
+            return self.date_hierarchy + '__' + key[len(prefix):]
+        return key
+
+    def _to_access_time(self, key):
+        prefix = self.date_hierarchy + '__'
+        if key.startswith(prefix):
+            return self.cl.date_hierarchy + '__' + key[len(prefix):]
+        return key
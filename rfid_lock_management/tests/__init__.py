@@ -8,3 +8,10 @@ from staff_users_tests import *
 from views_tests import *
 from functional_create_assign_walkthrough import *
 from templatetags_tests import *
+from access_index_tests import *
+from access_log_tests import *
+from bloom_tests import *
+from rollups_tests import *
+from heatmap_tests import *
+from door_permissions_tests import *
+from door_import_tests import *
@@ -0,0 +1,98 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.test import TestCase
+from django.test.client import Client
+from rfid_lock_management import scan_state
+from rfid_lock_management.access_index import (AuthorizationIndex,
+                                                authorization_index)
+from rfid_lock_management.models import AccessTime, Door, LockUser, RFIDkeycard
+from test_helpers import t_info
+
+
+class AuthorizationIndexTests(TestCase):
+    fixtures = ['initial.json']
+
+    def setUp(self):
+        t_info("TestCase AuthorizationIndexTests", 1)
+        t_info(self._testMethodName + ": " + self._testMethodDoc, 2)
+        self.client = Client()
+
+    def test_lookup(self):
+        """ Index maps an active RFID to its LockUser and allowed doors """
+        entry = authorization_index.lookup('9999999992')
+        self.assertEqual(entry.lockuser_id, 3)
+        self.assertEqual(entry.lockuser_name, 'Lisa Simpson')
+        self.assertEqual(entry.door_ids, frozenset([2]))
+
+        t_info("Revoked and unknown RFIDs are not in the index", 4)
+        self.assertEqual(authorization_index.lookup('9999999991'), None)
+        self.assertEqual(authorization_index.lookup('9123456789'), None)
+
+    def test_deactivated_keycard_is_denied(self):
+        """ Deactivating a keycard takes effect on the very next swipe """
+        response = self.client.get("/checkdoor/2/checkrfid/9999999992/")
+        self.assertEqual(response.content, "1")
+
+        keycard = RFIDkeycard.objects.get(the_rfid='9999999992')
+        keycard.deactivate(User.objects.get(username='moe'))
+        keycard.save()
+
+        response = self.client.get("/checkdoor/2/checkrfid/9999999992/")
+        self.assertEqual(response.content, "0")
+
+    def test_invalidated_again_once_committed(self):
+        """ A change saved in a transaction invalidates the index again at
+        the end of the request, once committed, so that another worker's copy
+        rebuilt before the commit isn't used """
+        keycard = RFIDkeycard.objects.get(the_rfid='9999999992')
+        keycard.deactivate(User.objects.get(username='moe'))
+        keycard.save()
+        # (another worker, rebuilding before the commit)
+        other_worker_index = AuthorizationIndex()
+        other_worker_index.rebuild()
+        generation = authorization_index.current_generation()
+        request_finished.send(sender=self.__class__)
+        self.assertNotEqual(authorization_index.current_generation(),
+                            generation)
+
+        t_info("Only once, and only after a change", 4)
+        generation = authorization_index.current_generation()
+        request_finished.send(sender=self.__class__)
+        self.assertEqual(authorization_index.current_generation(), generation)
+
+    def test_door_changes_are_picked_up(self):
+        """ Adding or removing a LockUser's doors takes effect on the very next
+        swipe """
+        lisa = LockUser.objects.get(pk=3)
+        response = self.client.get("/checkdoor/1/checkrfid/9999999992/")
+        self.assertEqual(response.content, "0")
+
+        lisa.doors.add(Door.objects.get(pk=1))
+        response = self.client.get("/checkdoor/1/checkrfid/9999999992/")
+        self.assertEqual(response.content, "1")
+
+        lisa.doors = []
+        response = self.client.get("/checkdoor/1/checkrfid/9999999992/")
+        self.assertEqual(response.content, "0")
+
+    def test_authorized_swipe_only_writes_access_time(self):
+        """ Once the index is built (and with no new keycard scan pending),
+        the only queries for an authorized swipe are the AccessTime insert,
+        the lock user's last access update and the rollups' (looking up, and
+        adding to, the hour's and the day's count) """
+        # (no new keycard scan pending, and the registry knows it)
+        cache.clear()
+        authorization_index.rebuild()
+        scan_state.waiting_at_door(2)
+        with self.assertNumQueries(6):
+            response = self.client.get("/checkdoor/2/checkrfid/9999999992/")
+        self.assertEqual(response.content, "1")
+
+        at = AccessTime.objects.latest('pk')
+        self.assertEqual(at.lockuser_id, 3)
+        self.assertEqual(at.door_id, 2)
+        self.assertEqual(at.the_rfid, '9999999992')
+        lockuser = LockUser.objects.get(pk=3)
+        self.assertEqual(lockuser.last_access_time, at.access_time)
+        self.assertEqual(lockuser.last_access_door_id, 2)
@@ -0,0 +1,102 @@
+import datetime
+import glob
+import os
+import shutil
+import tempfile
+import threading
+
+from django.test import TestCase
+from django.test.client import Client
+from rfid_lock_management import access_log
+from rfid_lock_management.access_log import access_time_buffer, recover_spools
+from rfid_lock_management.models import AccessTime, LockUser
+from test_helpers import t_info
+
+
+class BufferedAccessTimeTests(TestCase):
+    fixtures = ['initial.json']
+
+    def setUp(self):
+        t_info("TestCase BufferedAccessTimeTests", 1)
+        t_info(self._testMethodName + ": " + self._testMethodDoc, 2)
+        self.client = Client()
+        self.spool_dir = tempfile.mkdtemp()
+        # buffer size and age large enough that only flush() writes
+        self.buffered_settings = self.settings(
+            ACCESS_TIME_LOGGING='buffered', ACCESS_TIME_BUFFER_SIZE=1000,
+            ACCESS_TIME_BUFFER_SECONDS=3600,
+            ACCESS_TIME_SPOOL_DIR=self.spool_dir)
+        self.buffered_settings.enable()
+
+    def tearDown(self):
+        access_time_buffer.flush()
+        self.buffered_settings.disable()
+        shutil.rmtree(self.spool_dir)
+
+    def test_swipe_is_queued_then_flushed(self):
+        """ Buffered: the AccessTime is spooled on the swipe, and only saved
+        on flush """
+        num_before = AccessTime.objects.count()
+        response = self.client.get("/checkdoor/2/checkrfid/9999999992/")
+        self.assertEqual(response.content, "1")
+
+        t_info("Not saved yet, but spooled", 4)
+        self.assertEqual(AccessTime.objects.count(), num_before)
+        spools = glob.glob(os.path.join(self.spool_dir, '*.spool'))
+        self.assertEqual(len(spools), 1)
+        self.assertIn('9999999992', open(spools[0]).read())
+
+        t_info("Saved on flush; spool removed", 4)
+        self.assertEqual(access_time_buffer.flush(), 1)
+        self.assertEqual(AccessTime.objects.count(), num_before + 1)
+        at = AccessTime.objects.latest('pk')
+        self.assertEqual((at.the_rfid, at.lockuser_id, at.door_id),
+                         ('9999999992', 3, 2))
+        self.assertEqual(glob.glob(os.path.join(self.spool_dir, '*.spool')), [])
+
+        t_info("The lock user's last access is updated too", 4)
+        lockuser = LockUser.objects.get(pk=3)
+        self.assertEqual((lockuser.last_access_time, lockuser.last_access_door_id),
+                         (at.access_time, 2))
+
+    def test_recover_spool_of_dead_worker(self):
+        """ AccessTimes spooled by a worker that died are inserted """
+        # find a pid that is not running
+        dead_pid = 99999
+        while access_log._is_running(dead_pid):
+            dead_pid -= 1
+        at = AccessTime(the_rfid='9999999992', lockuser_id=3, door_id=2,
+                        access_time=datetime.datetime(2013, 5, 16, 15, 30, 20))
+        spool_path = os.path.join(self.spool_dir,
+                                  access_log.SPOOL_FILE_NAME % (dead_pid, 1))
+        with open(spool_path, 'w') as spool:
+            spool.write(access_log.simplejson.dumps(access_log.to_record(at)))
+            # a partially written line is skipped
+            spool.write('\n{"the_rfid": "99')
+
+        num_before = AccessTime.objects.count()
+        self.assertEqual(recover_spools(), 1)
+        self.assertEqual(AccessTime.objects.count(), num_before + 1)
+        self.assertEqual(AccessTime.objects.latest('pk').access_time,
+                         at.access_time)
+        self.assertFalse(os.path.exists(spool_path))
+
+    def test_queue_filled_during_flush_is_flushed(self):
+        """ AccessTimes that fill the queue while a flush is running are
+        flushed once it is done, without waiting for another swipe """
+        with self.settings(ACCESS_TIME_BUFFER_SIZE=2):
+            buffer = access_log.AccessTimeBuffer()
+            flush_started = threading.Event()
+            buffer._flush_and_close_connection = flush_started.set
+            # (a flush is running)
+            buffer._flushing = True
+            for i in range(2):
+                buffer.add(AccessTime(the_rfid='9999999992', lockuser_id=3,
+                                      door_id=2,
+                                      access_time=datetime.datetime.now()))
+            self.assertFalse(flush_started.wait(0.1))
+
+            t_info("The running flush finishes", 4)
+            buffer._flush_finished()
+            self.assertTrue(flush_started.wait(5))
+            self.assertEqual(buffer.flush(), 2)
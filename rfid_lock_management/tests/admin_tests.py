@@ -1,13 +1,19 @@
+import datetime
+
 from django import forms
 
 
+from django.conf import settings
+from django.db import connection
 from django.test import TestCase
 from django.contrib.auth.models import User
 from django.test.client import Client
 from django.contrib import admin
 from django.forms import CheckboxSelectMultiple, ModelForm
 from django.db import models
-from rfid_lock_management.models import LockUser, AccessTime
+from rfid_lock_management.models import (AccessTime, AllowlistChange, Door,
+                                          LockUser, RFIDkeycard)
+from rfid_lock_management import door_permissions
 from rfid_lock_management.admin import LockUserAdmin, AccessTimeAdmin
 from django.contrib.admin.sites import AdminSite
 from django.http import HttpResponsePermanentRedirect
@@ -47,6 +53,138 @@ class LockUserAdminActionsTests(TestCase):
         self.assertFalse(LockUser.objects.get(pk=3).is_active())
 
 
+class LockUserChangeListTests(TestCase):
+    fixtures = ['initial.json']
+
+    def setUp(self):
+        t_info("TestCase LockUserChangeListTests", 1)
+        t_info(self._testMethodName + ": " + self._testMethodDoc, 2)
+        self.client = Client()
+        self.client.login(username='moe', password='moe')
+        self.lockuser_admin = admin.site._registry[LockUser]
+        self.old_list_per_page = self.lockuser_admin.list_per_page
+
+    def tearDown(self):
+        self.lockuser_admin.list_per_page = self.old_list_per_page
+
+    def get_change_list(self, list_per_page):
+        """ The LockUser change list with list_per_page rows, and the
+        number of queries it took """
+        self.lockuser_admin.list_per_page = list_per_page
+        old_debug = settings.DEBUG
+        settings.DEBUG = True   # record connection.queries
+        try:
+            connection.queries = []
+            response = self.client.get(
+                "/lockadmin/rfid_lock_management/lockuser/")
+            num_queries = len(connection.queries)
+        finally:
+            settings.DEBUG = old_debug
+        self.assertEqual(response.status_code, 200)
+        return response, num_queries
+
+    def test_constant_queries(self):
+        """
+        The change list takes the same number of queries whatever the page
+        size
+        """
+        assigner = User.objects.get(username='moe')
+        doors = list(Door.objects.all())
+        for i in range(20):
+            lockuser = LockUser.objects.create(
+                first_name='Jane%d' % i, last_name='Doe',
+                email='jdoe%d@gmail.com' % i)
+            lockuser.doors.add(*doors[:i % len(doors) + 1])
+            RFIDkeycard.objects.create(the_rfid='%010d' % i,
+                                       lockuser=lockuser, assigner=assigner)
+            AccessTime.objects.create(
+                access_time=datetime.datetime.now(), lockuser=lockuser,
+                door=doors[i % len(doors)])
+
+        # (once first, for the caches that only the first request fills)
+        self.get_change_list(2)
+        response, few_queries = self.get_change_list(2)
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+        response, many_queries = self.get_change_list(20)
+        self.assertEqual(len(response.context['cl'].result_list), 20)
+        self.assertEqual(many_queries, few_queries)
+
+        t_info("The columns are still filled in", 3)
+        self.assertContains(response, "RFID: %010d" % 19)
+        self.assertContains(response, ", ".join(
+            door.name for door in doors[:19 % len(doors) + 1]))
+        self.assertContains(response, "(%s)" % doors[19 % len(doors)].name)
+
+
+class LockUserChangeFormTests(TestCase):
+    fixtures = ['initial.json']
+
+    def setUp(self):
+        t_info("TestCase LockUserChangeFormTests", 1)
+        t_info(self._testMethodName + ": " + self._testMethodDoc, 2)
+        self.client = Client()
+        self.client.login(username='moe', password='moe')
+        self.manageable_door_ids = door_permissions.manageable_door_ids
+        self.calls = []
+
+        def counting_manageable_door_ids(user):
+            self.calls.append(user.pk)
+            return self.manageable_door_ids(user)
+        door_permissions.manageable_door_ids = counting_manageable_door_ids
+
+    def tearDown(self):
+        door_permissions.manageable_door_ids = self.manageable_door_ids
+
+    def test_doors_worked_out_once(self):
+        """
+        A change form works out the doors the staff user may manage, and the
+        lock user's doors they may not, once each
+        """
+        response = self.client.get(
+            "/lockadmin/rfid_lock_management/lockuser/2/")
+        self.assertEqual(response.status_code, 200)
+        # (get_doors_to_show and get_other_doors)
+        self.assertEqual(len(self.calls), 2)
+
+        t_info("And they are all shown", 3)
+        request = response.context['request']
+        lockuser_admin = admin.site._registry[LockUser]
+        self.assertIs(response.context['scan_doors'],
+                      lockuser_admin.get_doors_to_show(request))
+        self.assertEqual(
+            response.context['doors_not_permitted_to_this_staff_user'],
+            set(Door.objects.filter(pk__in=[1, 4])))
+        self.assertContains(response, "Doors you manage: Community Theater, "
+                                      "Seminar Room")
+        self.assertContains(response, "do not have permission to manage")
+        self.assertEqual(len(self.calls), 2)
+
+
+    def test_unchanged_save_keeps_allowlist_versions(self):
+        """
+        Saving a lock user's change form without changing anything leaves
+        every door's allowlist version (and journal) as it was
+        """
+        self.client.login(username='superuser', password='superuser')
+        lockuser = LockUser.objects.get(pk=1)
+        versions = dict(Door.objects.values_list('pk', 'allowlist_version'))
+        changes = AllowlistChange.objects.count()
+        response = self.client.post(
+            "/lockadmin/rfid_lock_management/lockuser/1/", {
+                'first_name': lockuser.first_name,
+                'last_name': lockuser.last_name,
+                'email': lockuser.email,
+                'phone_number': lockuser.phone_number or '',
+                'address': lockuser.address or '',
+                'doors': [door.pk for door in lockuser.doors.all()],
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            dict(Door.objects.values_list('pk', 'allowlist_version')),
+            versions)
+        self.assertEqual(AllowlistChange.objects.count(), changes)
+
+
 class AccessTimeAdminTests(TestCase):
     fixtures = ['initial.json']
 
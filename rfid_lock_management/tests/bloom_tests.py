@@ -0,0 +1,89 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.client import Client
+from rfid_lock_management import bloom
+from rfid_lock_management.models import Door, LockUser
+from test_helpers import t_info
+
+
+class BloomFilterTests(TestCase):
+    fixtures = ['initial.json']
+
+    def setUp(self):
+        self.client = Client()
+        t_info("TestCase BloomFilterTests", 1)
+        t_info(self._testMethodName + ": " + self._testMethodDoc, 2)
+        # filters rendered by other tests, at the same door versions
+        cache.clear()
+
+    def get_filter(self, response):
+        """ (header fields, BloomFilter) from a getbloom response """
+        (magic, format_version, num_hashes, num_bits, num_items,
+         version) = bloom.HEADER.unpack(response.content[:bloom.HEADER.size])
+        self.assertEqual((magic, format_version), ('RFBF', 1))
+        bloom_filter = bloom.BloomFilter(num_hashes, num_bits)
+        bloom_filter.bits = bytearray(response.content[bloom.HEADER.size:])
+        self.assertEqual(len(bloom_filter.bits) * 8, num_bits)
+        return num_items, version, bloom_filter
+
+    def test_fnv1a(self):
+        """ FNV-1a matches the published test vectors """
+        self.assertEqual(bloom.fnv1a_32(''), 0x811c9dc5)
+        self.assertEqual(bloom.fnv1a_32('a'), 0xe40c292c)
+        self.assertEqual(bloom.fnv1a_32('foobar'), 0xbf9cf968)
+
+    def test_false_positive_rate(self):
+        """ No false negatives; false positives near the requested rate """
+        rfids = ['%010d' % (i * 7919) for i in range(1000)]
+        bloom_filter = bloom.BloomFilter.from_rfids(rfids, 0.01)
+        self.assertTrue(all(rfid in bloom_filter for rfid in rfids))
+        others = ['%010d' % (i * 7919 + 1) for i in range(10000)]
+        false_positives = sum(1 for rfid in others if rfid in bloom_filter)
+        self.assertTrue(false_positives < 200, false_positives)
+
+    def test_door_filter(self):
+        """ getbloom: filter holds the door's active RFIDs """
+        response = self.client.get('/door/1/getbloom/')
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        num_items, version, bloom_filter = self.get_filter(response)
+        self.assertEqual(num_items, 2)
+        self.assertEqual(version, Door.objects.get(pk=1).allowlist_version)
+        self.assertIn('1122135122', bloom_filter)
+        self.assertIn('1122135199', bloom_filter)
+
+        t_info("A lower false-positive rate makes a bigger filter", 3)
+        smaller = len(response.content)
+        response = self.client.get('/door/1/getbloom/?fp=0.0001')
+        self.assertTrue(len(response.content) > smaller)
+
+    def test_rebuilt_only_when_allowlist_changes(self):
+        """ getbloom: served from the cache until the door's allowlist
+        changes """
+        response = self.client.get('/door/2/getbloom/')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/door/2/getbloom/').content,
+                             response.content)
+        self.assertEqual(self.client.get(
+            '/door/2/getbloom/',
+            HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        LockUser.objects.get(pk=3).doors = []
+        response = self.client.get('/door/2/getbloom/',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('9999999992', self.get_filter(response)[2])
+
+    def test_fp_rate_parameter(self):
+        """ getbloom: ?fp= is rounded, so that similar rates share a filter;
+        one that isn't a finite number gets the default """
+        default = self.client.get('/door/1/getbloom/')
+        for fp in ('nan', 'inf', '-inf', 'x'):
+            response = self.client.get('/door/1/getbloom/', {'fp': fp})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['ETag'], default['ETag'])
+        self.assertEqual(
+            self.client.get('/door/1/getbloom/', {'fp': '0.0123'})['ETag'],
+            default['ETag'])
+        self.assertEqual(bloom.round_fp_rate(0.0271828), 0.03)
+        self.assertEqual(bloom.round_fp_rate(1e-9), bloom.MIN_FP_RATE)
+        self.assertEqual(bloom.round_fp_rate(0.9), bloom.MAX_FP_RATE)
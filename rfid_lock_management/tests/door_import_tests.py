@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from django.contrib.auth.models import Group, User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import simplejson
+from rfid_lock_management import door_import, door_permissions
+from rfid_lock_management.models import Door, DoorACLEntry
+from test_helpers import t_info
+
+
+class DoorImportTests(TestCase):
+    fixtures = ['initial.json']
+
+    def setUp(self):
+        t_info("TestCase DoorImportTests", 1)
+        t_info(self._testMethodName + ": " + self._testMethodDoc, 2)
+        self.group = Group.objects.create(name='Lab staff')
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, file_name, content):
+        path = os.path.join(self.tmp_dir, file_name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_read_doors(self):
+        """ read_doors() reads CSV and JSON alike """
+        csv_doors = door_import.read_doors(StringIO(
+            'name,description,managers,groups\n'
+            'Lab 101,Chemistry lab,moe; superuser,Lab staff\n'
+            'Lab 102,,,\n'), 'csv')
+        json_doors = door_import.read_doors(StringIO(simplejson.dumps([
+            {'name': 'Lab 101', 'description': 'Chemistry lab',
+             'managers': ['moe', 'superuser'], 'groups': ['Lab staff']},
+            {'name': 'Lab 102'}])), 'json')
+        self.assertEqual(csv_doors, json_doors)
+        self.assertEqual(csv_doors[1], {'name': 'Lab 102', 'description': None,
+                                        'managers': [], 'groups': []})
+
+        t_info('Neither', 3)
+        self.assertRaises(ValueError, door_import.read_doors,
+                          StringIO('{"name": "Lab 101"}'), 'json')
+        self.assertRaises(ValueError, door_import.read_doors,
+                          StringIO(''), 'xml')
+
+    def test_import_doors(self):
+        """ import_doors() adds the doors and their ACL entries, in a few
+        queries however many there are """
+        moe = User.objects.get(username='moe')
+        door_permissions.manageable_door_ids(moe)
+        doors = [{'name': 'Lab %d' % i, 'description': None,
+                  'managers': ['moe'], 'groups': ['Lab staff']}
+                 for i in range(250)]
+        with self.assertNumQueries(12):
+            result = door_import.import_doors(doors)
+        self.assertEqual(result, (250, 0, 500))
+        lab = Door.objects.get(name='Lab 7')
+        self.assertEqual(
+            set(DoorACLEntry.objects.filter(door=lab).values_list(
+                'user', 'group')),
+            set([(moe.pk, None), (None, self.group.pk)]))
+        t_info('Moe may manage them right away', 3)
+        self.assertIn(lab.pk, door_permissions.manageable_door_ids(moe))
+
+        t_info('Again: nothing new', 3)
+        self.assertEqual(door_import.import_doors(doors), (0, 250, 0))
+
+        t_info('Doors already there get the ACL entries they lack', 3)
+        doors = [{'name': 'Seminar Room', 'description': None,
+                  'managers': ['moe', 'superuser'], 'groups': []}]
+        self.assertEqual(door_import.import_doors(doors), (0, 1, 1))
+
+    def test_import_doors_errors(self):
+        """ Nothing is saved if a door can't be """
+        door = {'name': 'Lab 101', 'description': None, 'managers': [],
+                'groups': []}
+        doors_before = Door.objects.count()
+        for doors in ([door, door],
+                      [dict(door, name='')],
+                      [dict(door, name='x' * 51)],
+                      [dict(door, managers=['larry'])],
+                      [dict(door, groups=['Nobody'])]):
+            self.assertRaises(ValueError, door_import.import_doors, doors)
+        self.assertEqual(Door.objects.count(), doors_before)
+        self.assertFalse(DoorACLEntry.objects.filter(door__name='Lab 101'))
+
+    def test_import_doors_command(self):
+        """ The import_doors command imports a file, and reports how fast """
+        path = self.write('doors.csv', 'name,managers\nLab 101,moe\n')
+        stdout = StringIO()
+        call_command('import_doors', path, stdout=stdout)
+        self.assertTrue(stdout.getvalue().startswith(
+            'Imported 1 doors (0 already there) and 1 ACL entries in '))
+        self.assertTrue(stdout.getvalue().endswith(' doors/s.\n'))
+        self.assertTrue(DoorACLEntry.objects.filter(
+            door__name='Lab 101', user__username='moe'))
+
+        t_info('--format', 3)
+        path = self.write('doors.txt', '[{"name": "Lab 102"}]')
+        call_command('import_doors', path, format='json', stdout=StringIO())
+        self.assertTrue(Door.objects.filter(name='Lab 102'))
+
+        t_info('Errors (a CommandError: reported, then exit)', 3)
+        path = self.write('doors.json', '[{"name": "Lab 103", '
+                                        '"managers": ["larry"]}]')
+        for path in (path, os.path.join(self.tmp_dir, 'missing.csv')):
+            stderr = StringIO()
+            self.assertRaises(SystemExit, call_command, 'import_doors', path,
+                              stdout=StringIO(), stderr=stderr)
+            self.assertTrue(stderr.getvalue().startswith('Error: '))
+        self.assertFalse(Door.objects.filter(name='Lab 103'))
@@ -0,0 +1,111 @@
+from django.contrib.admin.sites import AdminSite
+from django.contrib.auth.models import Group, User
+from django.test import TestCase
+from django.test.client import Client, RequestFactory
+from rfid_lock_management import door_permissions
+from rfid_lock_management.admin import LockUserAdmin
+from rfid_lock_management.models import Door, DoorACLEntry, LockUser
+from test_helpers import t_info
+
+
+class DoorPermissionsTests(TestCase):
+    fixtures = ['initial.json']
+
+    def setUp(self):
+        t_info("TestCase DoorPermissionsTests", 1)
+        t_info(self._testMethodName + ": " + self._testMethodDoc, 2)
+
+    def door_ids(self, username='moe'):
+        """ The Doors the (freshly fetched) User may manage """
+        return door_permissions.manageable_door_ids(
+            User.objects.get(username=username))
+
+    def test_manageable_door_ids(self):
+        """ manageable_door_ids() agrees with the DoorACLEntries, and is
+        cached """
+        moe = User.objects.get(username='moe')
+        with self.assertNumQueries(1):
+            door_ids = door_permissions.manageable_door_ids(moe)
+        self.assertEqual(door_ids, frozenset(
+            DoorACLEntry.objects.filter(user=moe).values_list(
+                'door', flat=True)))
+        self.assertEqual(self.door_ids(), frozenset([2, 3]))
+
+        t_info('Cached: no queries', 3)
+        moe = User.objects.get(username='moe')
+        with self.assertNumQueries(0):
+            door_permissions.manageable_door_ids(moe)
+
+        t_info('Every door for a superuser', 3)
+        self.assertEqual(self.door_ids('superuser'), frozenset(
+            Door.objects.values_list('pk', flat=True)))
+
+        t_info('None for an inactive user', 3)
+        moe.is_active = False
+        moe.save()
+        self.assertEqual(self.door_ids(), frozenset())
+
+    def test_invalidation(self):
+        """ Granting and revoking doors, directly or through a Group, and
+        adding Doors, show up right away """
+        moe = User.objects.get(username='moe')
+        door = Door.objects.create(name='Back door')
+        self.assertNotIn(door.pk, self.door_ids())
+        self.assertIn(door.pk, self.door_ids('superuser'))
+
+        t_info('Directly', 3)
+        entry = DoorACLEntry.objects.create(door=door, user=moe)
+        self.assertIn(door.pk, self.door_ids())
+        entry.delete()
+        self.assertNotIn(door.pk, self.door_ids())
+
+        t_info('Through a Group', 3)
+        group = Group.objects.create(name='Back door staff')
+        group.user_set.add(moe)
+        self.door_ids()
+        DoorACLEntry.objects.create(door=door, group=group)
+        self.assertIn(door.pk, self.door_ids())
+        moe.groups.clear()
+        self.assertNotIn(door.pk, self.door_ids())
+        moe.groups.add(group)
+        self.assertIn(door.pk, self.door_ids())
+        group.user_set.remove(moe)
+        self.assertNotIn(door.pk, self.door_ids())
+        group.user_set.add(moe)
+        group.delete()
+        self.assertNotIn(door.pk, self.door_ids())
+
+    def test_admin_doors(self):
+        """ LockUserAdmin.get_doors_to_show and get_other_doors filter on the
+        cached Door pks """
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(username='moe')
+        lockuser_admin = LockUserAdmin(LockUser, AdminSite())
+        self.assertEqual(
+            set(lockuser_admin.get_doors_to_show(request)),
+            set(Door.objects.filter(pk__in=[2, 3])))
+        for lockuser in LockUser.objects.all():
+            self.assertEqual(
+                lockuser_admin.get_other_doors(request, lockuser.pk),
+                set(lockuser.doors.exclude(pk__in=[2, 3])))
+
+        t_info('A staff user who may manage no doors', 3)
+        request.user = User.objects.create_user('curly', 'c@c.com', 'curly')
+        request.user.is_staff = True
+        request.user.save()
+        self.assertEqual(list(lockuser_admin.get_doors_to_show(request)), [])
+        lockuser = LockUser.objects.get(pk=1)
+        self.assertEqual(lockuser_admin.get_other_doors(request, lockuser.pk),
+                         set(lockuser.doors.all()))
+
+    def test_acl_admin(self):
+        """ Superusers grant doors under Door ACL entries; staff users can't
+        """
+        client = Client()
+        client.login(username='superuser', password='superuser')
+        response = client.get('/lockadmin/rfid_lock_management/dooraclentry/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Community Theater')
+        client.login(username='moe', password='moe')
+        response = client.get('/lockadmin/rfid_lock_management/dooraclentry/')
+        self.assertEqual(response.status_code, 403)
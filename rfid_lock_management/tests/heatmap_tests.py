@@ -0,0 +1,106 @@
+import datetime
+
+import numpy
+from django.test import TestCase
+from django.test.client import Client
+from django.utils import simplejson
+from rfid_lock_management import heatmap, rollups
+from rfid_lock_management.models import AccessTime, Door, HourlyAccessCount
+from test_helpers import t_info
+
+
+class HeatmapTests(TestCase):
+    fixtures = ['initial.json']
+
+    def setUp(self):
+        t_info("TestCase HeatmapTests", 1)
+        t_info(self._testMethodName + ": " + self._testMethodDoc, 2)
+        rollups.rebuild()   # (loading the fixture doesn't count them)
+        self.client = Client()
+        self.client.login(username='moe', password='moe')
+
+    def test_bin_hours(self):
+        """ bin_hours() sums the counts by door, weekday and hour of day """
+        times = [datetime.datetime(2013, 4, 8, 10, 30),   # Monday
+                 datetime.datetime(2013, 4, 15, 10, 59),  # Monday
+                 datetime.datetime(2013, 4, 14, 23, 0),   # Sunday
+                 datetime.datetime(1969, 12, 31, 0, 0),   # Wednesday
+                 datetime.datetime(2013, 4, 8, 10, 0)]
+        grids = heatmap.bin_hours([1, 3], [3, 3, 1, 1, 2], times,
+                                  [1, 2, 5, 1, 100])
+        self.assertEqual(grids.shape, (2, 7, 24))
+        self.assertEqual(grids[1, 0, 10], 3)
+        self.assertEqual(grids[0, 6, 23], 5)
+        self.assertEqual(grids[0, 2, 0], 1)
+        t_info('Door 2 is not one of the doors: left out', 3)
+        self.assertEqual(grids.sum(), 9)
+
+        t_info('Counts default to 1', 3)
+        self.assertEqual(heatmap.bin_hours([3], [3, 3], times[:2])[0, 0, 10],
+                         2)
+
+        t_info('bin_week_hours(), by weekday and hour', 3)
+        grids = heatmap.bin_week_hours([1, 3], [3, 1], [0, 6], [10, 23])
+        self.assertEqual(grids[1, 0, 10], 1)
+        self.assertEqual(grids[0, 6, 23], 1)
+
+    def test_chart_heatmap(self):
+        """ chart_heatmap: a day of week by hour of day grid for each door """
+        response = self.client.get('/chart/heatmap/')
+        self.assertEqual(response.status_code, 200)
+        response_data = simplejson.loads(response.content)
+        self.assertEqual(response_data['days'], heatmap.DAY_NAMES)
+        self.assertEqual([door['id'] for door in response_data['doors']],
+                         list(Door.objects.order_by('pk').values_list(
+                             'pk', flat=True)))
+        for door in response_data['doors']:
+            grid = numpy.array(door['data'])
+            self.assertEqual(grid.shape, (7, 24))
+            t_info('Every cell is the number of AccessTimes then', 3)
+            expected = numpy.zeros((7, 24), dtype=int)
+            for at in AccessTime.objects.filter(door=door['id']):
+                expected[at.access_time.weekday(), at.access_time.hour] += 1
+            self.assertEqual(grid.tolist(), expected.tolist())
+
+    def test_get_heatmaps_any_database(self):
+        """ get_heatmaps(): the same, whether or not the database sums the
+        counts by day and hour (WEEK_HOUR_SQL) """
+        hourly_counts = HourlyAccessCount.objects.filter(door__in=[1, 2])
+        heatmaps = heatmap.get_heatmaps(hourly_counts, [1, 2])
+        self.assertEqual([door['id'] for door in heatmaps], [1, 2])
+        old_week_hour_sql = heatmap.WEEK_HOUR_SQL
+        heatmap.WEEK_HOUR_SQL = {}
+        try:
+            self.assertEqual(heatmap.get_heatmaps(hourly_counts, [1, 2]),
+                             heatmaps)
+        finally:
+            heatmap.WEEK_HOUR_SQL = old_week_hour_sql
+
+    def test_chart_heatmap_range_and_doors(self):
+        """ chart_heatmap with from, to and door """
+        at = AccessTime.objects.filter(door=2).order_by('access_time')[0]
+        day = at.access_time.strftime('%Y-%m-%d')
+        response = self.client.get('/chart/heatmap/', {
+            'from': day, 'to': day, 'door': ['2', '3']})
+        doors = simplejson.loads(response.content)['doors']
+        self.assertEqual([door['id'] for door in doors], [2, 3])
+        self.assertEqual(
+            numpy.array(doors[0]['data']).sum(),
+            AccessTime.objects.filter(
+                door=2, access_time__startswith=day).count())
+
+        t_info('Bad parameters', 3)
+        for params in ({'from': 'yesterday'}, {'door': 'x'}):
+            response = self.client.get('/chart/heatmap/', params)
+            self.assertEqual(response.status_code, 400)
+
+    def test_chart_heatmap_etag(self):
+        """ chart_heatmap: 304 Not Modified until an AccessTime is added """
+        response = self.client.get('/chart/heatmap/')
+        etag = response['ETag']
+        response = self.client.get('/chart/heatmap/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        AccessTime.objects.create(access_time=datetime.datetime.now(),
+                                  door_id=1, lockuser_id=1)
+        response = self.client.get('/chart/heatmap/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
@@ -1,8 +1,18 @@
+import datetime
 import simplejson
+import zlib
 
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
 from django.test.client import Client
-from rfid_lock_management.models import NewKeycardScan, AccessTime
+from rfid_lock_management import allowlists, scan_state
+from rfid_lock_management.access_index import authorization_index
+from rfid_lock_management.benchmarks import call_wsgi
+from rfid_lock_management.lock_gateway import LockGateway
+from rfid_lock_management.models import (NewKeycardScan, AccessTime,
+                                         AllowlistChange, Door, LockUser,
+                                         RFIDkeycard)
 from test_helpers import t_info
 
 
@@ -71,7 +81,7 @@ class LockCommunicationTests(TestCase):
         # using assigner_user_id vs assigner_user only because we're using a
         # fixture!
         nks_obj = NewKeycardScan.objects.create(
-            assigner_user_id=1, waiting_for_scan=True)
+            assigner_user_id=1, waiting_for_scan=True, door_id=1)
 
         # how many AccessTime objects before request
         len_before = len(AccessTime.objects.all())
@@ -137,3 +147,529 @@ class LockCommunicationTests(TestCase):
         # should not contain the inactive RFID 9999999991
         # remove null terminator
         self.assertNotIn('9999999991', response.content[-1:])
+
+
+class LockCommunicationQueryCountTests(TestCase):
+    """
+    The number of queries for checking an RFID and getting a door's allowed
+    RFIDs should not depend on how many lockusers or keycards there are.
+    """
+    fixtures = ['initial.json']
+
+    def setUp(self):
+        self.client = Client()
+        t_info("TestCase LockCommunicationQueryCountTests", 1)
+        t_info(self._testMethodName + ": " + self._testMethodDoc, 2)
+        # allowlists rendered by other tests, at the same door versions
+        cache.clear()
+        self.staff_user = User.objects.get(username='moe')
+        self.door = Door.objects.get(pk=2)
+
+    def add_lockusers(self, how_many, start=0):
+        """ Add lockusers with an active keycard each, allowed the door """
+        for i in range(start, start + how_many):
+            lu = LockUser.objects.create(first_name='Lock', last_name='User',
+                                         email='lu%d@example.com' % i)
+            lu.doors.add(self.door)
+            RFIDkeycard.objects.create(the_rfid='%010d' % (5000000000 + i),
+                                       lockuser=lu, assigner=self.staff_user)
+
+    def reuse_rfid(self, rfid, how_many):
+        """ Add revoked keycards with the same RFID """
+        lu = LockUser.objects.get(pk=3)
+        for i in range(how_many):
+            RFIDkeycard.objects.create(the_rfid=rfid, lockuser=lu,
+                                       assigner=self.staff_user,
+                                       date_revoked=datetime.datetime.now())
+
+    def test_get_allowed_rfids_query_count(self):
+        """ getallowed: same number of queries for 2 or 52 lockusers """
+        with self.assertNumQueries(2):
+            self.client.get('/door/2/getallowed/')
+        self.add_lockusers(50)
+        with self.assertNumQueries(2):
+            response = self.client.get('/door/2/getallowed/')
+        self.assertEqual(len(response.content[:-1].split()), 52)
+
+    def test_door_get_allowed_rfids_query_count(self):
+        """ Door.get_allowed_rfids() is a single query """
+        self.add_lockusers(20)
+        with self.assertNumQueries(1):
+            allowed_rfids = self.door.get_allowed_rfids()
+        self.assertEqual(len(allowed_rfids), 22)
+
+    def test_check_query_count_without_index(self):
+        """ check, without the authorization index: same number of queries
+        however many times the RFID has been reused """
+        scan_state.waiting_at_door(2)
+        with self.settings(RFID_AUTH_INDEX=False):
+            # the keycard query, the AccessTime insert, the lock user's last
+            # access, two each for the hourly and daily rollups
+            with self.assertNumQueries(7):
+                response = self.client.get('/checkdoor/2/checkrfid/9999999992/')
+            self.assertEqual(response.content, '1')
+            self.reuse_rfid('9999999992', 30)
+            self.add_lockusers(30)
+            with self.assertNumQueries(7):
+                response = self.client.get('/checkdoor/2/checkrfid/9999999992/')
+            self.assertEqual(response.content, '1')
+
+    def test_index_rebuild_query_count(self):
+        """ Rebuilding the authorization index is a single query """
+        self.reuse_rfid('9999999992', 30)
+        self.add_lockusers(30)
+        with self.assertNumQueries(1):
+            authorization_index.rebuild()
+        with self.assertNumQueries(0):
+            self.assertTrue(authorization_index.is_allowed('9999999992', 2))
+
+
+class CheckBatchTests(TestCase):
+    fixtures = ['initial.json']
+
+    def setUp(self):
+        self.client = Client()
+        t_info("TestCase CheckBatchTests", 1)
+        t_info(self._testMethodName + ": " + self._testMethodDoc, 2)
+
+    def check_batch(self, swipes):
+        response = self.client.post('/checkbatch/', simplejson.dumps(swipes),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return simplejson.loads(response.content)
+
+    def test_decisions_match_check(self):
+        """ One decision per swipe, the same as check's """
+        swipes = [[2, '9999999992', None],      # allowed
+                  [10, '1123456789', None],     # no such door
+                  [2, '9123456789', None],      # no such RFID
+                  [2, '1122135122', None],      # wrong door
+                  [2, '9999999991', None],      # inactive
+                  ['2', 'abc123', None],        # RFID in wrong format
+                  ['aaaaa', '1123456789', None]]  # door in wrong format
+        singles = []
+        for doorid, rfid, timestamp in swipes:
+            response = self.client.get('/checkdoor/%s/checkrfid/%s/' % (
+                doorid, rfid))
+            singles.append(int(response.content or 0))
+        self.assertEqual(self.check_batch(swipes), singles)
+        self.assertEqual(singles, [1, 0, 0, 0, 0, 0, 0])
+
+    def test_access_times_in_one_insert(self):
+        """ AccessTimes of all allowed swipes saved in one query, at the
+        swipes' timestamps, then the rollups and each lock user's last access
+        updated """
+        # (no new keycard scan pending, and the registry knows it)
+        cache.clear()
+        authorization_index.rebuild()
+        scan_state.waiting_at_door(1)
+        scan_state.waiting_at_door(2)
+        num_before = AccessTime.objects.count()
+        swipes = [[2, '9999999992', 1368718220], [1, '1122135122', 1368718230],
+                  [1, '9999999992', 1368718240]]
+        # the insert; two each for the hourly and daily rollups; the last
+        # access of each of the two lock users
+        with self.assertNumQueries(7):
+            self.assertEqual(self.check_batch(swipes), [1, 1, 0])
+        access_times = AccessTime.objects.order_by('-pk')[:2]
+        self.assertEqual(AccessTime.objects.count(), num_before + 2)
+        self.assertEqual(
+            sorted((at.the_rfid, at.door_id, at.access_time)
+                   for at in access_times),
+            [('1122135122', 1, datetime.datetime.fromtimestamp(1368718230)),
+             ('9999999992', 2, datetime.datetime.fromtimestamp(1368718220))])
+
+    def test_waiting_for_scan(self):
+        """ While waiting for a new keycard scan at a door, every swipe there
+        is denied and the last one is recorded on the NewKeycardScan, as with
+        check """
+        nks_obj = NewKeycardScan.objects.create(
+            assigner_user_id=1, waiting_for_scan=True, door_id=2)
+        num_before = AccessTime.objects.count()
+        self.assertEqual(self.check_batch([[2, '9999999992', None],
+                                           [1, '1122135122', None],
+                                           [2, '5555555555', None]]),
+                         [0, 1, 0])
+        self.assertEqual(AccessTime.objects.count(), num_before + 1)
+        nks_obj = NewKeycardScan.objects.get(pk=nks_obj.pk)
+        self.assertEqual((nks_obj.doorid, nks_obj.rfid), ('2', '5555555555'))
+
+    def test_bad_request(self):
+        """ Not a list of [doorid, rfid, timestamp]: 400; not POST: 405 """
+        response = self.client.post('/checkbatch/', '[[2, "9999999992"]]',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/checkbatch/', 'not json',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/checkbatch/').status_code, 405)
+
+
+class LockGatewayTests(TestCase):
+    fixtures = ['initial.json']
+
+    def setUp(self):
+        self.client = Client()
+        t_info("TestCase LockGatewayTests", 1)
+        t_info(self._testMethodName + ": " + self._testMethodDoc, 2)
+        cache.clear()
+        self.fallback_paths = []
+        self.gateway = LockGateway(self.fallback)
+
+    def fallback(self, environ, start_response):
+        self.fallback_paths.append(environ['PATH_INFO'])
+        start_response('200 OK', [])
+        return ['fallback']
+
+    def test_check(self):
+        """ Gateway answers check as views.check does, and logs the
+        AccessTime """
+        num_before = AccessTime.objects.count()
+        for path, expected in [('/checkdoor/2/checkrfid/9999999992/', '1'),
+                               ('/checkdoor/2/checkrfid/9123456789/', '0'),
+                               ('/checkdoor/2/checkrfid/1122135122/', '0'),
+                               ('/checkdoor/10/checkrfid/1123456789/', '0')]:
+            self.assertEqual(call_wsgi(self.gateway, path),
+                             ('200 OK', expected))
+            self.assertEqual(self.client.get(path).content, expected)
+        self.assertEqual(AccessTime.objects.count(), num_before + 2)
+        self.assertEqual(self.fallback_paths, [])
+
+    def test_get_allowed_rfids(self):
+        """ Gateway answers getallowed as views.get_allowed_rfids does """
+        status, body = call_wsgi(self.gateway, '/door/1/getallowed/')
+        self.assertEqual(body, self.client.get('/door/1/getallowed/').content)
+        self.assertEqual(body, '1122135122 1122135199\0')
+        self.assertEqual(call_wsgi(self.gateway, '/door/10/getallowed/')[1],
+                         '\0')
+
+        t_info("Conditional GET", 3)
+        etag = self.client.get('/door/1/getallowed/')['ETag']
+        self.assertEqual(call_wsgi(self.gateway, '/door/1/getallowed/',
+                                   HTTP_IF_NONE_MATCH=etag),
+                         ('304 NOT MODIFIED', ''))
+
+    def test_everything_else_falls_through(self):
+        """ Other requests, and the binary allowlist, go to the wrapped
+        application """
+        call_wsgi(self.gateway, '/lockadmin/')
+        call_wsgi(self.gateway, '/door/1/getallowed/',
+                  QUERY_STRING='format=binary')
+        call_wsgi(self.gateway, '/checkdoor/2/checkrfid/abc123/')
+        self.assertEqual(self.fallback_paths,
+                         ['/lockadmin/', '/door/1/getallowed/',
+                          '/checkdoor/2/checkrfid/abc123/'])
+
+        t_info("Without an application to fall back on: 404", 3)
+        self.assertEqual(call_wsgi(LockGateway(), '/lockadmin/')[0],
+                         '404 NOT FOUND')
+
+
+class AllowlistVersionTests(TestCase):
+    fixtures = ['initial.json']
+
+    def setUp(self):
+        self.client = Client()
+        t_info("TestCase AllowlistVersionTests", 1)
+        t_info(self._testMethodName + ": " + self._testMethodDoc, 2)
+        # allowlists rendered by other tests, at the same door versions
+        cache.clear()
+
+    def get_allowed(self, doorid, etag=None):
+        if etag:
+            return self.client.get('/door/%d/getallowed/' % doorid,
+                                   HTTP_IF_NONE_MATCH=etag)
+        return self.client.get('/door/%d/getallowed/' % doorid)
+
+    def test_not_modified(self):
+        """ Same version as the If-None-Match ETag: empty 304 response """
+        response = self.get_allowed(1)
+        self.assertEqual(response.status_code, 200)
+        version = Door.objects.get(pk=1).allowlist_version
+        self.assertEqual(response['ETag'], '"1-%d"' % version)
+        self.assertEqual(response['X-Allowlist-Version'], str(version))
+
+        response = self.get_allowed(1, etag=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, '')
+
+    def test_version_changes_with_allowed_rfids(self):
+        """ Revoking a keycard, or adding or removing a door, bumps the version
+        of the affected doors only """
+        etag = self.get_allowed(2)['ETag']
+        door1_etag = self.get_allowed(1)['ETag']
+
+        t_info("Revoke Lisa's keycard (Lisa is allowed door 2 only)", 3)
+        keycard = RFIDkeycard.objects.get(the_rfid='9999999992')
+        keycard.deactivate(User.objects.get(username='moe'))
+        keycard.save()
+        response = self.get_allowed(2, etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('9999999992', response.content)
+        self.assertEqual(self.get_allowed(1, etag=door1_etag).status_code, 304)
+
+        t_info("Take door 1 away from Mr. Burns", 3)
+        LockUser.objects.get(pk=1).doors = [Door.objects.get(pk=4)]
+        response = self.get_allowed(1, etag=door1_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, '1122135199\0')
+
+        t_info("Reverse: give door 1 back to Mr. Burns from the door's side", 3)
+        etag = response['ETag']
+        Door.objects.get(pk=1).lockuser_set.add(LockUser.objects.get(pk=1))
+        self.assertEqual(self.get_allowed(1, etag=etag).status_code, 200)
+
+    def test_saving_door_keeps_version(self):
+        """ Saving a Door fetched before its version was bumped does not write
+        the old version back """
+        door = Door.objects.get(pk=2)
+        version = door.allowlist_version
+        LockUser.objects.get(pk=1).doors.add(door)
+        door.description = 'Changed'
+        door.save()
+        self.assertEqual(Door.objects.get(pk=2).allowlist_version, version + 1)
+
+    def test_allowlist_is_cached_per_version(self):
+        """ Once rendered, the allowlist at the same version is served from the
+        cache (only the version is queried) """
+        first = self.get_allowed(2)
+        with self.assertNumQueries(1):
+            second = self.get_allowed(2)
+        self.assertEqual(first.content, second.content)
+
+    def test_binary_format(self):
+        """ ?format=binary: header, then sorted 5-byte big-endian RFIDs """
+        response = self.client.get('/door/1/getallowed/?format=binary')
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        version = Door.objects.get(pk=1).allowlist_version
+        self.assertEqual(response['ETag'], '"1-%d-binary2"' % version)
+        content = response.content
+        header_size = allowlists.BINARY_HEADER.size
+        magic, format_version, rfid_size, count, door_version, crc = \
+            allowlists.BINARY_HEADER.unpack(content[:header_size])
+        entries = content[header_size:]
+        self.assertEqual((magic, format_version, rfid_size, count, door_version),
+                         ('RFAL', 2, 5, 2, version))
+        self.assertEqual(crc, zlib.crc32(entries) & 0xffffffff)
+        self.assertEqual(entries, '\x11\x22\x13\x51\x22\x11\x22\x13\x51\x99')
+        self.assertEqual(
+            [entries[i:i + 5].encode('hex') for i in (0, 5)],
+            ['1122135122', '1122135199'])
+
+        t_info("Also by Accept header; the text format is unchanged", 3)
+        response = self.client.get('/door/1/getallowed/',
+                                   HTTP_ACCEPT='application/octet-stream')
+        self.assertEqual(response.content, content)
+        self.assertEqual(self.get_allowed(1).content, '1122135122 1122135199\0')
+
+        t_info("Conditional GET of the binary format", 3)
+        response = self.client.get('/door/1/getallowed/?format=binary',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_binary_format_packs_hexadecimal_rfids(self):
+        """ Binary format: RFIDs are packed as the hexadecimal numbers they
+        spell, letters and all; any that aren't hexadecimal are left out,
+        with a warning """
+        self.assertEqual(allowlists.pack_rfid('abcde12345'),
+                         '\xab\xcd\xe1\x23\x45')
+        self.assertEqual(allowlists.pack_rfid('FFFFFFFFFF'), '\xff' * 5)
+        render = allowlists.render_binary(7)
+        warnings = []
+        warning = allowlists.logger.warning
+        allowlists.logger.warning = lambda *args: warnings.append(args)
+        try:
+            content = render(['abcde12345', '0000000010', 'wxyz_12345'])
+        finally:
+            allowlists.logger.warning = warning
+        self.assertEqual(len(warnings), 1)
+        self.assertEqual(warnings[0][1:], (1, 7, 'wxyz_12345'))
+        count = allowlists.BINARY_HEADER.unpack(
+            content[:allowlists.BINARY_HEADER.size])[3]
+        self.assertEqual(count, 2)
+        self.assertEqual(content[allowlists.BINARY_HEADER.size:],
+                         allowlists.pack_rfid('0000000010') +
+                         allowlists.pack_rfid('abcde12345'))
+
+        t_info("A keycard with letters in its RFID is in its door's list", 3)
+        lockuser = LockUser.objects.get(pk=3)
+        RFIDkeycard.objects.filter(lockuser=lockuser).update(
+            date_revoked=datetime.datetime.now())
+        RFIDkeycard.objects.create(the_rfid='abcde12345', lockuser=lockuser,
+                                   assigner=User.objects.get(username='moe'))
+        content = self.client.get('/door/2/getallowed/?format=binary').content
+        self.assertIn(allowlists.pack_rfid('abcde12345'),
+                      content[allowlists.BINARY_HEADER.size:])
+
+
+class AllowlistChangesTests(TestCase):
+    fixtures = ['initial.json']
+
+    def setUp(self):
+        self.client = Client()
+        t_info("TestCase AllowlistChangesTests", 1)
+        t_info(self._testMethodName + ": " + self._testMethodDoc, 2)
+        cache.clear()
+
+    def get_changes(self, doorid, since=None):
+        url = '/door/%d/allowed_changes/' % doorid
+        if since is not None:
+            url += '?since=%d' % since
+        return self.client.get(url).content
+
+    def test_full_list_without_since(self):
+        """ No since: the whole list, with the current version """
+        version = Door.objects.get(pk=1).allowlist_version
+        self.assertEqual(self.get_changes(1),
+                         'full %d 1122135122 1122135199\0' % version)
+
+    def test_no_changes(self):
+        """ since is the current version: nothing added or revoked """
+        version = Door.objects.get(pk=1).allowlist_version
+        self.assertEqual(self.get_changes(1, version), 'delta %d\0' % version)
+
+    def test_added_and_revoked(self):
+        """ Only what changed since the given version """
+        version = Door.objects.get(pk=2).allowlist_version
+
+        t_info("Revoke Lisa's keycard; give Mr. Burns door 2", 3)
+        keycard = RFIDkeycard.objects.get(the_rfid='9999999992')
+        keycard.deactivate(User.objects.get(username='moe'))
+        keycard.save()
+        LockUser.objects.get(pk=1).doors.add(Door.objects.get(pk=2))
+
+        new_version = Door.objects.get(pk=2).allowlist_version
+        self.assertEqual(new_version, version + 2)
+        self.assertEqual(self.get_changes(2, version),
+                         'delta %d +1122135122 -9999999992\0' % new_version)
+        self.assertEqual(self.get_changes(2, version + 1),
+                         'delta %d +1122135122\0' % new_version)
+
+        t_info("Door 1 didn't change", 4)
+        version = Door.objects.get(pk=1).allowlist_version
+        self.assertEqual(self.get_changes(1, version), 'delta %d\0' % version)
+
+    def test_assigning_doors_journals_the_difference(self):
+        """ Assigning a LockUser's doors (which clears them, then adds the
+        new ones) journals only the doors added or taken away """
+        burns = LockUser.objects.get(pk=1)
+        door_ids = sorted(burns.doors.values_list('pk', flat=True))
+        versions = dict(Door.objects.values_list('pk', 'allowlist_version'))
+        changes = AllowlistChange.objects.count()
+        burns.doors = Door.objects.filter(pk__in=door_ids)
+        self.assertEqual(
+            dict(Door.objects.values_list('pk', 'allowlist_version')),
+            versions)
+        self.assertEqual(AllowlistChange.objects.count(), changes)
+
+        t_info("Swap the first door for door 2", 3)
+        burns.doors = Door.objects.filter(pk__in=door_ids[1:] + [2])
+        self.assertEqual(self.get_changes(door_ids[0], versions[door_ids[0]]),
+                         'delta %d -1122135122\0' % (versions[door_ids[0]] + 1))
+        self.assertEqual(self.get_changes(2, versions[2]),
+                         'delta %d +1122135122\0' % (versions[2] + 1))
+        for door_id in door_ids[1:]:
+            self.assertEqual(Door.objects.get(pk=door_id).allowlist_version,
+                             versions[door_id])
+
+        t_info("No doors at all", 3)
+        burns.doors = []
+        self.assertEqual(self.get_changes(2, versions[2] + 1),
+                         'delta %d -1122135122\0' % (versions[2] + 2))
+
+    def test_saving_unchanged_keycard_keeps_version(self):
+        """ Saving a keycard without revoking it or changing its RFID journals
+        nothing; changing its RFID revokes the old one """
+        version = Door.objects.get(pk=2).allowlist_version
+        keycard = RFIDkeycard.objects.get(the_rfid='9999999992')
+        keycard.assigner = User.objects.get(username='superuser')
+        keycard.save()
+        self.assertEqual(Door.objects.get(pk=2).allowlist_version, version)
+
+        t_info("New RFID", 3)
+        keycard.the_rfid = '9999999993'
+        keycard.save()
+        self.assertEqual(self.get_changes(2, version),
+                         'delta %d +9999999993 -9999999992\0' % (version + 1))
+
+    def test_lockuser_without_keycard_does_not_change_version(self):
+        """ Giving a door to a lockuser with no active keycard does not change
+        the door's allowlist """
+        version = Door.objects.get(pk=3).allowlist_version
+        lu = LockUser.objects.create(first_name='No', last_name='Keycard',
+                                     email='nokeycard@example.com')
+        lu.doors.add(Door.objects.get(pk=3))
+        self.assertEqual(Door.objects.get(pk=3).allowlist_version, version)
+
+    def test_full_list_when_too_old(self):
+        """ Journal pruned, or since from the future: the whole list """
+        door = Door.objects.get(pk=2)
+        version = door.allowlist_version
+        LockUser.objects.get(pk=1).doors.add(door)
+        AllowlistChange.objects.filter(door=door, version=version + 1).delete()
+        self.assertEqual(self.get_changes(2, version),
+                         'full %d 1122135122 1122135199 9999999992\0' % (
+                             version + 1))
+        self.assertTrue(self.get_changes(2, version + 5).startswith('full'))
+
+
+class AllowlistWaitTests(TestCase):
+    fixtures = ['initial.json']
+
+    def setUp(self):
+        self.client = Client()
+        t_info("TestCase AllowlistWaitTests", 1)
+        t_info(self._testMethodName + ": " + self._testMethodDoc, 2)
+        cache.clear()
+        # only notifications, not the periodic database check, wake waiters
+        self.wait_settings = self.settings(ALLOWLIST_WAIT_POLL_SECONDS=0.01,
+                                           ALLOWLIST_WAIT_RECHECK_SECONDS=3600)
+        self.wait_settings.enable()
+
+    def tearDown(self):
+        self.wait_settings.disable()
+
+    def wait_changes(self, doorid, since, timeout):
+        return self.client.get('/door/%d/wait_changes/?since=%d&timeout=%s' % (
+            doorid, since, timeout)).content
+
+    def test_timeout(self):
+        """ No change within the timeout: empty delta at the same version """
+        version = Door.objects.get(pk=2).allowlist_version
+        self.assertEqual(self.wait_changes(2, version, 0.05),
+                         'delta %d\0' % version)
+
+    def test_timeout_not_a_finite_number(self):
+        """ A timeout that is NaN or infinite waits ALLOWLIST_WAIT_TIMEOUT,
+        as if left out """
+        version = Door.objects.get(pk=2).allowlist_version
+        with self.settings(ALLOWLIST_WAIT_TIMEOUT=0.05):
+            for timeout in ('nan', 'inf'):
+                self.assertEqual(self.wait_changes(2, version, timeout),
+                                 'delta %d\0' % version)
+
+    def test_old_version_answered_right_away(self):
+        """ since is not the current version: the changes, without waiting """
+        version = Door.objects.get(pk=2).allowlist_version
+        LockUser.objects.get(pk=1).doors.add(Door.objects.get(pk=2))
+        self.assertEqual(self.wait_changes(2, version, 3600),
+                         'delta %d +1122135122\0' % (version + 1))
+
+    def test_woken_by_revocation(self):
+        """ A keycard revoked while the lock waits is sent as soon as it
+        happens """
+        version = Door.objects.get(pk=2).allowlist_version
+        real_sleep = allowlists.time.sleep
+
+        def revoke_while_sleeping(seconds):
+            allowlists.time.sleep = real_sleep
+            keycard = RFIDkeycard.objects.get(the_rfid='9999999992')
+            keycard.deactivate(User.objects.get(username='moe'))
+            keycard.save()
+
+        allowlists.time.sleep = revoke_while_sleeping
+        try:
+            self.assertEqual(self.wait_changes(2, version, 3600),
+                             'delta %d -9999999992\0' % (version + 1))
+        finally:
+            allowlists.time.sleep = real_sleep
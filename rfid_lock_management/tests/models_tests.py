@@ -1,9 +1,12 @@
 from datetime import datetime, timedelta
+from StringIO import StringIO
 from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase, LiveServerTestCase
 from django.test.client import Client
 from rfid_lock_management.models import *
-from django.contrib.auth.models import Permission
+from django.contrib.auth.models import Group, Permission
+from django.core.exceptions import ValidationError
 from django.contrib.contenttypes.models import ContentType
 #from django.utils.timezone import utc
 from test_helpers import t_info
@@ -24,25 +27,31 @@ class DoorModelTests(TestCase):
 
     def test_door_perm_creation(self):
         """
-        When a new Door is added, create a corresponding Permission (i.e.
-        checking Door's save() method)
+        When a new Door is added, no Permission is created for it: who may
+        manage it is up to its DoorACLEntries
         """
         door_name = "Test door"
         door = Door(name=door_name)
         # explicitly save()'ing rather than Door.objects.create()
         door.save()
 
-        # now check that both door and associated permission exist
+        # now check that the door exists, but no associated permission
         d = Door.objects.filter(name=door_name)
         self.assertTrue(d)
+        self.assertFalse(Permission.objects.filter(
+            codename='can_manage_door_%d' % door.pk))
 
-        # note: door_name, not door.name
-        p = Permission.objects.filter(codename='can_manage_door_%d' % door.pk,
-            name='Can manage door to %s' % door_name,
-            content_type=ContentType.objects.get(
-                app_label='rfid_lock_management',
-                model='door'))
-        self.assertTrue(p)
+        # a DoorACLEntry needs a user or a group, not both
+        staff_only_user = User.objects.create_user(
+            'johnny_staff', 'js@jmail.com', 'my_password')
+        group = Group.objects.create(name='Test group')
+        for user, group_or_none in ((None, None), (staff_only_user, group)):
+            entry = DoorACLEntry(door=door, user=user, group=group_or_none)
+            self.assertRaises(ValidationError, entry.full_clean)
+        entry = DoorACLEntry(door=door, user=staff_only_user)
+        entry.full_clean()
+        entry.save()
+        self.assertEqual(unicode(entry), 'johnny_staff may manage Test door')
 
 
 class AccessTimeModelTests(TestCase):
@@ -450,14 +459,20 @@ class LockUserModelTests(TestCase):
 
         # test the result for one lockuser
         self.assertEqual(lu1.get_last_access_time(), at3.access_time)
+        self.assertEqual(
+            LockUser.objects.get(pk=lu1.pk).get_last_access_time(),
+            at3.access_time)
 
         # Testing the case when there are no access times: delete the access
-        # times just created for this lock user
+        # times just created for this lock user (which leaves the stored last
+        # access time for repair to clear)
         at1.delete()
         at2.delete()
         at3.delete()
+        self.assertEqual(LockUser.objects.repair(), 1)
 
         # and test again
+        lu1 = LockUser.objects.get(pk=lu1.pk)
         self.assertEqual(lu1.get_last_access_time(), None)
 
     def test_prettify_get_last_access_time(self):
@@ -487,8 +502,10 @@ class LockUserModelTests(TestCase):
         at1.delete()
         at2.delete()
         at3.delete()
+        LockUser.objects.repair()
 
         # and test again
+        lu1 = LockUser.objects.get(pk=lu1.pk)
         self.assertEqual(lu1.prettify_get_last_access_time(), None)
 
     def test_custom_save_deactivate_keycard(self):
@@ -531,7 +548,7 @@ class LockUserModelTests(TestCase):
             'johnny_staff', 'js@jmail.com', 'my_password')
         new_nks_obj = NewKeycardScan.objects.create(
             rfid='abcdefghij', assigner_user=staff_only_user,
-            ready_to_assign=True)
+            ready_to_assign=True, lockuser=lu)
         num_rk_before = len(RFIDkeycard.objects.all())
         lu.save()
 
@@ -579,3 +596,72 @@ class LockUserModelTests(TestCase):
             at3.access_time.strftime("%B %d, %Y, %I:%M %p"), link)
         self.assertEqual(lu.last_access_time_and_link_to_more(),
             correct_output_string)
+
+    def test_current_keycard_is_stored(self):
+        """
+        Check that current_keycard follows the keycard being assigned and
+        deactivated
+        """
+        lu = LockUser.objects.create(
+            first_name='Jane', last_name='Doe', email='jdoe@gmail.com')
+        self.assertEqual(lu.current_keycard, None)
+        staff_only_user = User.objects.create_user(
+            'johnny_staff', 'js@jmail.com', 'my_password')
+        rk = RFIDkeycard.objects.create(
+            the_rfid='abcde12345', lockuser=lu, assigner=staff_only_user)
+        self.assertEqual(LockUser.objects.get(pk=lu.pk).current_keycard, rk)
+
+        # saving a stale copy doesn't write the old (empty) value back
+        stale = LockUser.objects.get(pk=lu.pk)
+        stale.current_keycard = None
+        stale.save()
+        self.assertEqual(LockUser.objects.get(pk=lu.pk).current_keycard, rk)
+
+        lu = LockUser.objects.get(pk=lu.pk)
+        lu.deactivate_current_keycard = True
+        lu.current_keycard_revoker = staff_only_user
+        lu.save()
+        self.assertEqual(lu.current_keycard, None)
+        self.assertEqual(LockUser.objects.get(pk=lu.pk).current_keycard, None)
+        self.assertFalse(LockUser.objects.get(pk=lu.pk).is_active())
+
+    def test_record_accesses(self):
+        """
+        Check that record_accesses keeps the latest access time and door,
+        whatever order the access times come in
+        """
+        lu = LockUser.objects.create(
+            first_name='Jane', last_name='Doe', email='jdoe@gmail.com')
+        door1 = Door.objects.create(name='Test door 1')
+        door2 = Door.objects.create(name='Test door 2')
+        now = datetime.datetime.now()
+        later = AccessTime(access_time=now, lockuser=lu, door=door2)
+        earlier = AccessTime(access_time=now - timedelta(hours=1),
+                             lockuser=lu, door=door1)
+        LockUser.objects.record_accesses([earlier, later])
+        lu = LockUser.objects.get(pk=lu.pk)
+        self.assertEqual((lu.last_access_time, lu.last_access_door),
+                         (now, door2))
+
+        t_info("An older access time recorded afterwards is ignored", 3)
+        LockUser.objects.record_accesses([earlier])
+        lu = LockUser.objects.get(pk=lu.pk)
+        self.assertEqual((lu.last_access_time, lu.last_access_door),
+                         (now, door2))
+
+    def test_repair_lockusers_command(self):
+        """
+        Check that repair_lockusers sets stale current keycards and last
+        access times right
+        """
+        lu = LockUser.objects.create(
+            first_name='Jane', last_name='Doe', email='jdoe@gmail.com')
+        at = AccessTime.objects.create(
+            access_time=datetime.datetime.now(), lockuser=lu)
+        LockUser.objects.filter(pk=lu.pk).update(last_access_time=None)
+        stdout = StringIO()
+        call_command('repair_lockusers', stdout=stdout)
+        self.assertEqual(stdout.getvalue(), "Repaired 1 lock users.\n")
+        self.assertEqual(LockUser.objects.get(pk=lu.pk).last_access_time,
+                         at.access_time)
+        self.assertEqual(LockUser.objects.repair(), 0)
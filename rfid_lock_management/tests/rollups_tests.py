@@ -0,0 +1,138 @@
+import datetime
+from StringIO import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.client import Client
+from django.utils import simplejson
+from rfid_lock_management import rollups, swipes
+from rfid_lock_management.models import (AccessTime, DailyAccessCount,
+                                          HourlyAccessCount, RFIDkeycard)
+from test_helpers import t_info
+
+
+class RollupsTests(TestCase):
+    fixtures = ['initial.json']
+
+    def setUp(self):
+        t_info("TestCase RollupsTests", 1)
+        t_info(self._testMethodName + ": " + self._testMethodDoc, 2)
+        rollups.rebuild()   # (loading the fixture doesn't count them)
+
+    def assertCountsMatch(self):
+        """ The rollups agree with the AccessTime table """
+        for model, bucket in ((HourlyAccessCount, 'hour'),
+                              (DailyAccessCount, 'day')):
+            expected = {}
+            for at in AccessTime.objects.all():
+                time = at.access_time.replace(minute=0, second=0,
+                                              microsecond=0)
+                if bucket == 'day':
+                    time = time.date()
+                key = (at.door_id, at.lockuser_id, time)
+                expected[key] = expected.get(key, 0) + 1
+            self.assertEqual(
+                dict(((door_id, lockuser_id, time), count)
+                     for door_id, lockuser_id, time, count in
+                     model.objects.values_list('door', 'lockuser', bucket,
+                                               'count')),
+                expected)
+
+    def test_counted_when_written(self):
+        """ AccessTimes are counted in the rollups as they are written """
+        self.assertCountsMatch()
+
+        t_info('One more, in an hour that already has one', 3)
+        at = AccessTime.objects.order_by('pk')[0]
+        AccessTime.objects.create(
+            access_time=at.access_time + datetime.timedelta(seconds=1),
+            door=at.door, lockuser=at.lockuser)
+        self.assertCountsMatch()
+
+        t_info('A lower pk written after a higher one', 3)
+        last_pk = AccessTime.objects.latest('pk').pk
+        for pk in (last_pk + 10, last_pk + 5):
+            AccessTime.objects.create(pk=pk,
+                                      access_time=datetime.datetime.now(),
+                                      door_id=1, lockuser_id=1)
+        self.assertCountsMatch()
+
+        t_info('A batch of swipes, with one bulk insert', 3)
+        keycard = RFIDkeycard.objects.filter(date_revoked__isnull=True)[0]
+        swipes.check_swipes([(1, keycard.the_rfid, None),
+                             (2, keycard.the_rfid, None),
+                             (1, keycard.the_rfid, None)])
+        self.assertCountsMatch()
+
+    def test_rebuild_in_chunks(self):
+        """ rebuild() counts everything again, a chunk at a time """
+        HourlyAccessCount.objects.update(count=100)
+        self.assertEqual(rollups.rebuild(chunk_size=7),
+                         AccessTime.objects.count())
+        self.assertCountsMatch()
+
+    def test_rebuild_command(self):
+        """ The rebuild_access_rollups command rebuilds the rollups """
+        DailyAccessCount.objects.create(door_id=1, lockuser_id=1,
+                                        day=datetime.date(2000, 1, 1),
+                                        count=5)
+        call_command('rebuild_access_rollups', chunk_size=10,
+                     stdout=StringIO())
+        self.assertCountsMatch()
+
+    def test_chart_data_per_hour(self):
+        """ chart_data per=hour: each lock user's visits per hour, from the
+        rollups """
+        client = Client()
+        client.login(username='moe', password='moe')
+        response = client.get('/chart/data/?per=hour&door=2')
+        all_series = simplejson.loads(response.content)
+        self.assertEqual(len(all_series), 1)
+        self.assertEqual(sum(point['count'] for point in all_series[0]['data']),
+                         AccessTime.objects.filter(door=2).count())
+        self.assertEqual(
+            len(all_series[0]['data']),
+            HourlyAccessCount.objects.filter(door=2).count())
+
+        t_info('A new AccessTime is in the next response', 3)
+        AccessTime.objects.create(access_time=datetime.datetime.now(),
+                                  door_id=2, lockuser_id=1)
+        response = client.get('/chart/data/?per=hour&door=2',
+                              HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sum(point['count']
+                for point in simplejson.loads(response.content)[0]['data']),
+            AccessTime.objects.filter(door=2).count())
+
+    def test_admin_date_hierarchy(self):
+        """ The AccessTime admin's date drilldown reads the rollups, not the
+        AccessTimes """
+        client = Client()
+        client.login(username='moe', password='moe')
+        old_debug = settings.DEBUG
+        settings.DEBUG = True   # record connection.queries
+        try:
+            connection.queries = []
+            response = client.get(
+                '/lockadmin/rfid_lock_management/accesstime/'
+                '?door__id__exact=1&access_time__year=2013')
+            queries = [query['sql'] for query in connection.queries]
+        finally:
+            settings.DEBUG = old_debug
+        self.assertEqual(response.status_code, 200)
+        for sql in queries:
+            if '"rfid_lock_management_accesstime"' in sql:
+                self.assertNotIn('django_date_trunc', sql)
+                self.assertNotIn('MIN(', sql)
+
+        t_info('Links to the months with AccessTimes at the door', 3)
+        months = DailyAccessCount.objects.filter(
+            door=1, day__year=2013).dates('day', 'month')
+        self.assertTrue(months)
+        for month in months:
+            self.assertContains(
+                response, 'access_time__month=%d' % month.month)
+        self.assertNotContains(response, 'day__')
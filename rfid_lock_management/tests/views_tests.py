@@ -1,10 +1,15 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from gzip import GzipFile
+from StringIO import StringIO
 import simplejson
 from django.contrib.auth.models import Permission, User
 from django.contrib.contenttypes.models import ContentType
 #from django.utils.timezone import utc
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
 from django.test.client import Client
+from rfid_lock_management import charts, rollups, scan_state
 from rfid_lock_management.views import get_allowed_rfids
 from rfid_lock_management.models import *
 from test_helpers import t_info
@@ -16,14 +21,15 @@ class ChartDataTests(TestCase):
         t_info('TestCase ChartDataTests', 1)
         t_info(self._testMethodName + ': ' + self._testMethodDoc, 2)
         self.client = Client()
+        self.client.login(username='moe', password='moe')
 
     def test_chartify(self):
-        """ Does chartify() return response with the correct(ly formatted) data
-        for HighChart plot of access times?  """
+        """ Does chartify() return the chart page, set to fetch the last
+        CHART_DEFAULT_DAYS days of data? """
         # login as staff user in fixture
         self.client.login(username='moe', password='moe')
-        response = self.client.get('/chart/')
-        #response.context['chart_data']
+        with self.settings(CHART_DEFAULT_DAYS=10):
+            response = self.client.get('/chart/')
 
         t_info('Check response status code', 4)
         self.assertEqual(response.status_code, 200)
@@ -31,25 +37,158 @@ class ChartDataTests(TestCase):
         t_info('Check response content type', 4)
         self.assertEqual(response['content-type'], 'text/html; charset=utf-8')
 
-        # tooltip hardcoded in view as well
-        tooltip = {'followPointer': 'false', 'pointFormat': '"{point.user}"'}
-        all_doors_series = []
-        for door in Door.objects.all():
-            # get the data points for this door
-            at_this_door = AccessTime.objects.filter(door=door)
-            data_points_values_list = at_this_door.values_list('data_point')
-            data = [simplejson.loads(dp[0]) for dp in data_points_values_list]
-            # create door series
-            door_series = {'name': '"%s"' % door.name,
-                           'data': data,
-                           'tooltip': tooltip}
-            # append to list of all door series
-            all_doors_series.append(door_series)
-
-        t_info('Check response context for chart_type string', 4)
-        # the one we're really interested in
-        self.assertEqual(response.context['chart_data'],
-            simplejson.dumps(all_doors_series, indent=''))
+        t_info('Check response context for the date range', 4)
+        today = datetime.date.today()
+        self.assertEqual(response.context['chart_from'],
+                         (today - timedelta(days=10)).strftime('%Y-%m-%d'))
+        self.assertEqual(response.context['chart_to'],
+                         today.strftime('%Y-%m-%d'))
+
+    def get_chart_data(self, query='', **extra):
+        return self.client.get('/chart/data/' + query, **extra)
+
+    def test_chart_data(self):
+        """ Does chart_data return a series for each door, with every
+        AccessTime at that door in time order, as the chart's points? """
+        response = self.get_chart_data()
+        self.assertEqual(response['content-type'], 'application/json')
+        all_series = simplejson.loads(response.content)
+
+        expected = []
+        for door in Door.objects.order_by('pk'):
+            data = []
+            for at in AccessTime.objects.filter(door=door).order_by(
+                    'access_time'):
+                day = at.access_time.date() - date(1970, 1, 1)
+                data.append({
+                    'x': day.days * 24 * 60 * 60 * 1000,
+                    'y': ((at.access_time.hour * 60 + at.access_time.minute) *
+                          60 + at.access_time.second) * 1000,
+                    'user': unicode(at.lockuser)})
+            if data:
+                expected.append({'name': door.name, 'data': data})
+        self.assertEqual(all_series, expected)
+        self.assertEqual([len(series['data']) for series in all_series],
+                         [15, 26, 11])
+
+    def test_chart_data_range_and_doors(self):
+        """ from, to and door limit the AccessTimes """
+        response = self.get_chart_data(
+            '?from=2013-04-10&to=2013-04-10&door=1&door=3')
+        all_series = simplejson.loads(response.content)
+        self.assertEqual([series['name'] for series in all_series],
+                         [Door.objects.get(pk=1).name,
+                          Door.objects.get(pk=3).name])
+        self.assertEqual(
+            sum(len(series['data']) for series in all_series),
+            AccessTime.objects.filter(
+                door__in=[1, 3], access_time__gte=datetime.datetime(2013, 4, 10),
+                access_time__lt=datetime.datetime(2013, 4, 11)).count())
+
+        t_info('Nothing in the range: no series', 4)
+        self.assertEqual(self.get_chart_data('?from=2020-01-01').content, '[]')
+
+        t_info('Bad parameters', 4)
+        for query in ('?from=yesterday', '?to=2013-13-01', '?door=front'):
+            self.assertEqual(self.get_chart_data(query).status_code, 400)
+
+    def test_chart_data_points(self):
+        """ points: no more than that many points per door, the first and
+        last among them """
+        full = simplejson.loads(self.get_chart_data().content)
+        all_series = simplejson.loads(
+            self.get_chart_data('?points=12').content)
+        self.assertEqual([len(series['data']) for series in all_series],
+                         [12, 12, 11])
+        for series, full_series in zip(all_series, full):
+            self.assertEqual(series['data'][0], full_series['data'][0])
+            self.assertEqual(series['data'][-1], full_series['data'][-1])
+            for point in series['data']:
+                self.assertIn(point, full_series['data'])
+        t_info('Door 3 has only 11: all of them', 4)
+        self.assertEqual(all_series[2], full[2])
+
+        t_info('Per hour, too', 4)
+        rollups.rebuild()   # (loading the fixture doesn't count them)
+        all_series = simplejson.loads(
+            self.get_chart_data('?per=hour&points=3').content)
+        self.assertEqual([len(series['data']) for series in all_series],
+                         [3, 3, 3])
+
+        t_info('The series, after the counts', 4)
+        # session, user; ETag; counts; the data
+        with self.assertNumQueries(5):
+            self.get_chart_data('?points=12').content
+
+        t_info('Bad parameters', 4)
+        for query in ('?points=2', '?points=many'):
+            self.assertEqual(self.get_chart_data(query).status_code, 400)
+
+    def test_lttb(self):
+        """ lttb() keeps the first and last rows and each bucket's peak """
+        rows = [(i, 0) for i in range(20)]
+        rows[7] = (7, 100)
+        rows[15] = (15, -50)
+        picked = list(charts.lttb(iter(rows), len(rows), 5,
+                                  x=lambda row: row[0], y=lambda row: row[1]))
+        self.assertEqual(len(picked), 5)
+        self.assertEqual(picked[0], rows[0])
+        self.assertEqual(picked[-1], rows[-1])
+        self.assertIn((7, 100), picked)
+        self.assertIn((15, -50), picked)
+
+        t_info('No more rows than the threshold: all of them', 4)
+        self.assertEqual(list(charts.lttb(iter(rows), 20, 20, x=None, y=None)),
+                         rows)
+
+        t_info('More rows than counted: in the last bucket', 4)
+        picked = list(charts.lttb(iter(rows), 10, 5, x=lambda row: row[0],
+                                  y=lambda row: row[1]))
+        self.assertEqual(len(picked), 5)
+        self.assertEqual(picked[-1], rows[-1])
+
+    def test_chart_data_queries(self):
+        """ All the series in one query, after the one for the ETag """
+        # session, user; ETag; the data
+        with self.assertNumQueries(4):
+            self.get_chart_data().content
+
+    def test_chart_data_etag(self):
+        """ Not modified until an AccessTime is added in the range """
+        etag = self.get_chart_data('?from=2013-01-01')['ETag']
+        response = self.get_chart_data('?from=2013-01-01',
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, '')
+
+        t_info('Another range has its own ETag', 4)
+        self.assertNotEqual(self.get_chart_data('?from=2013-01-02')['ETag'],
+                            etag)
+
+        t_info("Revoking a keycard doesn't change it", 4)
+        keycard = RFIDkeycard.objects.filter(date_revoked=None)[0]
+        keycard.deactivate(User.objects.get(username='moe'))
+        keycard.save()
+        self.assertEqual(self.get_chart_data(
+            '?from=2013-01-01', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        t_info('A new AccessTime changes it', 4)
+        AccessTime.objects.create(access_time=datetime.datetime.now(),
+                                  door_id=1, lockuser_id=1)
+        response = self.get_chart_data('?from=2013-01-01',
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_chart_data_gzip(self):
+        """ gzipped for clients that accept it """
+        plain = self.get_chart_data().content
+        response = self.get_chart_data(HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(
+            GzipFile(fileobj=StringIO(response.content)).read(), plain)
+        self.assertTrue(len(response.content) < len(plain))
 
 
 class NewKeycardScanTests(TestCase):
@@ -164,8 +303,18 @@ class NewKeycardScanTests(TestCase):
         t_info('There should be no NewKeycardScan objects to begin with', 4)
         self.assertFalse(NewKeycardScan.objects.all())
 
+        t_info('Creating the door the keycard will be scanned at', 3)
+        door = Door.objects.create(name='Space 1')
+
+        t_info('Without a door: no NewKeycardScan object', 3)
+        response = self.client.get('/start_scan/1/')
+        self.assertEqual(simplejson.loads(response.content)['error_mess'],
+            'Choose the door the keycard will be scanned at.')
+        self.assertFalse(NewKeycardScan.objects.all())
+
         t_info('Getting response..........', 3)
-        response = self.client.get('/start_scan/1/')  # lockuser object id is 1
+        # lockuser object id is 1
+        response = self.client.get('/start_scan/1/?door=%d' % door.pk)
 
         t_info('Check response status code', 4)
         self.assertEqual(response.status_code, 200)
@@ -187,6 +336,8 @@ class NewKeycardScanTests(TestCase):
         t_info('Check that NewKeycardScan object has correct attributes', 4)
         self.assertTrue(new_nks_obj.waiting_for_scan)
         self.assertEqual(new_nks_obj.assigner_user, self.staff_only_user)
+        self.assertEqual(new_nks_obj.door, door)
+        self.assertEqual(new_nks_obj.lockuser, lu)
 
 
     ################################################
@@ -362,3 +513,224 @@ class NewKeycardScanTests(TestCase):
         self.assertEqual(simplejson.loads(response.content)['success'], False)
         self.assertEqual(simplejson.loads(response.content)['error_mess'],
             'A keycard with the same RFID is already assigned to %s.' % lu)
+
+
+class ScanStateTests(TestCase):
+    fixtures = ['initial.json']
+
+    def setUp(self):
+        t_info('TestCase ScanStateTests', 1)
+        t_info(self._testMethodName + ': ' + self._testMethodDoc, 2)
+        self.client = Client()
+        self.client.login(username='moe', password='moe')
+        cache.clear()
+
+    def start_scan(self, lockuser, doorid):
+        response = self.client.get('/start_scan/%d/?door=%d' % (lockuser.pk,
+                                                                doorid))
+        return simplejson.loads(response.content)['new_scan_pk']
+
+    def new_lockuser(self, name):
+        return LockUser.objects.create(first_name=name, last_name='Card',
+                                       email='%s@example.com' % name)
+
+    def test_nothing_pending_costs_no_queries(self):
+        """ No new keycard scan pending: after the first lookup, asking the
+        registry costs no queries """
+        self.assertEqual(scan_state.waiting_at_door(2), None)
+        self.assertEqual(scan_state.ready_for_lockuser(1), None)
+        with self.assertNumQueries(0):
+            self.assertEqual(scan_state.waiting_at_door(2), None)
+            self.assertEqual(scan_state.ready_for_lockuser(1), None)
+
+    def test_registry_follows_enrollment(self):
+        """ The registry follows a new keycard scan from start_scan, through
+        the swipe and done_scan, to assigning the keycard """
+        lockuser = self.new_lockuser('New')
+        new_scan_pk = self.start_scan(lockuser, 2)
+        self.assertEqual(scan_state.waiting_at_door(2), new_scan_pk)
+
+        t_info('The swipe is recorded, not authenticated', 3)
+        response = self.client.get('/checkdoor/2/checkrfid/5555555555/')
+        self.assertEqual(response.content, '0')
+        self.assertEqual(NewKeycardScan.objects.get(pk=new_scan_pk).rfid,
+                         '5555555555')
+
+        t_info('Done: ready to assign', 3)
+        self.client.get('/done_scan/%d/' % new_scan_pk)
+        self.assertEqual(scan_state.waiting_at_door(2), None)
+        self.assertEqual(scan_state.ready_for_lockuser(lockuser.pk),
+                         new_scan_pk)
+        t_info('Swipes are authenticated again', 3)
+        response = self.client.get('/checkdoor/2/checkrfid/9999999992/')
+        self.assertEqual(response.content, '1')
+
+        t_info('Assigned on LockUser save', 3)
+        lockuser.save()
+        self.assertEqual(scan_state.ready_for_lockuser(lockuser.pk), None)
+        self.assertEqual(lockuser.get_current_rfid().the_rfid, '5555555555')
+
+    def test_concurrent_scans_at_different_doors(self):
+        """ Scans at two doors at once each get the swipe at their own door;
+        swipes at other doors are authenticated as usual """
+        first, second = self.new_lockuser('First'), self.new_lockuser('Second')
+        first_scan_pk = self.start_scan(first, 2)
+        second_scan_pk = self.start_scan(second, 3)
+
+        self.assertEqual(
+            self.client.get('/checkdoor/3/checkrfid/3333333333/').content, '0')
+        self.assertEqual(
+            self.client.get('/checkdoor/2/checkrfid/2222222222/').content, '0')
+        self.assertEqual(
+            self.client.get('/checkdoor/1/checkrfid/1122135122/').content, '1')
+
+        for new_scan_pk in (first_scan_pk, second_scan_pk):
+            self.client.get('/done_scan/%d/' % new_scan_pk)
+        t_info('Each lock user gets the keycard scanned for them', 3)
+        second.save()
+        first.save()
+        self.assertEqual(first.get_current_rfid().the_rfid, '2222222222')
+        self.assertEqual(second.get_current_rfid().the_rfid, '3333333333')
+
+    def test_timed_out_scan_not_pending(self):
+        """ Once a new keycard scan has timed out, swipes at its door are
+        authenticated again, even before it is swept """
+        lockuser = self.new_lockuser('Late')
+        new_scan_pk = self.start_scan(lockuser, 2)
+        self.assertEqual(scan_state.waiting_at_door(2), new_scan_pk)
+        NewKeycardScan.objects.filter(pk=new_scan_pk).update(
+            time_initiated=datetime.datetime.now() - timedelta(minutes=3))
+        response = self.client.get('/checkdoor/2/checkrfid/9999999992/')
+        self.assertEqual(response.content, '1')
+
+
+class SweepNewKeycardScansTests(TestCase):
+    fixtures = ['initial.json']
+
+    def setUp(self):
+        t_info('TestCase SweepNewKeycardScansTests', 1)
+        t_info(self._testMethodName + ': ' + self._testMethodDoc, 2)
+        cache.clear()
+        self.assigner = User.objects.get(username='moe')
+
+    def new_scan(self, age, **kwargs):
+        new_scan = NewKeycardScan.objects.create(assigner_user=self.assigner,
+                                                 door_id=2, lockuser_id=1,
+                                                 **kwargs)
+        # (time_initiated is auto_now_add)
+        NewKeycardScan.objects.filter(pk=new_scan.pk).update(
+            time_initiated=datetime.datetime.now() - age)
+        return new_scan.pk
+
+    def test_sweep(self):
+        """ sweep() marks timed out scans and deletes finished ones, leaving
+        the live ones """
+        waiting = self.new_scan(timedelta(minutes=1))
+        timed_out = self.new_scan(timedelta(minutes=3))
+        ready = self.new_scan(timedelta(hours=2), waiting_for_scan=False,
+                              ready_to_assign=True)
+        self.new_scan(timedelta(hours=2), waiting_for_scan=False)
+        self.new_scan(timedelta(hours=25), waiting_for_scan=False,
+                      ready_to_assign=True)
+
+        self.assertEqual(NewKeycardScan.objects.sweep(batch_size=1), (1, 2))
+        self.assertEqual(
+            sorted(NewKeycardScan.objects.values_list('pk', flat=True)),
+            [waiting, timed_out, ready])
+        self.assertFalse(
+            NewKeycardScan.objects.get(pk=timed_out).waiting_for_scan)
+
+        t_info('The timed out scan is gone from the registry', 3)
+        self.assertEqual(scan_state.waiting_at_door(2), waiting)
+
+        t_info('It is deleted an hour later', 3)
+        NewKeycardScan.objects.filter(pk=timed_out).update(
+            time_initiated=datetime.datetime.now() - timedelta(minutes=61))
+        self.assertEqual(NewKeycardScan.objects.sweep(), (0, 1))
+
+    def test_sweep_command(self):
+        """ The sweep_new_keycard_scans command sweeps with its options """
+        self.new_scan(timedelta(minutes=10), waiting_for_scan=False)
+        call_command('sweep_new_keycard_scans', keep_finished=20,
+                     stdout=StringIO())
+        self.assertEqual(NewKeycardScan.objects.count(), 1)
+        call_command('sweep_new_keycard_scans', keep_finished=5,
+                     stdout=StringIO())
+        self.assertEqual(NewKeycardScan.objects.count(), 0)
+
+
+class WaitNewKeycardScanTests(TestCase):
+    fixtures = ['initial.json']
+
+    def setUp(self):
+        t_info('TestCase WaitNewKeycardScanTests', 1)
+        t_info(self._testMethodName + ': ' + self._testMethodDoc, 2)
+        self.client = Client()
+        self.client.login(username='moe', password='moe')
+        cache.clear()
+        # only the swipe's notification, not the periodic database check,
+        # wakes the waiter
+        self.wait_settings = self.settings(
+            NEW_KEYCARD_SCAN_WAIT_POLL_SECONDS=0.01,
+            NEW_KEYCARD_SCAN_WAIT_RECHECK_SECONDS=3600)
+        self.wait_settings.enable()
+        self.real_sleep = scan_state.time.sleep
+        lockuser = LockUser.objects.create(first_name='New', last_name='Card',
+                                           email='new@example.com')
+        response = self.client.get('/start_scan/%d/?door=2' % lockuser.pk)
+        self.new_scan_pk = simplejson.loads(response.content)['new_scan_pk']
+
+    def tearDown(self):
+        self.wait_settings.disable()
+        scan_state.time.sleep = self.real_sleep
+
+    def wait_scan(self, timeout):
+        return simplejson.loads(self.client.get('/wait_scan/%d/?timeout=%s' % (
+            self.new_scan_pk, timeout)).content)
+
+    def test_still_waiting(self):
+        """ No swipe within the timeout: still waiting, ask again """
+        self.assertEqual(self.wait_scan(0.05),
+                         {'success': False, 'waiting': True})
+        self.assertTrue(
+            NewKeycardScan.objects.get(pk=self.new_scan_pk).waiting_for_scan)
+
+    def test_timeout_not_a_finite_number(self):
+        """ A timeout that is NaN or infinite waits
+        NEW_KEYCARD_SCAN_WAIT_TIMEOUT, as if left out """
+        with self.settings(NEW_KEYCARD_SCAN_WAIT_TIMEOUT=0.05):
+            for timeout in ('nan', 'inf'):
+                self.assertEqual(self.wait_scan(timeout),
+                                 {'success': False, 'waiting': True})
+
+    def test_woken_by_swipe(self):
+        """ A swipe at the door while the form waits is answered as done_scan
+        would, as soon as it happens """
+        def swipe_while_sleeping(seconds):
+            scan_state.time.sleep = self.real_sleep
+            self.assertEqual(
+                Client().get('/checkdoor/2/checkrfid/5555555555/').content,
+                '0')
+
+        scan_state.time.sleep = swipe_while_sleeping
+        self.assertEqual(self.wait_scan(3600),
+                         {'success': True, 'rfid': '5555555555'})
+        new_scan = NewKeycardScan.objects.get(pk=self.new_scan_pk)
+        self.assertTrue(new_scan.ready_to_assign)
+        self.assertFalse(new_scan.waiting_for_scan)
+
+    def test_swiped_before_waiting(self):
+        """ Already swiped: answered right away """
+        self.client.get('/checkdoor/2/checkrfid/5555555555/')
+        # session, user; the scan; keycards with its RFID; saving the scan
+        with self.assertNumQueries(6):
+            self.assertEqual(self.wait_scan(3600)['rfid'], '5555555555')
+
+    def test_timed_out(self):
+        """ The scan timed out: the same answer as done_scan's """
+        NewKeycardScan.objects.filter(pk=self.new_scan_pk).update(
+            time_initiated=datetime.datetime.now() - timedelta(minutes=3))
+        result = self.wait_scan(3600)
+        self.assertFalse(result['success'])
+        self.assertTrue(result['error_mess'].startswith(
+            'Sorry, the system timed out.'))
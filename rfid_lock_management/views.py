@@ -1,11 +1,17 @@
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import (HttpResponse, HttpResponseBadRequest,
+                         HttpResponseRedirect, HttpResponseNotModified)
+from django.conf import settings
 from django.template import RequestContext
 from django.shortcuts import render_to_response
 import rfid_lock_management.models
 from datetime import datetime
 from django.utils import simplejson
 from django.contrib.auth.decorators import login_required
-from rfid_lock_management.misc_helpers import get_arg_default
+from rfid_lock_management.misc_helpers import finite_float, get_arg_default
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rfid_lock_management import (allowlists, bloom, charts, heatmap,
+                                  scan_state, swipes)
 from rfid_lock_management.models import *
 
 
@@ -19,44 +25,254 @@ def do_json_resp(success, message):
 @login_required
 def chartify(request):
     """
-    Return data in appropriate format for the HighCharts (JavaScript)
-    AccessTime plot.  Creates a series for each door.
-    """
-    tooltip_dict = {}
-    tooltip_dict['followPointer'] = 'false'
-    tooltip_dict['pointFormat'] = '"{point.user}"'
-    all_series = []
-    for door in Door.objects.all():
-        one_series = {}
-        one_series['name'] = '"%s"' % door.name
-        one_series['tooltip'] = tooltip_dict
-        this_door_access_times = AccessTime.objects.filter(door=door)
-        one_series['data'] = []
-        for at in this_door_access_times:
-            one_series['data'].append(simplejson.loads(at.data_point))
-        all_series.append(one_series)
-    extra_context = {'chart_data': simplejson.dumps(all_series, indent="")}
+    The HighCharts (JavaScript) AccessTime plot page. The page fetches the
+    data from chart_data, for the last CHART_DEFAULT_DAYS days to begin with.
+    """
+    today = datetime.date.today()
+    start = today - datetime.timedelta(
+        days=getattr(settings, 'CHART_DEFAULT_DAYS', 180))
+    extra_context = {'chart_from': start.strftime(charts.DATE_FORMAT),
+                     'chart_to': today.strftime(charts.DATE_FORMAT)}
     return render_to_response('chart.html', dictionary=extra_context,
                               context_instance=RequestContext(request))
 
 
+@login_required
+def chart_data(request):
+    """
+    Return the series for the AccessTime plot as JSON (see charts.py): a
+    series for each door, with the AccessTimes from ?from= through ?to=
+    (YYYY-MM-DD; either may be left out) at the doors given as ?door= (any
+    number of them; all doors if none). With ?per=hour, the points are each
+    lock user's visits per hour instead, from the AccessTime rollups. With
+    ?points=, a door with more points than that gets that many, picked by
+    charts.lttb().
+
+    The response carries an ETag; a request whose If-None-Match matches it
+    gets an empty 304 Not Modified. It is gzipped, as it is encoded, for
+    clients that accept that.
+    """
+    try:
+        start, end, door_ids = charts.parse_params(request.GET)
+        points = int(request.GET['points']) if request.GET.get('points') \
+            else None
+        if points is not None and points < 3:
+            raise ValueError
+    except ValueError:
+        return HttpResponseBadRequest(
+            "from and to must be YYYY-MM-DD dates, door a door id, "
+            "points a number from 3 up.")
+    if request.GET.get('per') == 'hour':
+        queryset = charts.get_hourly_counts(start, end, door_ids)
+        get_rows = charts.get_hourly_rows
+    else:
+        queryset = charts.get_access_times(start, end, door_ids)
+        get_rows = charts.get_rows
+    etag = charts.make_etag(queryset, start, end, door_ids,
+                            request.GET.get('per'), points)
+    if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+        response = HttpResponseNotModified()
+    else:
+        rows = get_rows(queryset)
+        if points is not None:
+            rows = charts.downsample(rows, charts.get_counts(queryset),
+                                     points)
+        content = charts.encode_series(rows)
+        if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+            response = HttpResponse(charts.gzip_chunks(content),
+                                    content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+
+@login_required
+def chart_heatmap(request):
+    """
+    Return the occupancy heatmaps as JSON (see heatmap.py): for each door
+    given as ?door= (all doors if none), the AccessTimes from ?from= through
+    ?to= by day of the week and hour of the day, from the AccessTime rollups.
+    As with chart_data, the response carries an ETag.
+    """
+    try:
+        start, end, door_ids = charts.parse_params(request.GET)
+    except ValueError:
+        return HttpResponseBadRequest(
+            "from and to must be YYYY-MM-DD dates, door a door id.")
+    hourly_counts = charts.get_hourly_counts(start, end, door_ids)
+    etag = charts.make_etag(hourly_counts, start, end, door_ids, 'heatmap')
+    if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+        response = HttpResponseNotModified()
+    else:
+        response_data = {'days': heatmap.DAY_NAMES,
+                         'doors': heatmap.get_heatmaps(hourly_counts,
+                                                       door_ids)}
+        response = HttpResponse(simplejson.dumps(response_data),
+                                content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+
 def get_allowed_rfids(request, doorid):
     """
     Returns list of allowed rfid's for the specified door in JSON format
     (update: no, spaces for now)
+
+    The response carries an ETag (and X-Allowlist-Version header) identifying
+    the door's allowlist_version; a request whose If-None-Match matches it
+    gets an empty 304 Not Modified instead of the list.
+
+    With ?format=binary, or "Accept: application/octet-stream", the list is
+    sent in the packed binary format described in allowlists.py instead.
     """
     try:
-        door = Door.objects.get(pk=doorid)
-        allowed_rfids = door.get_allowed_rfids()  # list of Keycard objects
-        alloweds = [keycard_obj.the_rfid for keycard_obj in allowed_rfids]
-    except:  # door may not exist or any other error . . .
-        alloweds = ""   # but still need to respond
+        version = allowlists.get_allowlist_version(doorid)
+    except:  # any error . . .
+        version = None
+    if version is None:
+        # door may not exist, but still need to respond
+        return HttpResponse('\0')
 
     #to_json = {"doorid": int(doorid), "allowed_rfids": alloweds}
     #return HttpResponse(simplejson.dumps(to_json), content_type='application/json')
-    # We don't feel like making the arduino parse JSON, so let's just send a list
-    # of numbers separated by spaces.
-    return HttpResponse(' '.join(alloweds) + '\0')
+    if (request.GET.get('format') == 'binary' or 'application/octet-stream'
+            in request.META.get('HTTP_ACCEPT', '')):
+        # (the format version in the name, so that lists rendered in an
+        # older one aren't served from the cache or matched by ETag)
+        format_name = 'binary%d' % allowlists.BINARY_FORMAT_VERSION
+        render = allowlists.render_binary(version)
+        content_type = 'application/octet-stream'
+    else:
+        format_name = 'text'
+        render = allowlists.render_text
+        content_type = None  # the default
+    etag = allowlists.make_etag(doorid, version, format_name)
+    if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(allowlists.get_rendered(
+            doorid, version, format_name, render), content_type=content_type)
+    response['ETag'] = etag
+    response['Vary'] = 'Accept'
+    response['X-Allowlist-Version'] = version
+    return response
+
+
+def get_allowed_rfid_changes(request, doorid):
+    """
+    Returns the rfid's added to and revoked from the specified door's
+    allowlist since the allowlist_version given as ?since=, e.g.
+    "delta 17 +1122135122 -9999999992" -- or, when there is no since or the
+    journal of changes doesn't go back that far, the whole list, e.g.
+    "full 17 1122135122 1122135199". 17 is the door's current
+    allowlist_version, to send as since next time. Null-terminated, like
+    get_allowed_rfids.
+    """
+    try:
+        version = allowlists.get_allowlist_version(doorid)
+    except:  # any error . . .
+        version = None
+    if version is None:
+        # door may not exist, but still need to respond
+        return HttpResponse('\0')
+
+    try:
+        since = int(request.GET['since'])
+    except (KeyError, ValueError):
+        since = None
+    return allowlist_changes_response(doorid, since, version)
+
+
+def wait_allowed_rfid_changes(request, doorid):
+    """
+    Long-poll version of get_allowed_rfid_changes: waits until the specified
+    door's allowlist_version is no longer ?since=, for at most ?timeout=
+    seconds (and never more than ALLOWLIST_WAIT_TIMEOUT), then responds as
+    get_allowed_rfid_changes does. On timeout that is "delta <since>" with no
+    changes, and the lock simply asks again.
+    """
+    try:
+        version = allowlists.get_allowlist_version(doorid)
+    except:  # any error . . .
+        version = None
+    if version is None:
+        # door may not exist, but still need to respond
+        return HttpResponse('\0')
+
+    max_timeout = getattr(settings, 'ALLOWLIST_WAIT_TIMEOUT', 50)
+    try:
+        timeout = min(max(finite_float(request.GET['timeout']), 0),
+                      max_timeout)
+    except (KeyError, ValueError):
+        timeout = max_timeout
+    try:
+        since = int(request.GET['since'])
+    except (KeyError, ValueError):
+        since = None
+    if since == version:
+        version = allowlists.wait_for_change(doorid, version, timeout)
+        if version is None:
+            # door deleted while waiting
+            return HttpResponse('\0')
+    return allowlist_changes_response(doorid, since, version)
+
+
+def allowlist_changes_response(doorid, since, version):
+    """
+    Response with the changes to the door's allowlist from version since
+    (None for the whole list) to version, for get_allowed_rfid_changes and
+    wait_allowed_rfid_changes.
+    """
+    changes = None
+    if since is not None:
+        changes = allowlists.get_changes_since(doorid, since, version)
+    if changes is None:
+        body = allowlists.get_rendered(doorid, version, 'full',
+            lambda rfids: allowlists.render_full(version, rfids))
+    else:
+        added, revoked = changes
+        body = allowlists.render_changes(version, added, revoked)
+    response = HttpResponse(body)
+    response['X-Allowlist-Version'] = version
+    return response
+
+
+def get_allowed_bloom(request, doorid):
+    """
+    Returns a Bloom filter of the rfid's allowed through the specified door
+    (format and hash scheme in bloom.py), for locks that can't hold the whole
+    list. ?fp= sets the false-positive rate (default RFID_BLOOM_FP_RATE).
+    Conditional GETs work as for get_allowed_rfids.
+    """
+    try:
+        version = allowlists.get_allowlist_version(doorid)
+    except:  # any error . . .
+        version = None
+    if version is None:
+        # door may not exist, but still need to respond
+        return HttpResponse('\0')
+
+    fp_rate = getattr(settings, 'RFID_BLOOM_FP_RATE', 0.01)
+    try:
+        fp_rate = finite_float(request.GET['fp'])
+    except (KeyError, ValueError):
+        pass
+    fp_rate = bloom.round_fp_rate(fp_rate)
+    format_name = 'bloom-%g' % fp_rate
+    etag = allowlists.make_etag(doorid, version, format_name)
+    if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(
+            allowlists.get_rendered(doorid, version, format_name,
+                                    bloom.render_bloom(version, fp_rate)),
+            content_type='application/octet-stream')
+    response['ETag'] = etag
+    response['X-Allowlist-Version'] = version
+    return response
 
 
 def check(request, doorid, rfid):
@@ -64,81 +280,41 @@ def check(request, doorid, rfid):
     In addition to checking whether the given rfid is valid for the given door,
     this checks whether we're actually trying to assign a new keycard rather
     than authenticating. If not doing a new keycard scan, create and save an
-    AccessTime.
-    """
-    response = 0
-
-    # Is the request actually for new keycard assignment?
-    new_scan_queryset = NewKeycardScan.objects.all()
-    if new_scan_queryset:
-        # Note - getting latest NewKeycardScan object by ordering by the field
-        # time_initiated may not actually return the latest created object if
-        # 'start scan' was hit many times in a row -- even microseconds don't
-        # seem to have sufficient resolution to actually get the latest object.
-
-        # get the latest NewKeycardScan object
-        new_scan = new_scan_queryset.latest("pk")
-
-        # Issue #e
-        if new_scan.waiting_for_scan:
-            # record the door the new scan request came from
-            new_scan.doorid = doorid
-            new_scan.rfid = rfid
-            new_scan.save()
-            return HttpResponse(response)
-
-    # Or is the request actually for authenticating an existing keycard for
-    # this door?  Note -- RFIDkeycard.objects.get(the_rfid=rfid) fails if there
-    # is more than one item returned. Only one item would be active.
-    # Issue #i
-    rfidkeycards_with_same_rfid = RFIDkeycard.objects.filter(the_rfid=rfid)
-    if not rfidkeycards_with_same_rfid:
-        # no such keycard, so return response of 0
-        return HttpResponse(0)
-    else:
-        for rfidkeycard in rfidkeycards_with_same_rfid:
-            # Keycard exists, so moving on to check if it's active and get
-            # allowed doors (the latter is called on lockuser, so need to check
-            # if keycard is active first).
-            if rfidkeycard.is_active():
-                for door in rfidkeycard.get_allowed_doors():
-                    if door.id == int(doorid):
-                        # So response will be 1 -- authenticated.
-                        response = 1
-                        
-                        ######################################################
-                        # create the AccessTime for this visit
-                        ######################################################
-                        lockuser = rfidkeycard.lockuser
-                        at = AccessTime(
-                            the_rfid=rfid,
-                            door=door,
-                            lockuser=lockuser,
-                            access_time=datetime.datetime.now()
-                        )
-                        # Now create and assign data point dict to JSONify for
-                        # the access times highchart
-                        x_coord = 'Date.UTC(%d,%d,%d)' % (
-                            at.access_time.year, at.access_time.month-1,
-                            at.access_time.day)
-                        y_coord = 'Date.UTC(0,0,0, %d,%d,%d)' % (
-                            at.access_time.hour, at.access_time.minute,
-                            at.access_time.second)
-                        user_name = '"%s %s"' % (
-                            at.lockuser.first_name, at.lockuser.last_name)
-                        data_point_dict = {
-                            'x': x_coord, 'y': y_coord, 'user': user_name}
-                        at.data_point = simplejson.dumps(data_point_dict)
-                        at.save()
-
-    return HttpResponse(response)
+    AccessTime. (See swipes.check_swipe.)
+    """
+    return HttpResponse(swipes.check_swipe(doorid, rfid))
+
+
+@csrf_exempt
+@require_POST
+def check_batch(request):
+    """
+    check for many swipes at once, for a gateway in front of several locks.
+    The request body is a JSON list of [doorid, rfid, timestamp] swipes, in
+    the order they happened; timestamp is in seconds since the epoch, or null
+    for now. The response is the JSON list of decisions (1 or 0), one per
+    swipe, made just as check makes them. (See swipes.check_swipes.)
+    """
+    try:
+        swipe_list = []
+        for doorid, rfid, timestamp in simplejson.loads(request.body):
+            if timestamp is not None:
+                timestamp = datetime.datetime.fromtimestamp(float(timestamp))
+            swipe_list.append((doorid, rfid, timestamp))
+    except (TypeError, ValueError):
+        return HttpResponseBadRequest(
+            'Expected a JSON list of [doorid, rfid, timestamp] lists')
+    return HttpResponse(simplejson.dumps(swipes.check_swipes(swipe_list)),
+                        content_type="application/json")
 
 
 @login_required
 # Issue #k
 def initiate_new_keycard_scan(request, lockuser_object_id):
     """
-    Try start waiting for new keycard scan; return success/fail message.
+    Try start waiting for new keycard scan at the door given as ?door=;
+    return success/fail message. Only a swipe at that door will be taken as
+    the new keycard, so scans at different doors can go on at the same time.
     """
     # If this lockuser already has a current keycard, don't proceed
     # (This should have been prevented at template level also)
@@ -151,10 +327,20 @@ def initiate_new_keycard_scan(request, lockuser_object_id):
 
     if lu.get_current_rfid():
         return do_json_resp(False, "This lock user is already assigned a keycard.")
+
+    try:
+        door = Door.objects.get(pk=int(request.GET['door']))
+    except (KeyError, ValueError, Door.DoesNotExist):
+        return do_json_resp(False, "Choose the door the keycard will be scanned at.")
     else:
+        # Clear out old scans while we're at it (see also the
+        # sweep_new_keycard_scans command), so the table stays small.
+        NewKeycardScan.objects.sweep()
         n = NewKeycardScan()
         n.waiting_for_scan = True
         n.assigner_user = request.user
+        n.door = door
+        n.lockuser = lu
         n.save()
         response_data = {'success': True, 'new_scan_pk': n.pk}
         # not do_json_resp, since response_data is different:
@@ -180,7 +366,43 @@ def finished_new_keycard_scan(request, new_scan_pk):
     if not new_scan_qs:
         return do_json_resp(False,
                             "No NewKeycardScan obj with pk {}.".format(new_scan_pk))
-    new_scan = new_scan_qs[0]
+    return finish_new_keycard_scan(request, new_scan_qs[0])
+
+
+@login_required
+def wait_new_keycard_scan(request, new_scan_pk):
+    """
+    Long-poll version of finished_new_keycard_scan, for the change form to
+    call right after start_scan instead of having the staff user hit "Done":
+    waits until a keycard has been swiped at the NewKeycardScan's door (check
+    recorded its RFID), for at most ?timeout= seconds (and never more than
+    NEW_KEYCARD_SCAN_WAIT_TIMEOUT), then responds as finished_new_keycard_scan
+    does. If the scan is still waiting by then, responds
+    {"success": false, "waiting": true}, and the form simply asks again.
+    """
+    max_timeout = getattr(settings, 'NEW_KEYCARD_SCAN_WAIT_TIMEOUT', 50)
+    try:
+        timeout = min(max(finite_float(request.GET['timeout']), 0),
+                      max_timeout)
+    except (KeyError, ValueError):
+        timeout = max_timeout
+    new_scan = scan_state.wait_for_rfid(new_scan_pk, timeout)
+    if new_scan is None:
+        return do_json_resp(False,
+                            "No NewKeycardScan obj with pk {}.".format(new_scan_pk))
+    if (not new_scan.rfid and new_scan.waiting_for_scan and
+            not new_scan.timed_out()):
+        response_data = {'success': False, 'waiting': True}
+        return HttpResponse(simplejson.dumps(response_data),
+                            content_type="application/json")
+    return finish_new_keycard_scan(request, new_scan)
+
+
+def finish_new_keycard_scan(request, new_scan):
+    """
+    The checks and the response for finished_new_keycard_scan and
+    wait_new_keycard_scan, given the NewKeycardScan.
+    """
     min_till_timeout = 2.0
     timed_out = new_scan.timed_out(min_till_timeout)
     if timed_out: